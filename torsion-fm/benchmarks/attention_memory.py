@@ -0,0 +1,154 @@
+"""
+骨干网络注意力实现的峰值内存与耗时对比
+
+每个(注意力实现, 长度, 批次大小)组合在独立的子进程中运行一次骨干网络前向，
+以ru_maxrss相对前向之前常驻内存的增量作为前向的峰值内存，同时记录耗时，
+并与dense实现的嵌入比较最大绝对误差。
+默认使用随机初始化的替身骨干网络（位置编码表按最大长度扩展，RNA-FM本身最长支持1022nt），
+也可以用--backbone_path指定导出的骨干网络权重。
+
+用法:
+    python benchmarks/attention_memory.py
+    python benchmarks/attention_memory.py --lengths 1024 2048 4096 --batch_sizes 2 --layers 2 --output attention.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED = 0
+
+
+def current_rss_mb():
+    """当前常驻内存（MB）"""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 ** 2)
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB），Linux上ru_maxrss的单位是KB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _worker(implementation, length, batch_size, layers, chunk_size, backbone_path, dump_path):
+    """子进程：构建骨干网络，运行一次前向并输出JSON结果"""
+    sys.path.insert(0, PROJECT_ROOT)
+    import numpy as np
+    import torch
+    from models.attention import set_attention_implementation
+    from models.backbones import StandInAlphabet, StandInRNAFM, load_backbone
+    from utils.safetensors_io import read_safetensors_metadata
+
+    torch.set_num_threads(1)
+    torch.manual_seed(SEED)
+    if backbone_path:
+        name = read_safetensors_metadata(backbone_path).get('backbone', "rna_fm_t12")
+        model, alphabet = load_backbone(name, backbone_path)
+    else:
+        alphabet = StandInAlphabet()
+        model = StandInRNAFM(alphabet, num_layers=layers, max_positions=length + 2)
+    model.eval()
+    num_layers = len(model.layers)
+    set_attention_implementation(model, implementation, chunk_size)
+
+    rng = np.random.default_rng(SEED)
+    batch = [("RNA", "".join(rng.choice(list("ACGU"), size=length))) for _ in range(batch_size)]
+    _, _, tokens = alphabet.get_batch_converter()(batch)
+
+    with torch.no_grad():
+        model(tokens[:, :16], repr_layers=[num_layers])
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        representations = model(tokens, repr_layers=[num_layers])["representations"][num_layers]
+        elapsed = time.perf_counter() - start
+
+    np.save(dump_path, representations.numpy())
+    print(json.dumps({
+        'time_s': elapsed,
+        'forward_peak_mb': max(0.0, peak_rss_mb() - rss_before),
+        'peak_rss_mb': peak_rss_mb(),
+    }))
+
+
+def run_attention_report(implementations=("dense", "sdpa", "chunked"), lengths=(512, 1024, 2048),
+                         batch_sizes=(2,), layers=2, chunk_size=256, backbone_path=None):
+    """
+    生成注意力实现对比报告
+
+    Returns:
+        results: 与run_benchmarks.py相同形式的结果列表（name为attention_memory）
+    """
+    import numpy as np
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="attention_memory_") as tmp_dir:
+        for length in lengths:
+            for batch_size in batch_sizes:
+                reference = None
+                for implementation in implementations:
+                    params = {'implementation': implementation, 'length': length, 'batch_size': batch_size}
+                    dump_path = os.path.join(tmp_dir, f"{implementation}.npy")
+                    command = [sys.executable, os.path.abspath(__file__), "--worker", implementation,
+                               "--lengths", str(length), "--batch_sizes", str(batch_size), "--layers", str(layers),
+                               "--chunk_size", str(chunk_size), "--dump", dump_path]
+                    if backbone_path:
+                        command += ["--backbone_path", backbone_path]
+                    completed = subprocess.run(command, cwd=PROJECT_ROOT, capture_output=True, text=True)
+                    if completed.returncode != 0:
+                        error = completed.stderr.strip().splitlines()[-1]
+                        results.append({'name': 'attention_memory', 'params': params, 'skipped': error})
+                        print(f"{'attention_memory':20s} {implementation:8s} L={length:<5d} B={batch_size:<3d} 失败: {error}")
+                        continue
+
+                    stats = json.loads(completed.stdout.strip().splitlines()[-1])
+                    output = np.load(dump_path)
+                    if reference is None:
+                        reference = output
+                    stats['max_abs_diff'] = float(np.abs(output - reference).max())
+                    results.append({'name': 'attention_memory', 'params': params, **stats})
+                    print(f"{'attention_memory':20s} {implementation:8s} L={length:<5d} B={batch_size:<3d} "
+                          f"前向峰值 {stats['forward_peak_mb']:9.1f}MB  耗时 {stats['time_s'] * 1e3:9.1f}ms  "
+                          f"最大误差 {stats['max_abs_diff']:.2e}")
+    return results
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="骨干网络注意力实现的峰值内存与耗时对比")
+    parser.add_argument("--implementations", type=str, nargs="+", default=["dense", "sdpa", "chunked"],
+                        help="要比较的注意力实现（第一个作为误差基准）")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[512, 1024, 2048], help="序列长度")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[2], help="批次大小")
+    parser.add_argument("--layers", type=int, default=2, help="替身骨干网络的层数")
+    parser.add_argument("--chunk_size", type=int, default=256, help="chunked实现的查询分块大小")
+    parser.add_argument("--backbone_path", type=str, default=None,
+                        help="convert导出的.safetensors骨干网络权重（默认使用替身）")
+    parser.add_argument("--output", type=str, default=None, help="结果JSON文件")
+    parser.add_argument("--worker", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--dump", type=str, default=None, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args.worker, args.lengths[0], args.batch_sizes[0], args.layers, args.chunk_size,
+                args.backbone_path, args.dump)
+        return
+
+    results = run_attention_report(args.implementations, args.lengths, args.batch_sizes, args.layers,
+                                   args.chunk_size, args.backbone_path)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version, 'results': results}, f, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+
+if __name__ == "__main__":
+    main()
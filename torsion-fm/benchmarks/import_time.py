@@ -0,0 +1,166 @@
+"""
+导入耗时报告
+
+在子进程中用python -X importtime导入各入口模块，汇总总耗时、自身耗时最多的模块，
+以及是否加载了torch/pandas/tensorboard/matplotlib/fm等重量级依赖；
+同时测量常用CLI调用（如main.py --help）的墙钟启动时间。
+
+用法:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --targets main scripts.predict --output import_time.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 入口模块
+IMPORT_TARGETS = ("main", "scripts.predict", "scripts.train", "models", "data.dataset", "utils.evaluation")
+
+# 启动路径上需要关注的重量级依赖
+HEAVY_MODULES = ("torch", "pandas", "matplotlib", "tensorboard", "torch.utils.tensorboard", "fm", "scipy")
+
+# 常用CLI调用（相对项目根目录）
+CLI_COMMANDS = {
+    'main --help': ["main.py", "--help"],
+    'main predict --help': ["main.py", "predict", "--help"],
+}
+
+
+def parse_importtime(stderr):
+    """
+    解析-X importtime输出
+
+    Returns:
+        entries: 列表，元素为(模块名, 嵌套深度, 自身耗时秒, 累计耗时秒)
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), depth, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return entries
+
+
+def _run_importtime(code):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=PROJECT_ROOT,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+    return parse_importtime(result.stderr)
+
+
+def import_profile(module, repeat=3, top=10):
+    """
+    测量导入一个模块的耗时（不含解释器启动时已经加载的模块）
+
+    Args:
+        module: 模块名
+        repeat: 重复次数（取中位数）
+        top: 报告自身耗时最多的模块数
+
+    Returns:
+        profile: 字典，包含median_s/min_s、heavy_modules（实际加载的重量级依赖）和top_self（[模块名, 秒]）
+    """
+    startup = {name for name, _, _, _ in _run_importtime("pass")}
+    totals = []
+    entries = []
+    for _ in range(repeat):
+        entries = [e for e in _run_importtime(f"import {module}") if e[0] not in startup]
+        totals.append(sum(cumulative for _, depth, _, cumulative in entries if depth == 0))
+
+    loaded = {name for name, _, _, _ in entries}
+    by_self = sorted(entries, key=lambda e: e[2], reverse=True)[:top]
+    return {
+        'median_s': statistics.median(totals),
+        'min_s': min(totals),
+        'repeat': repeat,
+        'heavy_modules': [name for name in HEAVY_MODULES if name in loaded],
+        'top_self': [[name, self_s] for name, _, self_s, _ in by_self],
+    }
+
+
+def command_wall_time(args, repeat=3):
+    """
+    测量CLI调用的墙钟时间（包括解释器启动）
+
+    Returns:
+        stats: 字典，包含median_s/min_s和repeat
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=PROJECT_ROOT, capture_output=True)
+        samples.append(time.perf_counter() - start)
+    return {'median_s': statistics.median(samples), 'min_s': min(samples), 'repeat': repeat}
+
+
+def run_import_report(targets=IMPORT_TARGETS, commands=tuple(CLI_COMMANDS), repeat=3, top=10):
+    """
+    生成导入耗时报告
+
+    Returns:
+        results: 与run_benchmarks.py相同形式的结果列表（name为import_time或cli_startup），
+                 可以直接参与基线比较
+    """
+    results = []
+    for module in targets:
+        params = {'target': module}
+        try:
+            profile = import_profile(module, repeat, top)
+        except ImportError as e:
+            results.append({'name': 'import_time', 'params': params, 'skipped': str(e)})
+            print(f"{'import_time':20s} {module:24s} 跳过: {e}")
+            continue
+        results.append({'name': 'import_time', 'params': params, **profile})
+        heavy = ", ".join(profile['heavy_modules']) or "-"
+        print(f"{'import_time':20s} {module:24s} {profile['median_s'] * 1e3:9.1f}ms  重量级依赖: {heavy}")
+
+    for command in commands:
+        stats = command_wall_time(CLI_COMMANDS[command], repeat)
+        results.append({'name': 'cli_startup', 'params': {'command': command}, **stats})
+        print(f"{'cli_startup':20s} {command:24s} {stats['median_s'] * 1e3:9.1f}ms")
+    return results
+
+
+def print_top(results):
+    """打印每个入口自身耗时最多的模块"""
+    for result in results:
+        if 'top_self' not in result:
+            continue
+        print(f"\n{result['params']['target']} 自身耗时最多的模块:")
+        for name, self_s in result['top_self']:
+            print(f"  {self_s * 1e3:8.1f}ms  {name}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="入口模块导入耗时与CLI启动时间报告")
+    parser.add_argument("--targets", type=str, nargs="+", default=list(IMPORT_TARGETS), help="要导入的模块")
+    parser.add_argument("--commands", type=str, nargs="*", default=list(CLI_COMMANDS),
+                        choices=list(CLI_COMMANDS), help="要计时的CLI调用")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数")
+    parser.add_argument("--top", type=int, default=10, help="报告自身耗时最多的模块数")
+    parser.add_argument("--output", type=str, default=None, help="结果JSON文件")
+
+    args = parser.parse_args()
+
+    results = run_import_report(args.targets, args.commands, args.repeat, args.top)
+    print_top(results)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version, 'results': results}, f, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+
+if __name__ == "__main__":
+    main()
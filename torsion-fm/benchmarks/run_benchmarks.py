@@ -0,0 +1,457 @@
+"""
+流水线热点路径的基准测试
+
+覆盖二面角/扭转角计算、Training_Dict_single适配、数据集__getitem__与collate_fn、
+TotalAngularLoss、evaluate_model、回归头前向、使用小型替身骨干网络的端到端预测、
+asyncio预测器的并发请求合并以及预测结果写出。
+全部使用固定随机种子生成的合成数据，只依赖CPU，不需要网络和预训练权重。
+
+用法:
+    python benchmarks/run_benchmarks.py --lengths 32 128 512 --batch_sizes 1 8 --output bench.json
+    python benchmarks/run_benchmarks.py --baseline bench_baseline.json --threshold 0.15
+    python benchmarks/run_benchmarks.py --import_time   # 附加入口模块导入耗时和CLI启动时间（见import_time.py）
+    python benchmarks/run_benchmarks.py --attention_memory   # 附加骨干网络注意力实现的峰值内存对比（见attention_memory.py）
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import platform
+import argparse
+import logging
+import statistics
+import contextlib
+from datetime import datetime
+
+import numpy as np
+import torch
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import Config
+from data.preprocessing import calculate_dihedral, compute_torsion_angles
+from data.adapters import adapt_training_dict_single
+from data.dataset import RNATorsionDataset, collate_fn
+from data.synthetic import generate_structure, NUCLEOTIDES
+from models.loss import TotalAngularLoss
+from models.backbones import StandInAlphabet, stand_in_rna_fm
+
+logger = logging.getLogger(__name__)
+
+SEED = 0
+
+
+# ---------------------------------------------------------------------------
+# 合成输入
+# ---------------------------------------------------------------------------
+
+def synthetic_rna_dic(length, rng):
+    """生成一条A型合成链的rna_dic"""
+    structure, _ = generate_structure("SYN", length, rng)
+    return structure['rna_dic']
+
+
+def synthetic_training_dict(num_structures, length, rng):
+    """生成Training_Dict_single格式的字典"""
+    return {
+        str(i): generate_structure(f"SYN{i:05d}", length, rng)[0]
+        for i in range(num_structures)
+    }
+
+
+def build_stand_in_predictor(torsion_types):
+    """用随机初始化的替身骨干网络构建RNATorsionPredictor"""
+    from models.torsion_predictor import RNATorsionPredictor
+    torch.manual_seed(SEED)
+    rna_fm_model, alphabet = stand_in_rna_fm(seed=SEED)
+    model = RNATorsionPredictor(rna_fm_model, alphabet, torsion_types=torsion_types)
+    return model.eval(), alphabet
+
+
+class _ListDataset(RNATorsionDataset):
+    """直接使用内存中的结构列表的数据集（跳过目录扫描）"""
+
+    def __init__(self, structures, alphabet, torsion_types):
+        self.alphabet = alphabet
+        self.torsion_types = torsion_types
+        self.batch_converter = alphabet.get_batch_converter()
+        self.data = structures
+
+
+# ---------------------------------------------------------------------------
+# 基准用例：每个用例接收(length, batch_size, rng)，返回一个无参数的可调用对象
+# ---------------------------------------------------------------------------
+
+def bench_calculate_dihedral(length, batch_size, rng):
+    points = rng.normal(size=(length, 4, 3))
+    def run():
+        for p in points:
+            calculate_dihedral(p[0], p[1], p[2], p[3])
+    return run
+
+
+def bench_compute_torsion_angles(length, batch_size, rng):
+    rna_dic = synthetic_rna_dic(length, rng)
+    residue_ids = sorted(rna_dic)
+    atom_coords = {res_id: rna_dic[res_id]['atom_coords'] for res_id in residue_ids}
+    return lambda: compute_torsion_angles(atom_coords, residue_ids)
+
+
+def bench_adapt_training_dict_single(length, batch_size, rng):
+    data = synthetic_training_dict(batch_size, length, rng)
+    return lambda: adapt_training_dict_single(data)
+
+
+def _structures(length, batch_size, rng):
+    return adapt_training_dict_single(synthetic_training_dict(batch_size, length, rng))
+
+
+def bench_dataset_getitem(length, batch_size, rng):
+    dataset = _ListDataset(_structures(length, batch_size, rng), StandInAlphabet(), Config.TORSION_TYPES)
+    def run():
+        for i in range(len(dataset)):
+            dataset[i]
+    return run
+
+
+def bench_collate_fn(length, batch_size, rng):
+    dataset = _ListDataset(_structures(length, batch_size, rng), StandInAlphabet(), Config.TORSION_TYPES)
+    items = [dataset[i] for i in range(len(dataset))]
+    return lambda: collate_fn(items)
+
+
+def _random_targets(length, batch_size, torsion_types):
+    preds = {angle: torch.randn(batch_size, length, 2) for angle in torsion_types}
+    targets = {angle: torch.rand(batch_size, length) * 360 - 180 for angle in torsion_types}
+    masks = {angle: (torch.rand(batch_size, length) > 0.1).float() for angle in torsion_types}
+    return preds, targets, masks
+
+
+def bench_total_angular_loss(length, batch_size, rng):
+    torsion_types = Config.TORSION_TYPES
+    criterion = TotalAngularLoss(torsion_types)
+    preds, targets, masks = _random_targets(length, batch_size, torsion_types)
+    return lambda: criterion(preds, targets, masks)
+
+
+def bench_head_forward(length, batch_size, rng):
+    model, _ = build_stand_in_predictor(Config.TORSION_TYPES)
+    embeddings = torch.randn(batch_size, length, model.embed_dim)
+    def run():
+        with torch.no_grad():
+            model.predict_from_embeddings(embeddings)
+    return run
+
+
+def bench_evaluate_model(length, batch_size, rng):
+    from torch.utils.data import DataLoader
+    from utils.evaluation import evaluate_model
+    model, alphabet = build_stand_in_predictor(Config.TORSION_TYPES)
+    dataset = _ListDataset(_structures(length, batch_size, rng), alphabet, Config.TORSION_TYPES)
+    loader = DataLoader(dataset, batch_size=batch_size, collate_fn=collate_fn)
+    def run():
+        # evaluate_model会打印指标，计时时丢弃输出
+        with contextlib.redirect_stdout(io.StringIO()):
+            evaluate_model(model, loader, torch.device("cpu"), Config.TORSION_TYPES)
+    return run
+
+
+def bench_predict_end_to_end(length, batch_size, rng):
+    model, alphabet = build_stand_in_predictor(Config.TORSION_TYPES)
+    batch_converter = alphabet.get_batch_converter()
+    sequences = [("RNA", "".join(rng.choice(list(NUCLEOTIDES), size=length))) for _ in range(batch_size)]
+    def run():
+        _, _, tokens = batch_converter(sequences)
+        with torch.no_grad():
+            predictions, _ = model(tokens)
+        {angle: values.numpy() for angle, values in predictions.items()}
+    return run
+
+
+def bench_backbone_dedup(length, batch_size, rng):
+    model, alphabet = build_stand_in_predictor(Config.TORSION_TYPES)
+    batch_converter = alphabet.get_batch_converter()
+    # 每条序列出现两次（模拟多模型条目和对称组装体中的重复链）
+    unique = ["".join(rng.choice(list(NUCLEOTIDES), size=length)) for _ in range((batch_size + 1) // 2)]
+    _, _, tokens = batch_converter([("RNA", unique[i // 2]) for i in range(batch_size)])
+    def run():
+        with torch.no_grad():
+            model.embed(tokens)
+    return run
+
+
+def bench_backbone_packing(length, batch_size, rng):
+    model, alphabet = build_stand_in_predictor(Config.TORSION_TYPES)
+    model.pack_backbone = True
+    batch_converter = alphabet.get_batch_converter()
+    # 长度在[length/4, length]之间均匀分布的混合批次
+    lengths = rng.integers(max(1, length // 4), length + 1, size=batch_size)
+    _, _, tokens = batch_converter([("RNA", "".join(rng.choice(list(NUCLEOTIDES), size=n))) for n in lengths])
+    def run():
+        with torch.no_grad():
+            model.embed(tokens)
+    return run
+
+
+def bench_async_predictor(length, batch_size, rng):
+    import asyncio
+    from scripts.serve import AsyncTorsionPredictor
+    model, alphabet = build_stand_in_predictor(Config.TORSION_TYPES)
+    # batch_size个协程并发请求，长度在[length/2, length]之间
+    lengths = rng.integers(max(1, length // 2), length + 1, size=batch_size)
+    sequences = ["".join(rng.choice(list(NUCLEOTIDES), size=n)) for n in lengths]
+    async def requests():
+        async with AsyncTorsionPredictor(model, alphabet, torch.device("cpu"), max_wait_ms=1) as predictor:
+            await asyncio.gather(*[predictor.predict(sequence) for sequence in sequences])
+    def run():
+        asyncio.run(requests())
+    return run
+
+
+def bench_prediction_output(length, batch_size, rng):
+    import tempfile
+    from utils.prediction_writers import prediction_columns, open_writer
+    structures = _structures(length, batch_size, rng)
+    arrays = [{angle: rng.uniform(-180, 180, len(s['sequence'])).astype(np.float32) for angle in Config.TORSION_TYPES}
+              for s in structures]
+    output_dir = tempfile.mkdtemp(prefix="bench_output_")
+    def run():
+        # 与predict的默认输出一致：每个结构一个CSV和一个JSON
+        for i, (structure, values) in enumerate(zip(structures, arrays)):
+            columns = prediction_columns(structure, values, Config.TORSION_TYPES)
+            for fmt in ("csv", "json"):
+                with open_writer(fmt, os.path.join(output_dir, f"{i}.{fmt}")) as writer:
+                    writer.write(structure['pdb_id'], structure['sequence'], columns)
+    return run
+
+
+BENCHMARKS = {
+    'calculate_dihedral': bench_calculate_dihedral,
+    'compute_torsion_angles': bench_compute_torsion_angles,
+    'adapt_training_dict_single': bench_adapt_training_dict_single,
+    'dataset_getitem': bench_dataset_getitem,
+    'collate_fn': bench_collate_fn,
+    'total_angular_loss': bench_total_angular_loss,
+    'head_forward': bench_head_forward,
+    'evaluate_model': bench_evaluate_model,
+    'predict_end_to_end': bench_predict_end_to_end,
+    'backbone_dedup': bench_backbone_dedup,
+    'backbone_packing': bench_backbone_packing,
+    'prediction_output': bench_prediction_output,
+    'async_predictor': bench_async_predictor,
+}
+
+# 与批次大小无关的用例只按长度参数化
+LENGTH_ONLY = {'calculate_dihedral', 'compute_torsion_angles'}
+
+
+# ---------------------------------------------------------------------------
+# 计时、比较与报告
+# ---------------------------------------------------------------------------
+
+def measure(fn, repeat=5, warmup=1, min_time=0.05):
+    """
+    对fn计时：先预热，再自动确定每轮调用次数（使每轮不少于min_time秒），重复repeat轮
+
+    Returns:
+        stats: 字典，包含每次调用的median/mean/min/stdev（秒）以及repeat和number
+    """
+    for _ in range(warmup):
+        fn()
+
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 16:
+            break
+        number *= 2
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+
+    return {
+        'median_s': statistics.median(samples),
+        'mean_s': statistics.fmean(samples),
+        'min_s': min(samples),
+        'stdev_s': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+def run_benchmarks(names, lengths, batch_sizes, repeat=5, min_time=0.05):
+    """
+    运行选中的基准用例
+
+    Returns:
+        results: 结果字典列表，元素包含name、params以及measure()的统计量；
+                 因缺少依赖而无法运行的用例记录skipped原因
+    """
+    results = []
+    for name in names:
+        sizes = [1] if name in LENGTH_ONLY else batch_sizes
+        for length in lengths:
+            for batch_size in sizes:
+                params = {'length': length} if name in LENGTH_ONLY else {'length': length, 'batch_size': batch_size}
+                rng = np.random.default_rng(SEED)
+                torch.manual_seed(SEED)
+                try:
+                    fn = BENCHMARKS[name](length, batch_size, rng)
+                except ImportError as e:
+                    results.append({'name': name, 'params': params, 'skipped': str(e)})
+                    print(f"{name:28s} {_format_params(params):24s} 跳过: {e}")
+                    continue
+                stats = measure(fn, repeat=repeat, min_time=min_time)
+                results.append({'name': name, 'params': params, **stats})
+                print(f"{name:28s} {_format_params(params):24s} {_format_time(stats['median_s']):>10s} "
+                      f"(±{_format_time(stats['stdev_s'])}, {stats['number']}x{stats['repeat']})")
+    return results
+
+
+def environment_metadata(threads):
+    """记录影响结果可比性的环境信息"""
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': threads,
+    }
+
+
+def _key(result):
+    return result['name'], tuple(sorted(result['params'].items()))
+
+
+def _format_params(params):
+    return ", ".join(f"{k}={v}" for k, v in params.items())
+
+
+def _format_time(seconds):
+    if seconds >= 1:
+        return f"{seconds:.3f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f}ms"
+    return f"{seconds * 1e6:.1f}us"
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """
+    与基线比较中位数耗时
+
+    Args:
+        results: 本次结果列表
+        baseline: 基线JSON（run_benchmarks输出的整个文档）
+        threshold: 允许的相对变慢比例，例如0.1表示慢10%以内不算回归
+
+    Returns:
+        comparisons: 列表，元素包含name、params、baseline_s、current_s、ratio和status
+                     （regression/improvement/ok/new）
+    """
+    baseline_map = {_key(r): r for r in baseline.get('results', []) if 'median_s' in r}
+    comparisons = []
+    for result in results:
+        if 'median_s' not in result:
+            continue
+        reference = baseline_map.get(_key(result))
+        if reference is None:
+            comparisons.append({'name': result['name'], 'params': result['params'], 'status': 'new'})
+            continue
+        ratio = result['median_s'] / reference['median_s']
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 / (1 + threshold):
+            status = 'improvement'
+        else:
+            status = 'ok'
+        comparisons.append({
+            'name': result['name'],
+            'params': result['params'],
+            'baseline_s': reference['median_s'],
+            'current_s': result['median_s'],
+            'ratio': ratio,
+            'status': status,
+        })
+    return comparisons
+
+
+def print_comparison(comparisons, threshold):
+    print(f"\n与基线比较（阈值 {threshold:.0%}）:")
+    for c in comparisons:
+        if c['status'] == 'new':
+            print(f"  {c['name']:28s} {_format_params(c['params']):24s} 基线中不存在")
+            continue
+        flag = {'regression': '变慢', 'improvement': '变快', 'ok': ''}[c['status']]
+        print(f"  {c['name']:28s} {_format_params(c['params']):24s} "
+              f"{_format_time(c['baseline_s']):>10s} -> {_format_time(c['current_s']):>10s} "
+              f"x{c['ratio']:.2f} {flag}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="流水线热点路径基准测试（仅CPU，离线）")
+    parser.add_argument("--benchmarks", type=str, nargs="+", default=list(BENCHMARKS),
+                        choices=list(BENCHMARKS), help="要运行的用例，默认全部")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[32, 128, 512], help="序列长度")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 8], help="批次大小（结构数）")
+    parser.add_argument("--repeat", type=int, default=5, help="每个用例的重复轮数")
+    parser.add_argument("--min_time", type=float, default=0.05, help="每轮的最短计时时间（秒）")
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op线程数（固定以保证可比性）")
+    parser.add_argument("--output", type=str, default=None, help="结果JSON文件")
+    parser.add_argument("--baseline", type=str, default=None, help="用于比较的基线JSON文件")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定为回归的相对变慢比例")
+    parser.add_argument("--import_time", action="store_true", help="同时报告入口模块的导入耗时和CLI启动时间")
+    parser.add_argument("--attention_memory", action="store_true", help="同时报告各注意力实现的峰值内存和耗时")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    torch.set_num_threads(args.threads)
+
+    results = run_benchmarks(args.benchmarks, args.lengths, args.batch_sizes, args.repeat, args.min_time)
+    if args.import_time:
+        from benchmarks.import_time import run_import_report
+        print()
+        results.extend(run_import_report(repeat=args.repeat))
+    if args.attention_memory:
+        from benchmarks.attention_memory import run_attention_report
+        print()
+        results.extend(run_attention_report(lengths=args.lengths, batch_sizes=args.batch_sizes))
+    document = {'metadata': environment_metadata(args.threads), 'results': results}
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        comparisons = compare_with_baseline(results, baseline, args.threshold)
+        document['comparison'] = {'baseline': args.baseline, 'threshold': args.threshold, 'results': comparisons}
+        print_comparison(comparisons, args.threshold)
+        regressions = [c for c in comparisons if c['status'] == 'regression']
+        if regressions:
+            print(f"\n发现 {len(regressions)} 项性能回归")
+            exit_code = 1
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -17,12 +17,62 @@ class Config:
     TORSION_TYPES = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "chi"]  # 预测的扭转角类型
     HIDDEN_DIM = 256   # 回归头隐藏层维度
     DROPOUT = 0.1      # Dropout比例
+    BACKBONE = "rna_fm_t12"  # 骨干网络（"stand_in"为随机初始化的小型替身，仅用于压力测试）
+    BACKBONE_PATH = None     # 骨干网络权重的本地路径（.safetensors文件以mmap方式加载，多进程共享页缓存）
+    MODEL_FORMAT = "pth"     # 预测头检查点格式（"pth"或"safetensors"）
+    BACKBONE_DEDUP = True    # 批次内重复序列只运行一次骨干网络
+    BACKBONE_PACKING = False # 按长度分组运行骨干网络，减少填充位置的计算
+    BACKBONE_PACK_TOLERANCE = 0.1  # 分组时每组允许的最大填充比例
+    BACKBONE_ATTENTION = "dense"   # 骨干网络注意力实现（"dense"、"sdpa"或"chunked"，后两者不物化完整的注意力矩阵）
+    BACKBONE_ATTENTION_CHUNK = 256 # chunked实现每次处理的查询数
     
     # 训练相关
     BATCH_SIZE = 8
     NUM_EPOCHS = 20
     LEARNING_RATE = 1e-4
     WEIGHT_DECAY = 1e-5
+    EFFECTIVE_BATCH_RESIDUES = 0     # 每个优化步的目标有效残基数，按此累积梯度（0表示每个批次更新一次）
+    
+    # 检查点相关
+    CHECKPOINT_EVERY_STEPS = 500     # 每隔多少个优化步保存一次训练状态（0表示不按步数保存）
+    CHECKPOINT_EVERY_MINUTES = 30    # 每隔多少分钟保存一次训练状态（0表示不按时间保存）
+    KEEP_LAST_CHECKPOINTS = 3        # 保留最近的训练状态数量
+    RESUME = None                    # 恢复训练的检查点文件或实验目录
+    
+    # 遥测相关
+    TELEMETRY = True                 # 是否记录逐步的分阶段耗时和吞吐量（TensorBoard + telemetry.jsonl）
+    TELEMETRY_EVERY_STEPS = 10       # 每隔多少步采样一次（GPU上采样步需要同步，间隔越大开销越小）
+    
+    # 性能分析相关
+    PROFILE = False                  # 是否用torch.profiler采集训练步
+    PROFILE_WAIT = 5                 # 开始采集前跳过的步数
+    PROFILE_WARMUP = 2               # 预热步数
+    PROFILE_ACTIVE = 5               # 记录的步数
+    
+    # 分布式训练相关（CPU多进程数据并行）
+    DISTRIBUTED_BACKEND = "gloo"     # 通信后端
+    NPROC_PER_NODE = 1               # 每台机器的进程数（通常等于socket数或核心组数）
+    NNODES = 1                       # 机器数
+    NODE_RANK = 0                    # 本机编号
+    MASTER_ADDR = "127.0.0.1"        # 主节点地址
+    MASTER_PORT = 29500              # 主节点端口
+    
+    # 预测缓存相关
+    PREDICTION_CACHE_DIR = None          # 磁盘缓存目录（None表示只使用内存缓存）
+    PREDICTION_CACHE_MEMORY_ITEMS = 1024 # 内存LRU中保留的序列数
+    PREDICTION_CACHE_MAX_MB = 1024       # 磁盘缓存的总大小上限（MB）
+    
+    # 批量推理相关
+    INFERENCE_MEMORY_BUDGET_MB = 4096    # CPU上单个批次前向传播的内存预算（MB，GPU上默认取空闲显存的80%）
+    INFERENCE_MAX_BATCH_SIZE = 32        # 批量推理和评估的批次大小上限
+    INFERENCE_PAD_TOLERANCE = 0.1        # 批量推理每个批次允许的最大填充比例（长度差异大的序列分到不同批次）
+    PREDICT_WINDOW = 64                  # 批量预测每次读取并组批的结构数
+    
+    # 预测服务相关
+    SERVE_HOST = "127.0.0.1"             # 本地预测服务的监听地址
+    SERVE_PORT = 8765                    # 本地预测服务的监听端口
+    SERVE_MAX_WAIT_MS = 5                # 合并并发请求时的最长等待时间（毫秒）
+    SERVE_MAX_QUEUE = 1024               # 等待队列的容量，队列满时新请求等待（背压）
     
     # 路径相关
     CHECKPOINT_DIR = "checkpoints"
@@ -34,6 +84,7 @@ class Config:
     # 硬件设置
     DEVICE = "cuda"  # 'cuda' or 'cpu'
     NUM_WORKERS = 4  # 数据加载器工作进程数
+    PREFETCH_DEPTH = 2  # 预取队列深度（提前送到设备上的批次数）
     
     def __init__(self):
         # 确保必要的目录存在
@@ -136,7 +136,7 @@ def adapt_training_dict_single(data):
     适配Training_Dict_single.pkl格式的数据
     
     参数:
-        data: 原始数据字典，键为结构ID，值为RNA结构信息
+        data: 原始数据字典（或IndexedStructureStore），键为结构ID，值为RNA结构信息
     
     返回:
         list: 转换后的数据列表，符合模型预期的格式
@@ -144,8 +144,15 @@ def adapt_training_dict_single(data):
     adapted_data = []
     
     # 处理每个RNA结构
-    for key, item in data.items():
+    for key in data:
         try:
+            # 索引化存储可直接根据元数据跳过多链结构，无需反序列化记录
+            if hasattr(data, 'metadata') and data.metadata(key).get('if_multi_chain', False):
+                logger.info(f"跳过多链RNA: {data.metadata(key)['pdb_id']}")
+                continue
+            
+            item = data[key]
+            
             # 检查格式是否正确
             if not isinstance(item, dict) or 'rna_dic' not in item:
                 logger.warning(f"结构 {key} 不符合预期格式，跳过")
@@ -4,16 +4,22 @@
 """
 
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, Sampler, DistributedSampler
 import os
 import pickle
 import glob
 import logging
+from functools import partial
 import numpy as np
 from .preprocessing import process_pdb_file
+from .structure_store import IndexedStructureStore, STORE_EXTENSION, store_matches_source
+from .structure_io import is_structure_file, process_structure_file
 
 logger = logging.getLogger(__name__)
 
+# RNA-FM字母表中<pad>的下标（骨干网络按此识别填充位置并在注意力中屏蔽）
+PADDING_IDX = 1
+
 class RNATorsionDataset(Dataset):
     """RNA扭转角数据集"""
     
@@ -22,7 +28,7 @@ class RNATorsionDataset(Dataset):
         初始化数据集
         
         Args:
-            data_dir: 包含pkl文件的目录
+            data_dir: 包含pkl、.rnaidx或PDB/mmCIF文件的目录
             alphabet: RNA-FM的字母表
             torsion_types: 需要预测的扭转角类型列表
             cache_dir: 缓存目录，如果提供则缓存处理后的数据
@@ -46,12 +52,12 @@ class RNATorsionDataset(Dataset):
     def _load_and_process_data(self):
         """加载并预处理所有pkl文件"""
         # 如果存在缓存，则从缓存加载
-        cache_path = os.path.join(self.cache_dir, "processed_data.pt")
+        cache_path = os.path.join(self.cache_dir, "processed_data.pt") if self.cache_dir else None
         if self.cache_dir and os.path.exists(cache_path):
             logger.info(f"从缓存加载数据: {cache_path}")
             try:
                 # 使用PyTorch 2.6+的新weights_only=False标志
-                import torch.serialization
+                # （torch.serialization随torch导入，不能在函数内import，否则torch会成为局部变量）
                 with torch.serialization.safe_globals([np.core.multiarray.scalar, np.float64, np.float32]):
                     self.data = torch.load(cache_path)
             except Exception as e:
@@ -68,7 +74,24 @@ class RNATorsionDataset(Dataset):
         
         # 查找所有pkl文件
         self.pkl_files = glob.glob(os.path.join(self.data_dir, "*.pkl")) + \
-                        glob.glob(os.path.join(self.data_dir, "*.pt"))
+                        glob.glob(os.path.join(self.data_dir, "*.pt")) + \
+                        glob.glob(os.path.join(self.data_dir, f"*{STORE_EXTENSION}")) + \
+                        [path for path in glob.glob(os.path.join(self.data_dir, "*")) if is_structure_file(path)]
+        
+        # 已转换为索引化存储的pkl文件直接跳过，由对应的.rnaidx文件提供数据；
+        # 源pkl更新后旧索引文件过期，改为跳过索引文件、完整加载pkl
+        skipped = set()
+        for path in self.pkl_files:
+            indexed_path = os.path.splitext(path)[0] + STORE_EXTENSION
+            if not (path.endswith('.pkl') and os.path.exists(indexed_path)):
+                continue
+            if store_matches_source(indexed_path, path):
+                skipped.add(path)
+            else:
+                logger.warning(f"索引文件 {indexed_path} 与 {path} 的大小或修改时间不一致（源文件已更新），"
+                               f"忽略索引文件并完整加载pkl；请重新运行 pack 生成索引")
+                skipped.add(indexed_path)
+        self.pkl_files = [path for path in self.pkl_files if path not in skipped]
         logger.info(f"找到 {len(self.pkl_files)} 个数据文件")
         
         if len(self.pkl_files) == 0:
@@ -86,6 +109,23 @@ class RNATorsionDataset(Dataset):
                         logger.info(f"从 {file_path} 加载了 {len(processed_data)} 个结构")
                         continue
                 
+                # 索引化结构存储：逐个结构按需读取，无需整体反序列化
+                if file_path.endswith(STORE_EXTENSION):
+                    from .adapters import adapt_training_dict_single
+                    with IndexedStructureStore(file_path) as store:
+                        logger.info(f"检测到索引化结构存储: {os.path.basename(file_path)}，包含 {len(store)} 个结构")
+                        adapted_data = adapt_training_dict_single(store)
+                    self.data.extend(adapted_data)
+                    logger.info(f"适配处理成功: {len(adapted_data)} 个样本")
+                    continue
+                
+                # PDB/mmCIF结构文件：直接解析，每条RNA链作为一个样本
+                if is_structure_file(file_path):
+                    results = process_structure_file(file_path)
+                    self.data.extend(results)
+                    logger.debug(f"从 {file_path} 解析了 {len(results)} 条RNA链")
+                    continue
+                
                 # 处理PKL文件
                 with open(file_path, 'rb') as f:
                     data = pickle.load(f)
@@ -182,9 +222,73 @@ class RNATorsionDataset(Dataset):
             'masks': masks
         }
 
-def create_data_loaders(dataset, batch_size, train_ratio=0.8, val_ratio=0.1, test_ratio=0.1, num_workers=4):
+class ResumableRandomSampler(DistributedSampler):
     """
-    创建训练、验证和测试数据加载器
+    可断点续训的随机采样器
+    
+    每个epoch的顺序由(seed, epoch)唯一确定，并支持从epoch中间的某个位置继续，
+    因此恢复训练时可以精确跳过已经训练过的样本。多进程训练时每个rank只取
+    自己的分片（与DistributedSampler相同），单进程时等价于普通的随机采样。
+    """
+    
+    def __init__(self, data_source, seed=42, num_replicas=1, rank=0):
+        super().__init__(data_source, num_replicas=num_replicas, rank=rank, shuffle=True, seed=seed)
+        self.start_index = 0
+    
+    def set_global_start_index(self, global_index):
+        """
+        下一次迭代跳过本epoch全局顺序中的前global_index个样本（只生效一次）
+        
+        各rank按交错方式从同一个全局顺序中取样（rank r取第r, r+num_replicas, ...个），
+        因此已训练的样本只由全局位置决定，与中断前的进程数和批次大小无关。
+        
+        Args:
+            global_index: 已训练的全局样本数
+        
+        Returns:
+            start_index: 本rank分片中的起始位置
+        """
+        self.start_index = max(0, -(-(global_index - self.rank) // self.num_replicas))
+        return self.start_index
+    
+    def __iter__(self):
+        order = list(super().__iter__())
+        start, self.start_index = self.start_index, 0
+        return iter(order[start:])
+
+class ShardedSequentialSampler(Sampler):
+    """
+    按rank交错划分的顺序采样器（不补齐样本），用于验证集
+    
+    各rank的损失之和与批次数汇总后与单进程结果一致。
+    """
+    
+    def __init__(self, data_source, num_replicas=1, rank=0):
+        self.data_source = data_source
+        self.num_replicas = num_replicas
+        self.rank = rank
+    
+    def __iter__(self):
+        return iter(range(self.rank, len(self.data_source), self.num_replicas))
+    
+    def __len__(self):
+        return len(range(self.rank, len(self.data_source), self.num_replicas))
+
+def split_dataset(dataset, train_ratio=0.8, val_ratio=0.1, test_ratio=0.1, seed=42):
+    """
+    按seed确定性地划分训练、验证和测试集
+    
+    create_data_loaders和嵌入索引构建共用同一划分，保证索引只包含训练时见过的链。
+    
+    Args:
+        dataset: RNATorsionDataset
+        train_ratio: 训练集比例
+        val_ratio: 验证集比例
+        test_ratio: 测试集比例
+        seed: 随机种子
+    
+    Returns:
+        train_dataset, val_dataset, test_dataset: torch.utils.data.Subset
     """
     # 检查比例之和是否为1
     assert abs(train_ratio + val_ratio + test_ratio - 1.0) < 1e-10, "比例之和必须为1"
@@ -212,43 +316,69 @@ def create_data_loaders(dataset, batch_size, train_ratio=0.8, val_ratio=0.1, tes
     logger.info(f"数据集划分: 训练集={train_size}, 验证集={val_size}, 测试集={test_size}")
     
     # 划分数据集
-    train_dataset, val_dataset, test_dataset = torch.utils.data.random_split(
-        dataset, [train_size, val_size, test_size]
+    return torch.utils.data.random_split(
+        dataset, [train_size, val_size, test_size],
+        generator=torch.Generator().manual_seed(seed)
     )
+
+def create_data_loaders(dataset, batch_size, train_ratio=0.8, val_ratio=0.1, test_ratio=0.1, num_workers=4, seed=42,
+                        num_replicas=1, rank=0, pin_memory=None, padding_idx=None):
+    """
+    创建训练、验证和测试数据加载器
     
-    # 创建数据加载器
+    数据集划分（见split_dataset）和训练集打乱顺序都由seed确定，保证断点续训时与中断前一致。
+    num_replicas大于1时训练集和验证集按rank分片，测试集保持完整（只在rank 0上评估）。
+    pin_memory为None时在有GPU的环境下自动开启；工作进程在epoch之间保持存活。
+    padding_idx为None时使用数据集字母表的填充下标。
+    """
+    train_dataset, val_dataset, test_dataset = split_dataset(dataset, train_ratio, val_ratio, test_ratio, seed)
+    
+    # 锁页内存配合PrefetchLoader的非阻塞拷贝，持久化工作进程避免每个epoch重新启动
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+    if padding_idx is None:
+        alphabet = getattr(dataset, 'alphabet', None)
+        padding_idx = alphabet.padding_idx if alphabet is not None else PADDING_IDX
+    loader_kwargs = {
+        'num_workers': num_workers,
+        'collate_fn': partial(collate_fn, padding_idx=padding_idx),
+        'pin_memory': pin_memory,
+        'persistent_workers': num_workers > 0
+    }
+    
+    # 创建数据加载器（训练集使用独立的随机数生成器，创建迭代器时不消耗全局随机状态）
     train_loader = DataLoader(
         train_dataset, 
         batch_size=batch_size, 
-        shuffle=True, 
-        num_workers=num_workers,
-        collate_fn=collate_fn
+        sampler=ResumableRandomSampler(train_dataset, seed, num_replicas, rank), 
+        generator=torch.Generator().manual_seed(seed),
+        **loader_kwargs
     )
     
     val_loader = DataLoader(
         val_dataset, 
         batch_size=batch_size, 
-        shuffle=False, 
-        num_workers=num_workers,
-        collate_fn=collate_fn
+        sampler=ShardedSequentialSampler(val_dataset, num_replicas, rank), 
+        **loader_kwargs
     )
     
     test_loader = DataLoader(
         test_dataset, 
         batch_size=batch_size, 
         shuffle=False, 
-        num_workers=num_workers,
-        collate_fn=collate_fn
+        **loader_kwargs
     )
     
     return train_loader, val_loader, test_loader
 
-def collate_fn(batch):
+def collate_fn(batch, padding_idx=PADDING_IDX):
     """
     自定义的收集函数，用于处理不同长度的序列
     
     Args:
         batch: 批次数据
+        padding_idx: 字母表的填充下标（alphabet.padding_idx），tokens用它右填充，
+                     骨干网络据此屏蔽填充位置的注意力
     
     Returns:
         batch_dict: 收集后的批次字典
@@ -262,7 +392,7 @@ def collate_fn(batch):
     max_len = max(len(item['tokens']) for item in batch)
     
     # 填充tokens到相同长度
-    tokens = torch.zeros((len(batch), max_len), dtype=torch.long)
+    tokens = torch.full((len(batch), max_len), padding_idx, dtype=torch.long)
     for i, item in enumerate(batch):
         seq_len = len(item['tokens'])
         tokens[i, :seq_len] = item['tokens']
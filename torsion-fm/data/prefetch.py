@@ -0,0 +1,145 @@
+"""
+异步预取数据加载器：后台线程提前取出下一个批次，并用非阻塞拷贝把它提前送到设备上
+"""
+
+import time
+import queue
+import threading
+import logging
+import torch
+
+logger = logging.getLogger(__name__)
+
+# 批次中需要送到设备上的字段
+TENSOR_KEYS = ('tokens',)
+DICT_KEYS = ('angles', 'masks')
+
+_END = object()
+
+
+def move_batch_to_device(batch, device, non_blocking=True):
+    """
+    将collate_fn产生的批次中的张量送到设备上（其余字段保持不变）
+
+    Args:
+        batch: 批次字典
+        device: 目标设备
+        non_blocking: 是否使用非阻塞拷贝（源张量位于锁页内存时才真正异步）
+
+    Returns:
+        batch: 新的批次字典
+    """
+    moved = dict(batch)
+    for key in TENSOR_KEYS:
+        if key in batch:
+            moved[key] = batch[key].to(device, non_blocking=non_blocking)
+    for key in DICT_KEYS:
+        if key in batch:
+            moved[key] = {name: value.to(device, non_blocking=non_blocking) for name, value in batch[key].items()}
+    return moved
+
+
+def _record_stream(batch, stream):
+    """告知缓存分配器这些张量会在当前计算流上使用，避免被拷贝流提前回收"""
+    for key in TENSOR_KEYS:
+        if key in batch:
+            batch[key].record_stream(stream)
+    for key in DICT_KEYS:
+        for value in batch.get(key, {}).values():
+            value.record_stream(stream)
+
+
+class PrefetchLoader:
+    """
+    DataLoader的预取包装
+
+    - 后台线程从DataLoader取批次（等待工作进程collate），并立即在独立的CUDA流上以
+      non_blocking方式拷贝到设备，放入深度为depth的队列
+    - 主线程计算第N个批次时，后续批次的collate和拷贝同时进行
+    - 统计主线程等待数据的时间（data wait）和拷贝耗时，用于判断是否受数据加载限制
+
+    每次迭代产生的批次中，tokens/angles/masks已经位于目标设备上。
+    """
+
+    def __init__(self, data_loader, device, depth=2):
+        """
+        Args:
+            data_loader: torch DataLoader（建议开启pin_memory和persistent_workers）
+            device: 目标设备
+            depth: 后台队列深度（最多提前准备的批次数）
+        """
+        self.data_loader = data_loader
+        self.device = torch.device(device)
+        self.depth = max(1, depth)
+        self.reset_stats()
+
+    def reset_stats(self):
+        """清零计时统计"""
+        self.data_wait_time = 0.0
+        self.transfer_time = 0.0
+        self.last_data_wait = 0.0
+        self.last_transfer = 0.0
+        self.num_batches = 0
+
+    def __len__(self):
+        return len(self.data_loader)
+
+    def _put(self, output, item, stop):
+        """放入队列；消费者提前退出时放弃"""
+        while not stop.is_set():
+            try:
+                output.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _producer(self, iterator, output, stop):
+        stream = torch.cuda.Stream(device=self.device) if self.device.type == 'cuda' else None
+        try:
+            for batch in iterator:
+                start = time.perf_counter()
+                event = None
+                if stream is not None:
+                    with torch.cuda.stream(stream):
+                        batch = move_batch_to_device(batch, self.device)
+                        event = stream.record_event()
+                else:
+                    batch = move_batch_to_device(batch, self.device)
+                if not self._put(output, (batch, event, time.perf_counter() - start), stop):
+                    return
+            self._put(output, _END, stop)
+        except Exception as e:
+            self._put(output, e, stop)
+
+    def __iter__(self):
+        output = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._producer, args=(iter(self.data_loader), output, stop), daemon=True
+        )
+        producer.start()
+
+        try:
+            while True:
+                start = time.perf_counter()
+                item = output.get()
+                self.last_data_wait = time.perf_counter() - start
+                self.data_wait_time += self.last_data_wait
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+
+                batch, event, transfer = item
+                if event is not None:
+                    current = torch.cuda.current_stream(self.device)
+                    current.wait_event(event)
+                    _record_stream(batch, current)
+                self.last_transfer = transfer
+                self.transfer_time += transfer
+                self.num_batches += 1
+                yield batch
+        finally:
+            stop.set()
+            producer.join(timeout=1.0)
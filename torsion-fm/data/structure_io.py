@@ -0,0 +1,316 @@
+"""
+结构文件读取模块：直接解析PDB/mmCIF文件，生成与Training_Dict_single相同布局的RNA链
+
+ATOM记录按列整体切片解析为NumPy数组，.gz压缩文件自动解压；
+每条RNA链转换为{'pdb_id', 'chain_id', 'if_multi_chain', 'rna_dic'}结构，
+可以直接交给adapt_training_dict_single计算扭转角，无需中间pkl文件。
+"""
+
+import os
+import re
+import gzip
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STRUCTURE_EXTENSIONS = ('.pdb', '.ent', '.cif', '.mmcif')
+
+# 标准核苷酸及常见修饰核苷酸到碱基字母的映射
+RNA_RESIDUE_MAP = {
+    'A': 'A', 'C': 'C', 'G': 'G', 'U': 'U',
+    'RA': 'A', 'RC': 'C', 'RG': 'G', 'RU': 'U',
+    'ADE': 'A', 'CYT': 'C', 'GUA': 'G', 'URA': 'U', 'URI': 'U',
+    'PSU': 'U', 'H2U': 'U', '5MU': 'U', '4SU': 'U', 'OMU': 'U',
+    '5MC': 'C', 'OMC': 'C', '1MA': 'A', '6MA': 'A', 'MA6': 'A',
+    '2MG': 'G', '7MG': 'G', 'M2G': 'G', 'OMG': 'G', '1MG': 'G', 'YYG': 'G',
+}
+
+# RNA链判定：能识别为核苷酸的残基比例阈值
+MIN_RNA_FRACTION = 0.5
+POLYMER_ATOMS = ['CA', "C1'", 'P']
+
+
+def is_structure_file(path):
+    """判断路径是否为PDB/mmCIF结构文件（支持.gz）"""
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return name.endswith(STRUCTURE_EXTENSIONS)
+
+
+def _is_mmcif(path):
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return name.endswith(('.cif', '.mmcif'))
+
+
+def _read_lines(path):
+    """读取文本行，.gz文件自动解压"""
+    opener = gzip.open if path.lower().endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        return f.read().splitlines()
+
+
+def _pdb_id_from_path(path):
+    name = os.path.basename(path)
+    if name.lower().endswith('.gz'):
+        name = name[:-3]
+    name = os.path.splitext(name)[0]
+    # pdbXXXX.ent 命名约定
+    if name.lower().startswith('pdb') and len(name) == 7:
+        name = name[3:]
+    return name
+
+
+def _slice(columns, start, end):
+    """从固定宽度字符矩阵中切出一列并去除空白"""
+    return np.char.strip(np.ascontiguousarray(columns[:, start:end]).view(f'S{end - start}').ravel().astype(str))
+
+
+def parse_pdb_lines(lines):
+    """
+    解析PDB格式的ATOM/HETATM记录（仅第一个模型）
+
+    Args:
+        lines: 文本行列表
+
+    Returns:
+        table: 字典，键为atom_name/alt_loc/residue_name/chain_id/residue_number/insertion_code/coords
+    """
+    records = []
+    for line in lines:
+        if line.startswith(('ATOM  ', 'HETATM')):
+            records.append(line)
+        elif line.startswith('ENDMDL'):
+            break
+
+    if not records:
+        return None
+
+    # 将所有记录填充到80列后按列切片，一次性完成字段解析
+    columns = np.array([line.ljust(80)[:80] for line in records], dtype='S80').view('S1').reshape(len(records), 80)
+
+    coords = np.stack([
+        _slice(columns, 30, 38).astype(np.float32),
+        _slice(columns, 38, 46).astype(np.float32),
+        _slice(columns, 46, 54).astype(np.float32),
+    ], axis=1)
+
+    return {
+        'atom_name': _slice(columns, 12, 16),
+        'alt_loc': _slice(columns, 16, 17),
+        'residue_name': _slice(columns, 17, 20),
+        'chain_id': _slice(columns, 21, 22),
+        'residue_number': _slice(columns, 22, 26).astype(np.int64),
+        'insertion_code': _slice(columns, 26, 27),
+        'coords': coords,
+    }
+
+
+# CIF值：引号只在其后是空白或行尾时才结束，因此"O3'"和'N'A'这类值可以包含另一种或同一种引号
+_CIF_TOKEN = re.compile(r"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(\S+)""")
+
+
+def _tokenize_cif_line(line):
+    """按CIF规则切分一行数据值（去掉引号，引号内可以有空格）"""
+    if "'" not in line and '"' not in line:
+        return line.split()
+    return [next(group for group in match.groups() if group is not None) for match in _CIF_TOKEN.finditer(line)]
+
+
+def parse_mmcif_lines(lines):
+    """
+    解析mmCIF格式的_atom_site循环（仅第一个模型）
+
+    Args:
+        lines: 文本行列表
+
+    Returns:
+        table: 与parse_pdb_lines相同结构的字典
+    """
+    fields = []
+    tokens = []
+    i = 0
+    n = len(lines)
+    while i < n:
+        if lines[i].strip() == 'loop_' and i + 1 < n and lines[i + 1].startswith('_atom_site.'):
+            i += 1
+            while i < n and lines[i].startswith('_atom_site.'):
+                fields.append(lines[i].split('.', 1)[1].strip())
+                i += 1
+            # 数据值按记号流读取：一条记录可以跨多行，以;开头的行到下一个;行之间是一个文本值
+            while i < n:
+                line = lines[i].rstrip('\r\n')
+                if line.startswith(';'):
+                    text = [line[1:]]
+                    i += 1
+                    while i < n and not lines[i].startswith(';'):
+                        text.append(lines[i].rstrip('\r\n'))
+                        i += 1
+                    tokens.append("\n".join(text).strip())
+                    i += 1
+                    continue
+                if not line.strip():
+                    i += 1
+                    continue
+                if line.startswith(('_', 'loop_', '#', 'data_')):
+                    break
+                tokens.extend(_tokenize_cif_line(line))
+                i += 1
+            break
+        i += 1
+
+    if not tokens or not fields:
+        return None
+
+    num_rows, leftover = divmod(len(tokens), len(fields))
+    if leftover:
+        logger.warning(f"_atom_site循环的值数 {len(tokens)} 不是字段数 {len(fields)} 的整数倍，"
+                       f"丢弃末尾 {leftover} 个值")
+    if num_rows == 0:
+        return None
+    table = np.array(tokens[:num_rows * len(fields)], dtype=str).reshape(num_rows, len(fields))
+
+    def column(*names, default=''):
+        for name in names:
+            if name in fields:
+                return table[:, fields.index(name)]
+        return np.full(len(table), default)
+
+    model = column('pdbx_PDB_model_num', default='1')
+    table = table[model == model[0]]
+
+    alt_loc = column('label_alt_id')
+    insertion_code = column('pdbx_PDB_ins_code')
+    residue_number = column('auth_seq_id', 'label_seq_id', default='0')
+    coords = np.stack([
+        column('Cartn_x').astype(np.float32),
+        column('Cartn_y').astype(np.float32),
+        column('Cartn_z').astype(np.float32),
+    ], axis=1)
+
+    return {
+        'atom_name': column('auth_atom_id', 'label_atom_id'),
+        'alt_loc': np.where(np.isin(alt_loc, ['.', '?']), '', alt_loc),
+        'residue_name': column('auth_comp_id', 'label_comp_id'),
+        'chain_id': column('auth_asym_id', 'label_asym_id'),
+        'residue_number': np.where(np.isin(residue_number, ['.', '?']), '0', residue_number).astype(np.int64),
+        'insertion_code': np.where(np.isin(insertion_code, ['.', '?']), '', insertion_code),
+        'coords': coords,
+    }
+
+
+def _chain_to_rna_dic(table, indices):
+    """
+    将一条链的原子记录转换为rna_dic
+
+    Args:
+        table: 原子表
+        indices: 属于该链的原子索引（按文件顺序）
+
+    Returns:
+        rna_dic: 键为残基编号，值为{'residue_name', 'atom_coords'}；不是RNA链时返回None
+    """
+    residue_number = table['residue_number'][indices]
+    insertion_code = table['insertion_code'][indices]
+
+    # 残基边界：编号或插入码变化的位置
+    changed = np.ones(len(indices), dtype=bool)
+    changed[1:] = (residue_number[1:] != residue_number[:-1]) | (insertion_code[1:] != insertion_code[:-1])
+    starts = np.flatnonzero(changed)
+    ends = np.append(starts[1:], len(indices))
+
+    residues = []
+    for start, end in zip(starts, ends):
+        atom_indices = indices[start:end]
+        base = RNA_RESIDUE_MAP.get(table['residue_name'][atom_indices[0]])
+        if base is None:
+            # 只把聚合物残基（蛋白或其他核苷酸）计入判定，水和离子等配体直接忽略
+            if np.isin(table['atom_name'][atom_indices], POLYMER_ATOMS).any():
+                residues.append(None)
+            continue
+        atom_coords = {}
+        for atom_index in atom_indices:
+            # 多构象原子只保留第一个构象
+            name = str(table['atom_name'][atom_index])
+            if name not in atom_coords:
+                atom_coords[name] = table['coords'][atom_index]
+        residues.append((residue_number[start], insertion_code[start], base, atom_coords))
+
+    nucleotides = [residue for residue in residues if residue is not None]
+    if not nucleotides or len(nucleotides) < MIN_RNA_FRACTION * len(residues):
+        return None
+
+    # 编号唯一且递增时沿用作者编号，否则使用文件顺序编号，保证排序后的顺序与链顺序一致
+    numbers = [residue[0] for residue in nucleotides]
+    use_author_numbers = all(residue[1] == '' for residue in nucleotides) and \
+        all(b > a for a, b in zip(numbers, numbers[1:]))
+
+    rna_dic = {}
+    for i, (number, _, base, atom_coords) in enumerate(nucleotides):
+        key = int(number) if use_author_numbers else i + 1
+        rna_dic[key] = {'residue_name': base, 'atom_coords': atom_coords}
+    return rna_dic
+
+
+def read_structure(path, chains=None):
+    """
+    读取PDB/mmCIF文件中的RNA链
+
+    Args:
+        path: 结构文件路径（.pdb/.ent/.cif/.mmcif，可带.gz）
+        chains: 可选的链ID列表，只返回这些链
+
+    Returns:
+        structures: 字典，键为"<pdb_id>_<chain_id>"，值为Training_Dict_single布局的结构
+    """
+    lines = _read_lines(path)
+    table = parse_mmcif_lines(lines) if _is_mmcif(path) else parse_pdb_lines(lines)
+    if table is None:
+        logger.warning(f"文件中没有原子记录: {path}")
+        return {}
+
+    # 只保留主构象（无altloc或第一个altloc）
+    alt_loc = table['alt_loc']
+    keep = (alt_loc == '') | (alt_loc == 'A') | (alt_loc == '1')
+    table = {key: value[keep] for key, value in table.items()}
+
+    pdb_id = _pdb_id_from_path(path)
+    structures = {}
+    chain_ids = table['chain_id']
+    for chain_id in dict.fromkeys(chain_ids.tolist()):
+        if chains is not None and chain_id not in chains:
+            continue
+        rna_dic = _chain_to_rna_dic(table, np.flatnonzero(chain_ids == chain_id))
+        if rna_dic is None:
+            continue
+        structures[f"{pdb_id}_{chain_id}"] = {
+            'pdb_id': pdb_id,
+            'chain_id': chain_id,
+            'if_multi_chain': False,
+            'rna_dic': rna_dic,
+        }
+
+    logger.debug(f"从 {path} 读取了 {len(structures)} 条RNA链")
+    return structures
+
+
+def process_structure_file(path, chains=None):
+    """
+    处理PDB/mmCIF文件，提取每条RNA链的序列和扭转角
+
+    Args:
+        path: 结构文件路径
+        chains: 可选的链ID列表
+
+    Returns:
+        results: 结果字典列表，格式与process_pdb_file相同
+    """
+    from .adapters import adapt_training_dict_single
+
+    structures = read_structure(path, chains)
+    if not structures:
+        return []
+    return adapt_training_dict_single(structures)
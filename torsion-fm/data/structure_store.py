@@ -0,0 +1,291 @@
+"""
+索引化结构存储模块：将Training_Dict_single格式的大型pkl文件转换为可随机访问的索引容器
+
+文件布局:
+    [MAGIC][记录1][记录2]...[记录N][索引][索引偏移(8字节)][MAGIC]
+
+每条记录是单个结构单独pickle后的字节串，索引记录每个键的偏移、长度以及
+pdb_id/chain_id等轻量元数据。打开文件时只读取尾部索引，单个结构按需反序列化。
+索引中还记录了源pkl的大小和修改时间，源文件变化后旁边的旧索引文件不会再被使用。
+"""
+
+import os
+import mmap
+import pickle
+import struct
+import logging
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+STORE_MAGIC = b"RNAIDX01"
+STORE_EXTENSION = ".rnaidx"
+STORE_VERSION = 1
+
+_FOOTER = struct.Struct("<Q")
+
+
+def is_structure_store(path):
+    """判断文件是否为索引化结构存储"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(STORE_MAGIC)) == STORE_MAGIC
+    except OSError:
+        return False
+
+
+def source_identity(path):
+    """
+    返回文件的身份标识（大小和纳秒修改时间），用于判断派生文件是否过期
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        identity: {'size', 'mtime_ns'}，文件不存在时为None
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def store_matches_source(store_path, source_path):
+    """
+    判断索引文件是否由当前版本的源pkl生成
+
+    Args:
+        store_path: .rnaidx文件路径
+        source_path: 源pkl文件路径
+
+    Returns:
+        bool: 索引文件有效且记录的源文件大小/修改时间与当前一致（未记录源信息的旧索引视为过期）
+    """
+    if not (os.path.exists(store_path) and is_structure_store(store_path)):
+        return False
+    try:
+        with IndexedStructureStore(store_path) as store:
+            recorded = store.source
+    except (OSError, ValueError, pickle.UnpicklingError):
+        return False
+    return recorded is not None and recorded == source_identity(source_path)
+
+
+def _record_metadata(key, item):
+    """提取写入索引的轻量元数据"""
+    if not isinstance(item, dict):
+        return {'pdb_id': f'unknown_{key}', 'chain_id': None, 'if_multi_chain': False, 'num_residues': 0}
+    rna_dic = item.get('rna_dic', {})
+    return {
+        'pdb_id': item.get('pdb_id', f'unknown_{key}'),
+        'chain_id': item.get('chain_id', 'A'),
+        'if_multi_chain': bool(item.get('if_multi_chain', False)),
+        'num_residues': len(rna_dic) if isinstance(rna_dic, dict) else 0
+    }
+
+
+def write_structure_store(items, output_path, source=None):
+    """
+    将结构字典写入索引化容器
+
+    Args:
+        items: 结构字典（或可迭代的(key, item)对），值为Training_Dict_single中的结构
+        output_path: 输出文件路径
+        source: 源pkl的source_identity（应在加载源文件之前获取），写入索引供store_matches_source判断是否过期
+
+    Returns:
+        count: 写入的结构数量
+    """
+    if isinstance(items, Mapping):
+        items = items.items()
+
+    entries = []
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(STORE_MAGIC)
+        for key, item in items:
+            payload = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+            offset = f.tell()
+            f.write(payload)
+            entry = {'key': key, 'offset': offset, 'length': len(payload)}
+            entry.update(_record_metadata(key, item))
+            entries.append(entry)
+
+        index_offset = f.tell()
+        f.write(pickle.dumps({'version': STORE_VERSION, 'entries': entries, 'source': source},
+                             protocol=pickle.HIGHEST_PROTOCOL))
+        f.write(_FOOTER.pack(index_offset))
+        f.write(STORE_MAGIC)
+
+    # 写完后原子替换，避免中断时留下不完整的文件
+    os.replace(tmp_path, output_path)
+    logger.info(f"结构存储已写入: {output_path}，共 {len(entries)} 个结构")
+    return len(entries)
+
+
+def convert_training_dict(pkl_path, output_path=None):
+    """
+    一次性将Training_Dict_single格式的pkl文件转换为索引化容器
+
+    Args:
+        pkl_path: 原始pkl文件路径
+        output_path: 输出路径，默认与输入同名并使用.rnaidx扩展名
+
+    Returns:
+        output_path: 生成的索引文件路径
+    """
+    if output_path is None:
+        output_path = os.path.splitext(pkl_path)[0] + STORE_EXTENSION
+
+    logger.info(f"加载原始数据: {pkl_path}")
+    # 先记录源文件身份再加载，加载期间源文件被改写时索引会被判定为过期
+    source = source_identity(pkl_path)
+    with open(pkl_path, 'rb') as f:
+        data = pickle.load(f)
+
+    if not isinstance(data, dict):
+        raise ValueError(f"不支持的数据格式: {type(data)}，需要Training_Dict_single格式的字典")
+
+    write_structure_store(data, output_path, source=source)
+    return output_path
+
+
+class IndexedStructureStore(Mapping):
+    """
+    索引化结构存储的只读访问器
+
+    行为与原始字典一致（支持len、迭代、items、按键取值），因此可以直接传给
+    adapt_training_dict_single；区别在于每个结构只在被访问时才反序列化。
+    """
+
+    def __init__(self, path):
+        """
+        打开索引化结构存储
+
+        Args:
+            path: .rnaidx文件路径
+        """
+        self.path = path
+        self._file = None
+        self._mmap = None
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic_len = len(STORE_MAGIC)
+        if self._mmap[:magic_len] != STORE_MAGIC or self._mmap[-magic_len:] != STORE_MAGIC:
+            self.close()
+            raise ValueError(f"不是有效的结构存储文件: {self.path}")
+
+        footer_start = len(self._mmap) - magic_len - _FOOTER.size
+        (index_offset,) = _FOOTER.unpack(self._mmap[footer_start:footer_start + _FOOTER.size])
+        index = pickle.loads(self._mmap[index_offset:footer_start])
+
+        self.version = index.get('version', STORE_VERSION)
+        self.source = index.get('source')
+        self._entries = {}
+        self._pdb_index = {}
+        for entry in index['entries']:
+            self._entries[entry['key']] = entry
+            self._pdb_index.setdefault(entry['pdb_id'], []).append(entry['key'])
+
+    def close(self):
+        """关闭文件句柄"""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        # 只序列化路径，子进程中重新打开，便于在多进程中传递
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self._file = None
+        self._mmap = None
+        self._open()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __getitem__(self, key):
+        entry = self._entries[key]
+        if self._mmap is None:
+            self._open()
+        start = entry['offset']
+        return pickle.loads(self._mmap[start:start + entry['length']])
+
+    def metadata(self, key):
+        """返回结构的索引元数据（pdb_id、chain_id、if_multi_chain、num_residues），不反序列化记录"""
+        entry = self._entries[key]
+        return {k: v for k, v in entry.items() if k not in ('offset', 'length')}
+
+    def pdb_ids(self):
+        """返回存储中所有的PDB ID"""
+        return list(self._pdb_index.keys())
+
+    def keys_for_pdb(self, pdb_id):
+        """返回指定PDB ID对应的所有键"""
+        return list(self._pdb_index.get(pdb_id, []))
+
+    def get_by_pdb_id(self, pdb_id, chain_id=None):
+        """
+        按PDB ID（可选链ID）读取结构
+
+        Args:
+            pdb_id: PDB ID
+            chain_id: 可选的链ID
+
+        Returns:
+            items: 匹配的结构列表
+        """
+        results = []
+        for key in self._pdb_index.get(pdb_id, []):
+            if chain_id is not None and self._entries[key]['chain_id'] != chain_id:
+                continue
+            results.append(self[key])
+        return results
+
+
+def open_structure_source(path):
+    """
+    打开结构数据源：索引化存储返回IndexedStructureStore，否则回退为完整加载pkl
+
+    Args:
+        path: .rnaidx或.pkl文件路径
+
+    Returns:
+        data: 类字典对象，键为结构ID
+    """
+    if is_structure_store(path):
+        return IndexedStructureStore(path)
+
+    indexed_path = os.path.splitext(path)[0] + STORE_EXTENSION
+    if os.path.exists(indexed_path) and is_structure_store(indexed_path):
+        if store_matches_source(indexed_path, path):
+            logger.info(f"使用已转换的索引文件: {indexed_path}")
+            return IndexedStructureStore(indexed_path)
+        logger.warning(f"索引文件 {indexed_path} 与 {path} 的大小或修改时间不一致（源文件已更新），"
+                       f"忽略索引文件并完整加载pkl；请重新运行 pack 生成索引")
+
+    logger.info(f"未找到可用的索引文件，完整加载pkl: {path}")
+    with open(path, 'rb') as f:
+        return pickle.load(f)
@@ -0,0 +1,318 @@
+# data/synthetic.py
+"""
+合成RNA结构生成器：从采样的扭转角出发，用理想键长键角逐原子搭建A型骨架
+
+生成的结构与真实数据使用相同的pkl格式（每个文件一个rna_dic，或Training_Dict_single字典），
+可以按任意规模生成，用于数据加载、训练和服务的压力测试。
+坐标由扭转角按IUPAC约定构造；data.preprocessing.calculate_dihedral的符号与该约定相反，
+因此对生成的结构计算出的扭转角是采样值的相反数（链两端和缺失原子处除外）。
+"""
+
+import os
+import pickle
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUCLEOTIDES = "ACGU"
+PURINES = ("A", "G")
+
+# A型RNA的扭转角均值（度）
+A_FORM_TORSIONS = {
+    'alpha': -68.0,
+    'beta': 178.0,
+    'gamma': 54.0,
+    'delta': 82.0,
+    'epsilon': -153.0,
+    'zeta': -71.0,
+    'chi': -158.0,
+}
+
+# 骨架键长（埃）
+BOND_LENGTHS = {
+    ("P", "O5'"): 1.593,
+    ("O5'", "C5'"): 1.440,
+    ("C5'", "C4'"): 1.510,
+    ("C4'", "C3'"): 1.524,
+    ("C3'", "O3'"): 1.423,
+    ("O3'", "P"): 1.607,
+    ("C4'", "O4'"): 1.453,
+    ("O4'", "C1'"): 1.414,
+    ("C1'", "C2'"): 1.528,
+    ("C2'", "O2'"): 1.413,
+    ("C1'", "N"): 1.475,
+    ("N", "C"): 1.370,
+}
+
+# 键角（度），键为(前一个原子, 中心原子, 新原子)
+BOND_ANGLES = {
+    ("O3'", "P", "O5'"): 104.0,
+    ("P", "O5'", "C5'"): 120.9,
+    ("O5'", "C5'", "C4'"): 110.2,
+    ("C5'", "C4'", "C3'"): 115.5,
+    ("C4'", "C3'", "O3'"): 110.6,
+    ("C3'", "O3'", "P"): 119.7,
+    ("C3'", "C4'", "O4'"): 105.5,
+    ("C4'", "O4'", "C1'"): 109.8,
+    ("O4'", "C1'", "C2'"): 106.4,
+    ("C1'", "C2'", "O2'"): 110.6,
+    ("O4'", "C1'", "N"): 108.5,
+    ("C1'", "N", "C"): 126.5,
+}
+
+# 非骨架原子相对于骨架的固定二面角（C3'-内型糖环）
+SUGAR_DIHEDRALS = {
+    "O4'": 120.0,    # C5'-C3'-C4'-O4'（决定C4'的手性）
+    "C1'": -24.0,    # C3'-C4'-O4'-C1'（nu4）
+    "C2'": 3.0,      # C4'-O4'-C1'-C2'（nu0）
+    "O2'": -150.0,   # O4'-C1'-C2'-O2'
+    "N": -120.0,     # C4'-O4'-C1'-N9/N1
+}
+
+
+def _cross(u, v):
+    """三维向量叉积（比np.cross对单个向量快一个数量级）"""
+    return np.array([
+        u[1] * v[2] - u[2] * v[1],
+        u[2] * v[0] - u[0] * v[2],
+        u[0] * v[1] - u[1] * v[0],
+    ])
+
+
+def place_atom(a, b, c, bond_length, bond_angle, dihedral):
+    """
+    根据前三个原子和内坐标放置第四个原子（NeRF算法）
+
+    Args:
+        a, b, c: 前三个原子的坐标
+        bond_length: c与新原子的键长
+        bond_angle: b-c-新原子的键角（度）
+        dihedral: a-b-c-新原子的二面角（度）
+
+    Returns:
+        d: 新原子坐标
+    """
+    angle = np.radians(bond_angle)
+    torsion = np.radians(dihedral)
+    bc = c - b
+    bc /= np.sqrt(bc.dot(bc))
+    n = _cross(b - a, bc)
+    n /= np.sqrt(n.dot(n))
+    m = _cross(n, bc)
+    sin_angle = np.sin(angle)
+    return c + bond_length * (-np.cos(angle) * bc + sin_angle * np.cos(torsion) * m + sin_angle * np.sin(torsion) * n)
+
+
+def sample_torsions(length, rng, noise=10.0):
+    """
+    在A型均值附近采样扭转角
+
+    Args:
+        length: 残基数
+        rng: numpy随机数生成器
+        noise: 高斯噪声标准差（度）
+
+    Returns:
+        torsions: {角度名: [length]数组}，范围(-180, 180]
+    """
+    torsions = {}
+    for name, mean in A_FORM_TORSIONS.items():
+        values = mean + rng.normal(scale=noise, size=length)
+        torsions[name] = (values + 180.0) % 360.0 - 180.0
+    return torsions
+
+
+def build_chain(sequence, torsions):
+    """
+    由序列和扭转角搭建全部扭转角相关原子的坐标
+
+    Args:
+        sequence: RNA序列
+        torsions: sample_torsions()的输出
+
+    Returns:
+        residues: 列表，每个元素为{原子名: 坐标}
+    """
+    residues = []
+    # 第一个残基之前的虚拟O3'和C3'只用于确定起始坐标系
+    prev_c3 = np.array([-2.4, 1.2, 0.0])
+    prev_o3 = np.array([-1.5, 0.0, 0.0])
+    p = np.zeros(3)
+
+    for i, base in enumerate(sequence):
+        atoms = {"P": p}
+        atoms["O5'"] = place_atom(prev_c3, prev_o3, p, BOND_LENGTHS[("P", "O5'")],
+                                  BOND_ANGLES[("O3'", "P", "O5'")], torsions['zeta'][i - 1] if i > 0 else A_FORM_TORSIONS['zeta'])
+        atoms["C5'"] = place_atom(prev_o3, p, atoms["O5'"], BOND_LENGTHS[("O5'", "C5'")],
+                                  BOND_ANGLES[("P", "O5'", "C5'")], torsions['alpha'][i])
+        atoms["C4'"] = place_atom(p, atoms["O5'"], atoms["C5'"], BOND_LENGTHS[("C5'", "C4'")],
+                                  BOND_ANGLES[("O5'", "C5'", "C4'")], torsions['beta'][i])
+        atoms["C3'"] = place_atom(atoms["O5'"], atoms["C5'"], atoms["C4'"], BOND_LENGTHS[("C4'", "C3'")],
+                                  BOND_ANGLES[("C5'", "C4'", "C3'")], torsions['gamma'][i])
+        atoms["O3'"] = place_atom(atoms["C5'"], atoms["C4'"], atoms["C3'"], BOND_LENGTHS[("C3'", "O3'")],
+                                  BOND_ANGLES[("C4'", "C3'", "O3'")], torsions['delta'][i])
+
+        # 糖环与碱基
+        atoms["O4'"] = place_atom(atoms["C5'"], atoms["C3'"], atoms["C4'"], BOND_LENGTHS[("C4'", "O4'")],
+                                  BOND_ANGLES[("C3'", "C4'", "O4'")], SUGAR_DIHEDRALS["O4'"])
+        atoms["C1'"] = place_atom(atoms["C3'"], atoms["C4'"], atoms["O4'"], BOND_LENGTHS[("O4'", "C1'")],
+                                  BOND_ANGLES[("C4'", "O4'", "C1'")], SUGAR_DIHEDRALS["C1'"])
+        atoms["C2'"] = place_atom(atoms["C4'"], atoms["O4'"], atoms["C1'"], BOND_LENGTHS[("C1'", "C2'")],
+                                  BOND_ANGLES[("O4'", "C1'", "C2'")], SUGAR_DIHEDRALS["C2'"])
+        atoms["O2'"] = place_atom(atoms["O4'"], atoms["C1'"], atoms["C2'"], BOND_LENGTHS[("C2'", "O2'")],
+                                  BOND_ANGLES[("C1'", "C2'", "O2'")], SUGAR_DIHEDRALS["O2'"])
+        n_name, c_name = ("N9", "C4") if base in PURINES else ("N1", "C2")
+        atoms[n_name] = place_atom(atoms["C4'"], atoms["O4'"], atoms["C1'"], BOND_LENGTHS[("C1'", "N")],
+                                   BOND_ANGLES[("O4'", "C1'", "N")], SUGAR_DIHEDRALS["N"])
+        atoms[c_name] = place_atom(atoms["O4'"], atoms["C1'"], atoms[n_name], BOND_LENGTHS[("N", "C")],
+                                   BOND_ANGLES[("C1'", "N", "C")], torsions['chi'][i])
+
+        # 下一个残基的P由epsilon决定，其O5'由zeta决定
+        p = place_atom(atoms["C4'"], atoms["C3'"], atoms["O3'"], BOND_LENGTHS[("O3'", "P")],
+                       BOND_ANGLES[("C3'", "O3'", "P")], torsions['epsilon'][i])
+        prev_c3, prev_o3 = atoms["C3'"], atoms["O3'"]
+        residues.append(atoms)
+
+    return residues
+
+
+def sample_lengths(num_structures, rng, distribution="lognormal", mean_length=80, min_length=10, max_length=500):
+    """
+    采样链长
+
+    Args:
+        num_structures: 结构数
+        rng: numpy随机数生成器
+        distribution: "lognormal"、"uniform"或"fixed"
+        mean_length: 平均长度（lognormal的中位数/fixed的长度）
+        min_length: 最小长度
+        max_length: 最大长度
+
+    Returns:
+        lengths: 整数数组
+    """
+    if distribution == "fixed":
+        lengths = np.full(num_structures, mean_length)
+    elif distribution == "uniform":
+        lengths = rng.integers(min_length, max_length + 1, size=num_structures)
+    elif distribution == "lognormal":
+        lengths = np.round(rng.lognormal(np.log(mean_length), 0.6, size=num_structures))
+    else:
+        raise ValueError(f"未知的长度分布: {distribution}")
+    return np.clip(lengths, min_length, max_length).astype(int)
+
+
+def generate_structure(pdb_id, length, rng, chain_id="A", torsion_noise=10.0, missing_atom_rate=0.0,
+                       multi_chain=False, decimals=3):
+    """
+    生成一个与真实数据格式相同的结构字典
+
+    Args:
+        pdb_id: 结构ID
+        length: 残基数
+        rng: numpy随机数生成器
+        chain_id: 链ID
+        torsion_noise: 扭转角噪声标准差（度）
+        missing_atom_rate: 每个原子独立缺失的概率
+        multi_chain: if_multi_chain标志
+        decimals: 坐标保留的小数位数（与PDB文件相同为3）
+
+    Returns:
+        structure: {'pdb_id', 'chain_id', 'if_multi_chain', 'rna_dic'}
+        torsions: 采样的扭转角（缺失原子导致的无效角度不做标记）
+    """
+    sequence = "".join(rng.choice(list(NUCLEOTIDES), size=length))
+    torsions = sample_torsions(length, rng, torsion_noise)
+    residues = build_chain(sequence, torsions)
+
+    rna_dic = {}
+    for res_id, (base, atoms) in enumerate(zip(sequence, residues), start=1):
+        names = list(atoms)
+        if missing_atom_rate > 0:
+            keep = rng.random(len(names)) >= missing_atom_rate
+            names = [name for name, k in zip(names, keep) if k]
+        rna_dic[res_id] = {
+            'residue_name': base,
+            'atom_coords': {name: np.round(atoms[name], decimals).astype(np.float32) for name in names},
+        }
+
+    structure = {
+        'pdb_id': pdb_id,
+        'chain_id': chain_id,
+        'if_multi_chain': multi_chain,
+        'rna_dic': rna_dic,
+    }
+    return structure, torsions
+
+
+def generate_structures(num_structures, seed=42, length_distribution="lognormal", mean_length=80,
+                        min_length=10, max_length=500, torsion_noise=10.0, missing_atom_rate=0.0,
+                        multi_chain_rate=0.0, id_prefix="SYN"):
+    """
+    逐个生成结构（生成器，内存占用与总规模无关）
+
+    Args:
+        num_structures: 结构数
+        seed: 随机种子（相同参数和种子总是生成相同的数据）
+        length_distribution, mean_length, min_length, max_length: 见sample_lengths()
+        torsion_noise: 扭转角噪声标准差（度）
+        missing_atom_rate: 原子缺失概率
+        multi_chain_rate: 标记为多链的结构比例
+        id_prefix: pdb_id前缀
+
+    Yields:
+        structure: 结构字典
+    """
+    rng = np.random.default_rng(seed)
+    lengths = sample_lengths(num_structures, rng, length_distribution, mean_length, min_length, max_length)
+    for i, length in enumerate(lengths):
+        multi_chain = bool(rng.random() < multi_chain_rate)
+        structure, _ = generate_structure(
+            f"{id_prefix}{i:07d}", int(length), rng,
+            torsion_noise=torsion_noise,
+            missing_atom_rate=missing_atom_rate,
+            multi_chain=multi_chain
+        )
+        yield structure
+
+
+def write_per_file(structures, output_dir):
+    """
+    按每个文件一个结构的格式写出（文件名为<pdb_id>_<chain_id>.pkl）
+
+    Args:
+        structures: 结构字典的可迭代对象
+        output_dir: 输出目录
+
+    Returns:
+        count: 写出的文件数
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    count = 0
+    for structure in structures:
+        path = os.path.join(output_dir, f"{structure['pdb_id']}_{structure['chain_id']}.pkl")
+        with open(path, 'wb') as f:
+            pickle.dump(structure, f, protocol=pickle.HIGHEST_PROTOCOL)
+        count += 1
+    return count
+
+
+def write_training_dict(structures, output_file):
+    """
+    按Training_Dict_single格式写出（{键: 结构字典}的单个pkl文件）
+
+    Args:
+        structures: 结构字典的可迭代对象
+        output_file: 输出文件路径
+
+    Returns:
+        count: 写出的结构数
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    data = {f"{s['pdb_id']}_{s['chain_id']}": s for s in structures}
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, output_file)
+    return len(data)
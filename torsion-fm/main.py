@@ -7,11 +7,8 @@ import os
 import argparse
 import logging
 from datetime import datetime
-import torch
 
 from config.config import Config
-from scripts.train import train_model
-from scripts.predict import predict
 
 def setup_logger(log_dir):
     """设置日志记录器"""
@@ -59,13 +56,140 @@ def main():
     train_parser.add_argument("--num_epochs", type=int, default=20, help="训练轮数")
     train_parser.add_argument("--learning_rate", type=float, default=1e-4, help="学习率")
     train_parser.add_argument("--device", type=str, default="cuda", help="设备（'cuda'或'cpu'）")
+    train_parser.add_argument("--backbone", type=str, default=None, choices=["rna_fm_t12", "stand_in"],
+                              help="骨干网络（stand_in为随机初始化的小型替身，用于压力测试）")
+    train_parser.add_argument("--backbone_path", type=str, default=None,
+                              help="骨干网络权重路径（.safetensors以mmap方式加载，多进程共享页缓存）")
+    train_parser.add_argument("--model_format", type=str, default=None, choices=["pth", "safetensors"],
+                              help="预测头检查点格式")
+    train_parser.add_argument("--no_backbone_dedup", action="store_true", help="关闭批次内重复序列的骨干网络去重")
+    train_parser.add_argument("--backbone_packing", action="store_true", help="按长度分组运行骨干网络（减少填充位置的计算）")
+    train_parser.add_argument("--attention", type=str, default=None, choices=["dense", "sdpa", "chunked"],
+                              help="骨干网络注意力实现（sdpa/chunked不物化完整的注意力矩阵，适合长序列）")
+    train_parser.add_argument("--resume", type=str, default=None, help="从训练状态检查点（文件或实验目录）恢复训练")
+    train_parser.add_argument("--checkpoint_every_steps", type=int, default=None, help="每隔多少步保存训练状态")
+    train_parser.add_argument("--checkpoint_every_minutes", type=float, default=None, help="每隔多少分钟保存训练状态")
+    train_parser.add_argument("--keep_last_checkpoints", type=int, default=None, help="保留最近的训练状态数量")
+    train_parser.add_argument("--effective_batch_residues", type=int, default=None, help="每个优化步的目标有效残基数（梯度累积，0表示不累积）")
+    train_parser.add_argument("--telemetry", action="store_true", default=None, help="记录逐步的分阶段耗时和吞吐量")
+    train_parser.add_argument("--no_telemetry", dest="telemetry", action="store_false", help="关闭逐步遥测")
+    train_parser.add_argument("--telemetry_every_steps", type=int, default=None, help="每隔多少步采样一次遥测")
+    train_parser.add_argument("--profile", action="store_true", help="用torch.profiler采集若干训练步")
+    train_parser.add_argument("--profile_steps", type=int, default=None, help="采集的训练步数")
+    train_parser.add_argument("--profile_wait", type=int, default=None, help="开始采集前跳过的训练步数")
+    train_parser.add_argument("--nproc_per_node", type=int, default=None, help="本机数据并行进程数（通常等于socket数或核心组数）")
+    train_parser.add_argument("--nnodes", type=int, default=None, help="参与训练的机器数")
+    train_parser.add_argument("--node_rank", type=int, default=None, help="本机编号（0为主节点）")
+    train_parser.add_argument("--master_addr", type=str, default=None, help="主节点地址")
+    train_parser.add_argument("--master_port", type=int, default=None, help="主节点端口")
     
     # 预测子命令
     predict_parser = subparsers.add_parser("predict", help="预测扭转角")
-    predict_parser.add_argument("--input_file", type=str, required=True, help="输入的pkl文件路径")
-    predict_parser.add_argument("--model_path", type=str, required=True, help="模型检查点路径")
+    predict_parser.add_argument("--input_file", type=str, nargs="+", required=True,
+                                help="输入的pkl文件或PDB/mmCIF结构文件路径（可以给出多个文件或目录）")
+    predict_parser.add_argument("--model_path", type=str, nargs="+", required=True,
+                                help="模型检查点路径（给出多个时以集成模式预测，共享一次RNA-FM前向传播）")
     predict_parser.add_argument("--output_dir", type=str, required=True, help="输出目录")
     predict_parser.add_argument("--device", type=str, default="cuda", help="设备（'cuda'或'cpu'）")
+    predict_parser.add_argument("--chains", type=str, nargs="+", default=None, help="只预测指定的链（仅对结构文件有效）")
+    predict_parser.add_argument("--profile", action="store_true", help="用torch.profiler采集预测过程")
+    predict_parser.add_argument("--profile_steps", type=int, default=3, help="采集的预测窗口数")
+    predict_parser.add_argument("--mc_samples", type=int, default=0, help="Monte-Carlo dropout采样次数（0表示不估计不确定度）")
+    predict_parser.add_argument("--cache_dir", type=str, default=None,
+                                help="预测缓存目录（按序列、检查点内容和选项寻址，跨运行复用）")
+    predict_parser.add_argument("--cache_memory_items", type=int, default=None, help="内存缓存的序列数")
+    predict_parser.add_argument("--cache_max_mb", type=float, default=None, help="磁盘缓存的大小上限（MB）")
+    predict_parser.add_argument("--no_cache", action="store_true", help="不使用预测缓存")
+    predict_parser.add_argument("--output_formats", type=str, nargs="+", default=["csv", "json"],
+                                choices=["csv", "json", "jsonl", "parquet"], help="输出格式")
+    predict_parser.add_argument("--bulk", action="store_true",
+                                help="批量模式：所有结构流式写入output_dir/predictions.<格式>（csv/jsonl/parquet）")
+    predict_parser.add_argument("--backbone_path", type=str, default=None,
+                                help="骨干网络权重路径（.safetensors以mmap方式加载）")
+    predict_parser.add_argument("--attention", type=str, default=None, choices=["dense", "sdpa", "chunked"],
+                                help="骨干网络注意力实现（sdpa/chunked不物化完整的注意力矩阵，适合长序列）")
+    predict_parser.add_argument("--memory_budget_mb", type=float, default=None,
+                                help="单个批次前向传播的内存预算（MB，默认GPU上取空闲显存的80%%，CPU上取配置值）")
+    predict_parser.add_argument("--max_batch_size", type=int, default=None, help="批次大小上限（1表示逐条预测）")
+    
+    # 索引转换子命令
+    pack_parser = subparsers.add_parser("pack", help="将Training_Dict_single格式的pkl转换为可随机访问的索引文件")
+    pack_parser.add_argument("--input_file", type=str, required=True, help="输入的pkl文件路径")
+    pack_parser.add_argument("--output_file", type=str, default=None, help="输出的.rnaidx文件路径（默认与输入同名）")
+    
+    # 批量扭转角提取子命令
+    featurize_parser = subparsers.add_parser("featurize", help="并行提取逐残基扭转角表（支持断点续跑）")
+    featurize_parser.add_argument("--inputs", type=str, nargs="+", required=True, help="输入文件或目录")
+    featurize_parser.add_argument("--output_dir", type=str, required=True, help="输出目录")
+    featurize_parser.add_argument("--num_workers", type=int, default=os.cpu_count(), help="工作进程数")
+    featurize_parser.add_argument("--chunk_size", type=int, default=256, help="每个数据块的结构数")
+    featurize_parser.add_argument("--format", type=str, default="parquet", choices=["parquet", "csv"], help="输出格式")
+    featurize_parser.add_argument("--no_resume", action="store_true", help="忽略已有进度，重新处理")
+    
+    # 突变扫描子命令
+    mutscan_parser = subparsers.add_parser("mutscan", help="饱和突变扫描")
+    mutscan_parser.add_argument("--sequence", type=str, required=True, help="野生型RNA序列")
+    mutscan_parser.add_argument("--model_path", type=str, required=True, help="模型检查点路径")
+    mutscan_parser.add_argument("--output_dir", type=str, required=True, help="输出目录")
+    mutscan_parser.add_argument("--positions", type=int, nargs="+", default=None, help="扫描位置（1起始），默认全部")
+    mutscan_parser.add_argument("--double", action="store_true", help="同时扫描双点突变")
+    mutscan_parser.add_argument("--batch_size", type=int, default=64, help="每次前向传播的变体数")
+    mutscan_parser.add_argument("--device", type=str, default="cuda", help="设备（'cuda'或'cpu'）")
+    
+    # 合成数据子命令
+    synth_parser = subparsers.add_parser("synth", help="生成A型RNA合成结构数据集（压力测试用）")
+    synth_parser.add_argument("--output_dir", type=str, required=True, help="输出目录")
+    synth_parser.add_argument("--num_structures", type=int, default=1000, help="结构数")
+    synth_parser.add_argument("--layout", type=str, default="training_dict", choices=["training_dict", "per_file"], help="pkl格式")
+    synth_parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    synth_parser.add_argument("--length_distribution", type=str, default="lognormal",
+                              choices=["lognormal", "uniform", "fixed"], help="链长分布")
+    synth_parser.add_argument("--mean_length", type=int, default=80, help="平均链长")
+    synth_parser.add_argument("--min_length", type=int, default=10, help="最小链长")
+    synth_parser.add_argument("--max_length", type=int, default=500, help="最大链长")
+    synth_parser.add_argument("--torsion_noise", type=float, default=10.0, help="扭转角噪声标准差（度）")
+    synth_parser.add_argument("--missing_atom_rate", type=float, default=0.0, help="原子缺失概率")
+    synth_parser.add_argument("--multi_chain_rate", type=float, default=0.0, help="标记为多链的结构比例")
+    
+    # 检查点转换子命令
+    convert_parser = subparsers.add_parser("convert", help="检查点格式转换（pth <-> safetensors）与骨干网络权重导出")
+    convert_parser.add_argument("--input", type=str, default=None, help="输入的预测头检查点")
+    convert_parser.add_argument("--output", type=str, required=True, help="输出文件（扩展名决定格式）")
+    convert_parser.add_argument("--backbone", type=str, default=None, choices=["rna_fm_t12", "stand_in"],
+                                help="导出骨干网络权重（不转换预测头）")
+    convert_parser.add_argument("--model_location", type=str, default=None, help="RNA-FM预训练权重的本地路径")
+    
+    # 预测服务子命令
+    serve_parser = subparsers.add_parser("serve", help="本地扭转角预测服务（asyncio，合并并发请求为批次）")
+    serve_parser.add_argument("--model_path", type=str, nargs="+", required=True,
+                              help="模型检查点路径（给出多个时以集成模式预测）")
+    serve_parser.add_argument("--heads", type=str, nargs="+", default=None, help="额外的预测头（名称=检查点路径）")
+    serve_parser.add_argument("--host", type=str, default=None, help="监听地址（默认127.0.0.1）")
+    serve_parser.add_argument("--port", type=int, default=None, help="监听端口")
+    serve_parser.add_argument("--device", type=str, default="cuda", help="设备（'cuda'或'cpu'）")
+    serve_parser.add_argument("--mc_samples", type=int, default=0, help="Monte-Carlo dropout采样次数（0表示不估计不确定度）")
+    serve_parser.add_argument("--cache_dir", type=str, default=None, help="预测缓存目录")
+    serve_parser.add_argument("--no_cache", action="store_true", help="不使用预测缓存")
+    serve_parser.add_argument("--backbone_path", type=str, default=None,
+                              help="骨干网络权重路径（.safetensors以mmap方式加载）")
+    serve_parser.add_argument("--attention", type=str, default=None, choices=["dense", "sdpa", "chunked"],
+                              help="骨干网络注意力实现")
+    serve_parser.add_argument("--memory_budget_mb", type=float, default=None, help="单个批次前向传播的内存预算（MB）")
+    serve_parser.add_argument("--max_batch_size", type=int, default=None, help="每次合并的最大请求数")
+    serve_parser.add_argument("--max_wait_ms", type=float, default=None, help="合并请求的最长等待时间（毫秒）")
+    serve_parser.add_argument("--max_queue", type=int, default=None, help="等待队列的容量（背压）")
+    
+    # 嵌入索引子命令
+    index_parser = subparsers.add_parser("index", help="构建训练集RNA-FM嵌入相似度索引")
+    index_parser.add_argument("--data_dir", type=str, required=True, help="训练数据目录")
+    index_parser.add_argument("--model_path", type=str, required=True, help="模型检查点路径")
+    index_parser.add_argument("--output_file", type=str, required=True, help="输出的.npz索引文件")
+    index_parser.add_argument("--batch_size", type=int, default=8, help="批次大小")
+    index_parser.add_argument("--n_lists", type=int, default=0, help="IVF簇数量（0为精确搜索）")
+    index_parser.add_argument("--device", type=str, default="cuda", help="设备（'cuda'或'cpu'）")
+    index_parser.add_argument("--split", type=str, default="train", choices=["train", "val", "test", "all"],
+                              help="索引的数据划分（默认与训练相同的训练集划分）")
+    index_parser.add_argument("--cache_dir", type=str, default=None, help="训练时使用的数据集缓存目录")
     
     try:
         args = parser.parse_args()
@@ -75,8 +199,30 @@ def main():
             print("\n使用示例:")
             print("  训练模型:")
             print("    python main.py train --data_dir ./data/pkl_files --output_dir ./output")
+            print("\n  从中断处继续训练:")
+            print("    python main.py train --data_dir ./data/pkl_files --output_dir ./output --resume ./output/<实验ID>")
+            print("\n  单机多进程CPU训练（每个socket一个进程）:")
+            print("    python main.py train --data_dir ./data/pkl_files --output_dir ./output --device cpu --nproc_per_node 2")
             print("\n  预测扭转角:")
-            print("    python main.py predict --input_file ./data/example.pkl --model_path ./output/best_model.pth --output_dir ./predictions\n")
+            print("    python main.py predict --input_file ./data/example.pkl --model_path ./output/best_model.pth --output_dir ./predictions")
+            print("\n  多检查点集成预测（输出圆形均值和圆形方差）:")
+            print("    python main.py predict --input_file ./data/example.pkl --model_path ./run1/best_model.pth ./run2/best_model.pth --output_dir ./predictions")
+            print("\n  转换为索引文件:")
+            print("    python main.py pack --input_file ./datasets/Training_Dict_single.pkl")
+            print("\n  性能分析（采集5个训练步）:")
+            print("    python main.py train --data_dir ./data/pkl_files --output_dir ./output --profile --profile_steps 5")
+            print("\n  批量提取扭转角:")
+            print("    python main.py featurize --inputs ./datasets --output_dir ./features --num_workers 16")
+            print("\n  生成10万条合成结构并用替身骨干网络做训练压力测试:")
+            print("    python main.py synth --output_dir ./synthetic --num_structures 100000")
+            print("    python main.py train --data_dir ./synthetic --output_dir ./output --backbone stand_in")
+            print("\n  导出safetensors权重，多个预测进程以mmap方式共享骨干网络:")
+            print("    python main.py convert --backbone rna_fm_t12 --output ./weights/rna_fm_t12.safetensors")
+            print("    python main.py convert --input ./output/best_model.pth --output ./output/best_model.safetensors")
+            print("    python main.py predict --input_file ./data/example.pkl --model_path ./output/best_model.safetensors "
+                  "--backbone_path ./weights/rna_fm_t12.safetensors --output_dir ./predictions")
+            print("\n  本地预测服务（asyncio客户端见scripts/serve.py的AsyncTorsionClient）:")
+            print("    python main.py serve --model_path ./output/best_model.safetensors --port 8765\n")
             return
         
         # 创建配置对象
@@ -85,7 +231,7 @@ def main():
         # 设置日志记录器
         if args.command == "train" and hasattr(args, 'output_dir') and args.output_dir:
             cfg.OUTPUT_DIR = args.output_dir
-        elif args.command == "predict" and hasattr(args, 'output_dir') and args.output_dir:
+        elif args.command in ("predict", "featurize", "mutscan", "synth") and hasattr(args, 'output_dir') and args.output_dir:
             cfg.OUTPUT_DIR = args.output_dir
         
         logger = setup_logger(os.path.join(cfg.OUTPUT_DIR, "logs"))
@@ -103,23 +249,133 @@ def main():
                 cfg.LEARNING_RATE = args.learning_rate
             if hasattr(args, 'device'):
                 cfg.DEVICE = args.device
+            if hasattr(args, 'backbone') and args.backbone:
+                cfg.BACKBONE = args.backbone
+            if hasattr(args, 'backbone_path') and args.backbone_path:
+                cfg.BACKBONE_PATH = args.backbone_path
+            if hasattr(args, 'model_format') and args.model_format:
+                cfg.MODEL_FORMAT = args.model_format
+            if hasattr(args, 'no_backbone_dedup') and args.no_backbone_dedup:
+                cfg.BACKBONE_DEDUP = False
+            if hasattr(args, 'backbone_packing') and args.backbone_packing:
+                cfg.BACKBONE_PACKING = True
+            if hasattr(args, 'attention') and args.attention:
+                cfg.BACKBONE_ATTENTION = args.attention
+            if hasattr(args, 'resume') and args.resume:
+                cfg.RESUME = args.resume
+            if hasattr(args, 'checkpoint_every_steps') and args.checkpoint_every_steps is not None:
+                cfg.CHECKPOINT_EVERY_STEPS = args.checkpoint_every_steps
+            if hasattr(args, 'checkpoint_every_minutes') and args.checkpoint_every_minutes is not None:
+                cfg.CHECKPOINT_EVERY_MINUTES = args.checkpoint_every_minutes
+            if hasattr(args, 'keep_last_checkpoints') and args.keep_last_checkpoints is not None:
+                cfg.KEEP_LAST_CHECKPOINTS = args.keep_last_checkpoints
+            if hasattr(args, 'telemetry') and args.telemetry is not None:
+                cfg.TELEMETRY = args.telemetry
+            if hasattr(args, 'telemetry_every_steps') and args.telemetry_every_steps is not None:
+                cfg.TELEMETRY_EVERY_STEPS = args.telemetry_every_steps
+            if hasattr(args, 'profile') and args.profile:
+                cfg.PROFILE = True
+            if hasattr(args, 'profile_steps') and args.profile_steps is not None:
+                cfg.PROFILE_ACTIVE = args.profile_steps
+            if hasattr(args, 'profile_wait') and args.profile_wait is not None:
+                cfg.PROFILE_WAIT = args.profile_wait
+            if hasattr(args, 'effective_batch_residues') and args.effective_batch_residues is not None:
+                cfg.EFFECTIVE_BATCH_RESIDUES = args.effective_batch_residues
+            for name in ("nproc_per_node", "nnodes", "node_rank", "master_addr", "master_port"):
+                if hasattr(args, name) and getattr(args, name) is not None:
+                    setattr(cfg, name.upper(), getattr(args, name))
             
             # 记录配置
             logging.info(f"配置: {vars(cfg)}")
             
             # 训练模型
-            train_model(cfg)
+            from scripts.train import run_training
+            run_training(cfg)
         
         elif args.command == "predict":
             # 执行预测
             if (hasattr(args, 'input_file') and args.input_file and 
                 hasattr(args, 'model_path') and args.model_path and 
                 hasattr(args, 'output_dir') and args.output_dir):
+                from scripts.predict import predict, create_prediction_cache
+                cache = None
+                if not (hasattr(args, 'no_cache') and args.no_cache):
+                    cache = create_prediction_cache(
+                        args.cache_dir if getattr(args, 'cache_dir', None) else Config.PREDICTION_CACHE_DIR,
+                        args.cache_memory_items if getattr(args, 'cache_memory_items', None) is not None
+                        else Config.PREDICTION_CACHE_MEMORY_ITEMS,
+                        args.cache_max_mb if getattr(args, 'cache_max_mb', None) is not None
+                        else Config.PREDICTION_CACHE_MAX_MB)
                 predict(args.input_file, args.model_path, args.output_dir, 
-                       args.device if hasattr(args, 'device') else "cuda")
+                       args.device if hasattr(args, 'device') else "cuda",
+                       args.chains if hasattr(args, 'chains') else None,
+                       args.profile if hasattr(args, 'profile') else False,
+                       args.profile_steps if hasattr(args, 'profile_steps') else 3,
+                       args.mc_samples if hasattr(args, 'mc_samples') else 0,
+                       cache,
+                       args.output_formats if hasattr(args, 'output_formats') else ("csv", "json"),
+                       args.bulk if hasattr(args, 'bulk') else False,
+                       args.backbone_path if getattr(args, 'backbone_path', None) else Config.BACKBONE_PATH,
+                       args.attention if getattr(args, 'attention', None) else Config.BACKBONE_ATTENTION,
+                       args.memory_budget_mb if hasattr(args, 'memory_budget_mb') else None,
+                       args.max_batch_size if getattr(args, 'max_batch_size', None) else Config.INFERENCE_MAX_BATCH_SIZE)
             else:
                 logging.error("预测需要提供 --input_file, --model_path 和 --output_dir 参数")
                 parser.print_help()
+        
+        elif args.command == "pack":
+            from data.structure_store import convert_training_dict
+            output_file = convert_training_dict(args.input_file, args.output_file)
+            logging.info(f"索引文件已生成: {output_file}")
+        
+        elif args.command == "mutscan":
+            from scripts.mutscan import run_mutscan
+            run_mutscan(args.sequence, args.model_path, args.output_dir, args.positions,
+                        args.double, args.batch_size, args.device)
+        
+        elif args.command == "serve":
+            from scripts.serve import run_server
+            from scripts.predict import create_prediction_cache
+            cache = None
+            if not args.no_cache:
+                cache = create_prediction_cache(args.cache_dir if args.cache_dir else Config.PREDICTION_CACHE_DIR)
+            run_server(args.model_path,
+                       args.host if args.host else Config.SERVE_HOST,
+                       args.port if args.port is not None else Config.SERVE_PORT,
+                       args.device, args.mc_samples, cache,
+                       args.backbone_path if args.backbone_path else Config.BACKBONE_PATH,
+                       args.attention if args.attention else Config.BACKBONE_ATTENTION,
+                       args.memory_budget_mb,
+                       args.max_batch_size if args.max_batch_size else Config.INFERENCE_MAX_BATCH_SIZE,
+                       args.max_wait_ms if args.max_wait_ms is not None else Config.SERVE_MAX_WAIT_MS,
+                       args.max_queue if args.max_queue else Config.SERVE_MAX_QUEUE,
+                       args.heads)
+        
+        elif args.command == "index":
+            from scripts.embedding_index import build_index
+            build_index(args.data_dir, args.model_path, args.output_file, args.device,
+                        args.batch_size, args.n_lists, split=args.split, cache_dir=args.cache_dir)
+        
+        elif args.command == "synth":
+            from scripts.generate_synthetic import generate_dataset
+            generate_dataset(args.output_dir, args.num_structures, args.layout, args.seed,
+                             args.length_distribution, args.mean_length, args.min_length, args.max_length,
+                             args.torsion_noise, args.missing_atom_rate, args.multi_chain_rate)
+        
+        elif args.command == "convert":
+            from scripts.convert_checkpoint import convert_head, export_backbone
+            if args.backbone:
+                export_backbone(args.backbone, args.output, args.model_location)
+            elif args.input:
+                convert_head(args.input, args.output)
+            else:
+                logging.error("convert需要提供 --input（转换预测头）或 --backbone（导出骨干网络）")
+        
+        elif args.command == "featurize":
+            from scripts.featurize import featurize
+            featurize(args.inputs, args.output_dir, cfg.TORSION_TYPES,
+                      num_workers=args.num_workers, chunk_size=args.chunk_size,
+                      output_format=args.format, resume=not args.no_resume)
     
     except Exception as e:
         print(f"\n错误: {str(e)}")
@@ -3,7 +3,11 @@
 RNA-FM-Torsion模型模块，用于RNA扭转角预测
 """
 
-from .torsion_predictor import RNATorsionPredictor
+from .torsion_predictor import RNATorsionPredictor, TorsionHead, DEFAULT_HEAD
 from .loss import AngularLoss, TotalAngularLoss
+from .embedding_index import EmbeddingIndex, KNNTorsionPredictor, build_embedding_index
+from .backbones import StandInAlphabet, StandInRNAFM, stand_in_rna_fm, load_backbone, save_backbone
 
-__all__ = ['RNATorsionPredictor', 'AngularLoss', 'TotalAngularLoss']
\ No newline at end of file
+__all__ = ['RNATorsionPredictor', 'TorsionHead', 'DEFAULT_HEAD', 'AngularLoss', 'TotalAngularLoss',
+           'EmbeddingIndex', 'KNNTorsionPredictor', 'build_embedding_index',
+           'StandInAlphabet', 'StandInRNAFM', 'stand_in_rna_fm', 'load_backbone', 'save_backbone']
\ No newline at end of file
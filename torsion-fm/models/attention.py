@@ -0,0 +1,168 @@
+# models/attention.py
+"""
+骨干网络自注意力的省内存实现
+
+RNA-FM的Transformer层总是以need_weights=True调用自注意力，
+每层都会物化[batch, heads, T, T]的注意力矩阵，长序列时内存随长度平方增长。
+这里把fm.multihead_attention.MultiheadAttention和StandInMultiheadAttention的forward
+替换为基于F.scaled_dot_product_attention的实现（不返回注意力权重）：
+
+- "sdpa": 整个序列一次调用SDPA，由PyTorch选择融合内核
+- "chunked": 按查询分块调用SDPA，任何时刻最多存在[batch, heads, chunk_size, T]的分数矩阵
+- "dense": 原始实现
+
+需要逐头注意力权重（need_head_weights，例如接触图预测）或使用增量解码等非自注意力功能时，
+仍然调用原始实现，结果与未替换时完全相同。
+"""
+
+import logging
+from functools import partial
+from contextlib import contextmanager
+
+import torch
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+ATTENTION_IMPLEMENTATIONS = ("dense", "sdpa", "chunked")
+
+
+def _is_attention_module(module):
+    """判断是否为fm/替身的多头注意力（q_proj/k_proj/v_proj/out_proj参数布局）"""
+    return all(hasattr(module, name) for name in ('q_proj', 'k_proj', 'v_proj', 'out_proj', 'num_heads', 'head_dim'))
+
+
+def _supports_fast_path(module, query, key, value, need_head_weights, kwargs):
+    if need_head_weights or key is not query or value is not query:
+        return False
+    if getattr(module, 'bias_k', None) is not None or getattr(module, 'add_zero_attn', False):
+        return False
+    return (kwargs.get('incremental_state') is None and not kwargs.get('static_kv', False)
+            and not kwargs.get('before_softmax', False))
+
+
+def _sdpa_mask(key_padding_mask, attn_mask, dtype):
+    """
+    合并key_padding_mask（[B, S]，True表示填充）和attn_mask（[T, S]，加性）为SDPA的掩码
+
+    返回:
+        mask: None、布尔掩码[B, 1, 1, S]（True表示参与注意力）或加性掩码[B, 1, T, S]
+    """
+    if attn_mask is None:
+        if key_padding_mask is None:
+            return None
+        return ~key_padding_mask.to(torch.bool)[:, None, None, :]
+    mask = attn_mask.to(dtype)[None, None]
+    if key_padding_mask is not None:
+        padding = torch.zeros(key_padding_mask.shape, dtype=dtype, device=key_padding_mask.device)
+        padding = padding.masked_fill(key_padding_mask.to(torch.bool), float("-inf"))
+        mask = mask + padding[:, None, None, :]
+    return mask
+
+
+def efficient_attention_forward(module, query, key, value, key_padding_mask=None, need_weights=True,
+                                attn_mask=None, need_head_weights=False, chunk_size=None, **kwargs):
+    """
+    替换后的注意力forward（调用约定与fm的MultiheadAttention相同，输入为[T, B, C]）
+
+    参数:
+        module: 注意力模块
+        chunk_size: 每次处理的查询数（None表示整个序列一次调用SDPA）
+        其余参数同MultiheadAttention.forward
+
+    返回:
+        attn: [T, B, C]
+        attn_weights: 快速路径下为None；回退到原始实现时与原始实现相同
+    """
+    if not _supports_fast_path(module, query, key, value, need_head_weights, kwargs):
+        return module._dense_forward(query, key, value, key_padding_mask=key_padding_mask, need_weights=need_weights,
+                                     attn_mask=attn_mask, need_head_weights=need_head_weights, **kwargs)
+
+    tgt_len, bsz, embed_dim = query.size()
+    num_heads, head_dim = module.num_heads, module.head_dim
+
+    # [T, B, C] => [B, H, T, D]
+    q = module.q_proj(query).view(tgt_len, bsz, num_heads, head_dim).permute(1, 2, 0, 3)
+    k = module.k_proj(query).view(tgt_len, bsz, num_heads, head_dim).permute(1, 2, 0, 3)
+    v = module.v_proj(query).view(tgt_len, bsz, num_heads, head_dim).permute(1, 2, 0, 3)
+
+    mask = _sdpa_mask(key_padding_mask, attn_mask, q.dtype)
+    dropout_p = module.dropout if module.training else 0.0
+    scale = getattr(module, 'scaling', head_dim ** -0.5)
+
+    if chunk_size is None or chunk_size >= tgt_len:
+        attn = F.scaled_dot_product_attention(q, k, v, attn_mask=mask, dropout_p=dropout_p, scale=scale)
+    else:
+        attn = q.new_empty(q.shape)
+        for start in range(0, tgt_len, chunk_size):
+            end = min(start + chunk_size, tgt_len)
+            chunk_mask = mask
+            if mask is not None and mask.shape[2] > 1:
+                chunk_mask = mask[:, :, start:end]
+            attn[:, :, start:end] = F.scaled_dot_product_attention(
+                q[:, :, start:end], k, v, attn_mask=chunk_mask, dropout_p=dropout_p, scale=scale)
+
+    # [B, H, T, D] => [T, B, C]
+    attn = attn.permute(2, 0, 1, 3).reshape(tgt_len, bsz, embed_dim)
+    return module.out_proj(attn), None
+
+
+def set_attention_implementation(model, implementation="dense", chunk_size=256):
+    """
+    切换骨干网络中所有自注意力模块的实现（原地修改，可以反复切换）
+
+    参数:
+        model: fm.BioBertModel或StandInRNAFM
+        implementation: ATTENTION_IMPLEMENTATIONS之一
+        chunk_size: "chunked"时每次处理的查询数
+
+    返回:
+        count: 替换的注意力模块数
+    """
+    if implementation not in ATTENTION_IMPLEMENTATIONS:
+        raise ValueError(f"未知的注意力实现: {implementation}，可选: {', '.join(ATTENTION_IMPLEMENTATIONS)}")
+    if implementation == "chunked" and chunk_size <= 0:
+        raise ValueError(f"chunk_size必须为正数: {chunk_size}")
+
+    count = 0
+    for module in model.modules():
+        if not _is_attention_module(module):
+            continue
+        # 实例属性forward覆盖类方法；先去掉之前的替换，恢复为类方法
+        module.__dict__.pop('forward', None)
+        module._dense_forward = module.forward
+        if implementation != "dense":
+            module.forward = partial(efficient_attention_forward, module,
+                                     chunk_size=chunk_size if implementation == "chunked" else None)
+        module.attention_implementation = implementation
+        module.attention_chunk_size = chunk_size
+        count += 1
+
+    if implementation != "dense":
+        logger.info(f"骨干网络的 {count} 个注意力模块使用 {implementation} 实现"
+                    + (f"（查询分块 {chunk_size}）" if implementation == "chunked" else ""))
+    return count
+
+
+def current_attention_implementation(model):
+    """
+    返回骨干网络当前的注意力实现
+
+    返回:
+        (implementation, chunk_size)；从未切换过时为("dense", None)
+    """
+    for module in model.modules():
+        if _is_attention_module(module):
+            return getattr(module, 'attention_implementation', "dense"), getattr(module, 'attention_chunk_size', None)
+    return "dense", None
+
+
+@contextmanager
+def attention_override(model, implementation, chunk_size=256):
+    """临时切换注意力实现，退出时恢复原来的实现（例如对超长序列临时使用chunked）"""
+    previous, previous_chunk = current_attention_implementation(model)
+    set_attention_implementation(model, implementation, chunk_size)
+    try:
+        yield
+    finally:
+        set_attention_implementation(model, previous, previous_chunk or chunk_size)
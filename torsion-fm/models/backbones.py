@@ -0,0 +1,444 @@
+# models/backbones.py
+"""
+骨干网络加载与随机初始化的RNA-FM替身
+
+替身模型与RNA-FM（ESM-1b结构）的接口和张量布局一致：相同的字母表与batch converter、
+逐层返回表示的forward(tokens, repr_layers, need_head_weights)、时间维在前的多头注意力，
+只是层数很少且权重随机初始化。它不需要下载预训练权重，也不依赖fm包，
+用于离线的训练/预测/服务压力测试和基准测试。替身的预测没有生物学意义。
+"""
+
+import os
+import sys
+import json
+import logging
+from argparse import Namespace
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from utils.safetensors_io import is_safetensors, save_safetensors, load_safetensors
+from utils.prediction_cache import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# 与fm.Alphabet.from_architecture("ESM-1b", theme="rna")相同的词表
+RNA_TOKENS = ['A', 'C', 'G', 'U', 'R', 'Y', 'K', 'M', 'S', 'W', 'B', 'D', 'H', 'V', 'N', '-']
+PREPEND_TOKENS = ('<cls>', '<pad>', '<eos>', '<unk>')
+APPEND_TOKENS = ('<mask>',)
+
+BACKBONES = ("rna_fm_t12", "stand_in")
+
+
+class StandInAlphabet:
+    """
+    RNA-FM字母表的替身（<cls>=0, <pad>=1, <eos>=2, <unk>=3，词表补齐到8的倍数后追加<mask>）
+    """
+
+    def __init__(self):
+        self.prepend_bos = True
+        self.append_eos = True
+        self.k_mer = 1
+        self.all_toks = list(PREPEND_TOKENS) + RNA_TOKENS
+        for i in range((8 - (len(self.all_toks) % 8)) % 8):
+            self.all_toks.append(f"<null_{i + 1}>")
+        self.all_toks.extend(APPEND_TOKENS)
+        self.tok_to_idx = {tok: i for i, tok in enumerate(self.all_toks)}
+
+        self.unk_idx = self.tok_to_idx['<unk>']
+        self.padding_idx = self.get_idx('<pad>')
+        self.cls_idx = self.get_idx('<cls>')
+        self.mask_idx = self.get_idx('<mask>')
+        self.eos_idx = self.get_idx('<eos>')
+
+    def __len__(self):
+        return len(self.all_toks)
+
+    def get_idx(self, tok):
+        return self.tok_to_idx.get(tok, self.unk_idx)
+
+    def get_tok(self, ind):
+        return self.all_toks[ind]
+
+    def get_batch_converter(self):
+        return StandInBatchConverter(self)
+
+
+class StandInBatchConverter:
+    """把[(label, sequence), ...]转换为(labels, strs, tokens)，首尾加<cls>/<eos>，用<pad>填充"""
+
+    def __init__(self, alphabet):
+        self.alphabet = alphabet
+
+    def __call__(self, raw_batch):
+        max_len = max(len(seq) for _, seq in raw_batch)
+        tokens = torch.full((len(raw_batch), max_len + 2), self.alphabet.padding_idx, dtype=torch.int64)
+        labels = []
+        strs = []
+        for i, (label, seq) in enumerate(raw_batch):
+            labels.append(label)
+            strs.append(seq)
+            tokens[i, 0] = self.alphabet.cls_idx
+            tokens[i, 1:len(seq) + 1] = torch.tensor([self.alphabet.get_idx(s) for s in seq], dtype=torch.int64)
+            tokens[i, len(seq) + 1] = self.alphabet.eos_idx
+        return labels, strs, tokens
+
+
+class StandInMultiheadAttention(nn.Module):
+    """
+    与fm.multihead_attention.MultiheadAttention相同参数布局（q_proj/k_proj/v_proj/out_proj）
+    和调用约定（输入为[T, B, C]，key_padding_mask中True表示填充）的自注意力
+    """
+
+    def __init__(self, embed_dim, num_heads, dropout=0.0):
+        super().__init__()
+        self.embed_dim = embed_dim
+        self.num_heads = num_heads
+        self.dropout = dropout
+        self.head_dim = embed_dim // num_heads
+        assert self.head_dim * num_heads == embed_dim, "embed_dim必须能被num_heads整除"
+        self.scaling = self.head_dim ** -0.5
+
+        self.k_proj = nn.Linear(embed_dim, embed_dim)
+        self.v_proj = nn.Linear(embed_dim, embed_dim)
+        self.q_proj = nn.Linear(embed_dim, embed_dim)
+        self.out_proj = nn.Linear(embed_dim, embed_dim)
+
+    def forward(self, query, key, value, key_padding_mask=None, need_weights=True,
+                attn_mask=None, need_head_weights=False):
+        """
+        Returns:
+            attn: [T, B, C]
+            attn_weights: need_head_weights时为[H, B, T, S]；need_weights时为头平均后的[B, T, S]；否则为None
+        """
+        if need_head_weights:
+            need_weights = True
+        tgt_len, bsz, embed_dim = query.size()
+
+        q = self.q_proj(query) * self.scaling
+        k = self.k_proj(key)
+        v = self.v_proj(value)
+        q = q.contiguous().view(tgt_len, bsz * self.num_heads, self.head_dim).transpose(0, 1)
+        k = k.contiguous().view(-1, bsz * self.num_heads, self.head_dim).transpose(0, 1)
+        v = v.contiguous().view(-1, bsz * self.num_heads, self.head_dim).transpose(0, 1)
+        src_len = k.size(1)
+
+        attn_weights = torch.bmm(q, k.transpose(1, 2))
+        if attn_mask is not None:
+            attn_weights += attn_mask.unsqueeze(0)
+        if key_padding_mask is not None:
+            attn_weights = attn_weights.view(bsz, self.num_heads, tgt_len, src_len)
+            attn_weights = attn_weights.masked_fill(key_padding_mask.unsqueeze(1).unsqueeze(2).to(torch.bool), float("-inf"))
+            attn_weights = attn_weights.view(bsz * self.num_heads, tgt_len, src_len)
+
+        attn_weights = F.softmax(attn_weights.float(), dim=-1).type_as(attn_weights)
+        attn_probs = F.dropout(attn_weights, p=self.dropout, training=self.training)
+        attn = torch.bmm(attn_probs, v)
+        attn = attn.transpose(0, 1).contiguous().view(tgt_len, bsz, embed_dim)
+        attn = self.out_proj(attn)
+
+        if not need_weights:
+            return attn, None
+        attn_weights = attn_weights.view(bsz, self.num_heads, tgt_len, src_len).transpose(1, 0)
+        if not need_head_weights:
+            attn_weights = attn_weights.mean(dim=0)
+        return attn, attn_weights
+
+
+class StandInTransformerLayer(nn.Module):
+    """pre-LayerNorm的Transformer层（与fm.modules.TransformerLayer结构相同）"""
+
+    def __init__(self, embed_dim, ffn_embed_dim, attention_heads):
+        super().__init__()
+        self.self_attn = StandInMultiheadAttention(embed_dim, attention_heads)
+        self.self_attn_layer_norm = nn.LayerNorm(embed_dim)
+        self.fc1 = nn.Linear(embed_dim, ffn_embed_dim)
+        self.fc2 = nn.Linear(ffn_embed_dim, embed_dim)
+        self.final_layer_norm = nn.LayerNorm(embed_dim)
+
+    def forward(self, x, self_attn_mask=None, self_attn_padding_mask=None, need_head_weights=False):
+        residual = x
+        x = self.self_attn_layer_norm(x)
+        x, attn = self.self_attn(
+            query=x,
+            key=x,
+            value=x,
+            key_padding_mask=self_attn_padding_mask,
+            need_weights=True,
+            need_head_weights=need_head_weights,
+            attn_mask=self_attn_mask,
+        )
+        x = residual + x
+
+        residual = x
+        x = self.final_layer_norm(x)
+        x = F.gelu(self.fc1(x))
+        x = self.fc2(x)
+        x = residual + x
+        return x, attn
+
+
+class StandInRNAFM(nn.Module):
+    """
+    随机初始化的小型RNA-FM替身
+
+    embed_dim与RNA-FM相同（640），这样回归头可以不加修改地使用。
+    RNA-FM有12层，调用方固定请求第12层表示；替身层数较少时，
+    超过num_layers的层号返回最后一层（经过emb_layer_norm_after）的表示。
+    """
+
+    backbone_name = "stand_in"
+
+    def __init__(self, alphabet, num_layers=2, embed_dim=640, ffn_embed_dim=1280, attention_heads=8, max_positions=1024):
+        super().__init__()
+        self.alphabet_size = len(alphabet)
+        self.padding_idx = alphabet.padding_idx
+        self.num_layers = num_layers
+        self.embed_dim = embed_dim
+        self.ffn_embed_dim = ffn_embed_dim
+        self.attention_heads = attention_heads
+        self.max_positions = max_positions
+
+        self.embed_tokens = nn.Embedding(self.alphabet_size, embed_dim, padding_idx=self.padding_idx)
+        # 与LearnedPositionalEmbedding相同：位置从padding_idx+1开始，填充位置映射到padding_idx
+        self.embed_positions = nn.Embedding(max_positions + self.padding_idx + 1, embed_dim, padding_idx=self.padding_idx)
+        self.layers = nn.ModuleList([
+            StandInTransformerLayer(embed_dim, ffn_embed_dim, attention_heads) for _ in range(num_layers)
+        ])
+        self.emb_layer_norm_after = nn.LayerNorm(embed_dim)
+
+        for module in self.modules():
+            if isinstance(module, (nn.Linear, nn.Embedding)):
+                nn.init.normal_(module.weight, std=0.02)
+            if isinstance(module, nn.Linear) and module.bias is not None:
+                nn.init.zeros_(module.bias)
+        with torch.no_grad():
+            self.embed_tokens.weight[self.padding_idx].zero_()
+            self.embed_positions.weight[self.padding_idx].zero_()
+
+    def _positions(self, tokens):
+        mask = tokens.ne(self.padding_idx).long()
+        return torch.cumsum(mask, dim=1) * mask + self.padding_idx
+
+    def forward(self, tokens, repr_layers=[], need_head_weights=False, return_contacts=False):
+        padding_mask = tokens.eq(self.padding_idx)  # [B, T]
+        x = self.embed_tokens(tokens) + self.embed_positions(self._positions(tokens))
+        x = x * (1 - padding_mask.unsqueeze(-1).type_as(x))
+
+        repr_layers = set(repr_layers)
+        hidden_representations = {}
+        if 0 in repr_layers:
+            hidden_representations[0] = x
+
+        attn_weights = []
+        x = x.transpose(0, 1)  # [B, T, E] => [T, B, E]
+        if not padding_mask.any():
+            padding_mask = None
+
+        for layer_idx, layer in enumerate(self.layers):
+            x, attn = layer(x, self_attn_padding_mask=padding_mask, need_head_weights=need_head_weights)
+            if (layer_idx + 1) in repr_layers:
+                hidden_representations[layer_idx + 1] = x.transpose(0, 1)
+            if need_head_weights:
+                attn_weights.append(attn.transpose(1, 0))
+
+        x = self.emb_layer_norm_after(x).transpose(0, 1)  # [T, B, E] => [B, T, E]
+        # 最后一层（以及替身中不存在的更深层）返回经过层归一化的表示
+        for layer in repr_layers:
+            if layer >= self.num_layers:
+                hidden_representations[layer] = x
+
+        result = {"logits": F.linear(x, self.embed_tokens.weight), "representations": hidden_representations}
+        if need_head_weights:
+            result["attentions"] = torch.stack(attn_weights, 1)
+        return result
+
+
+def stand_in_rna_fm(num_layers=2, embed_dim=640, ffn_embed_dim=1280, attention_heads=8, seed=0):
+    """
+    构建随机初始化的RNA-FM替身（与fm.pretrained.rna_fm_t12的返回值形式相同）
+
+    相同的seed总是得到相同的权重，因此用替身训练的回归头在预测时可以重建同一个骨干网络。
+
+    参数:
+        num_layers: Transformer层数
+        embed_dim: 嵌入维度（回归头要求640）
+        ffn_embed_dim: 前馈层维度
+        attention_heads: 注意力头数
+        seed: 权重初始化的随机种子
+
+    返回:
+        model: 处于评估模式的StandInRNAFM
+        alphabet: StandInAlphabet
+    """
+    alphabet = StandInAlphabet()
+    # 使用独立的随机数生成器初始化，不影响调用方的全局随机状态
+    with torch.random.fork_rng(devices=[]):
+        torch.manual_seed(seed)
+        model = StandInRNAFM(alphabet, num_layers, embed_dim, ffn_embed_dim, attention_heads)
+    return model.eval(), alphabet
+
+
+def import_fm():
+    """
+    导入fm包（只在真正加载预训练RNA-FM时调用）
+
+    未安装时依次尝试项目旁边的fm、RNA-FM/fm目录。
+
+    返回:
+        fm: fm模块
+    """
+    try:
+        import fm
+        return fm
+    except ImportError:
+        pass
+
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    possible_paths = [
+        os.path.join(project_root, "fm"),
+        os.path.join(project_root, "RNA-FM", "fm"),
+        os.path.join(os.path.dirname(project_root), "RNA-FM", "fm")
+    ]
+    for path in possible_paths:
+        if os.path.exists(path):
+            sys.path.append(os.path.dirname(path))
+            try:
+                import fm
+                return fm
+            except ImportError:
+                continue
+
+    raise ImportError(
+        "无法导入fm模块。请确保RNA-FM已正确安装，或在环境变量中设置正确的路径。"
+        "您可以尝试: pip install rna-fm 或手动指定RNA-FM的路径。"
+    )
+
+
+BACKBONE_FORMAT_VERSION = 1
+
+
+def backbone_config(model):
+    """
+    返回重建骨干网络结构所需的参数
+
+    参数:
+        model: StandInRNAFM或fm.BioBertModel
+
+    返回:
+        config: 可JSON序列化的参数字典
+    """
+    if isinstance(model, StandInRNAFM):
+        return {
+            'num_layers': model.num_layers,
+            'embed_dim': model.embed_dim,
+            'ffn_embed_dim': model.ffn_embed_dim,
+            'attention_heads': model.attention_heads,
+            'max_positions': model.max_positions,
+        }
+    # fm.BioBertModel的结构完全由args决定，只保留可序列化的取值
+    return {key: value for key, value in vars(model.args).items()
+            if isinstance(value, (bool, int, float, str)) or value is None}
+
+
+def save_backbone(model, path):
+    """
+    以safetensors格式导出骨干网络权重，结构参数写入头部元数据
+
+    导出的文件可以通过load_backbone(name, model_location=path)以mmap方式加载，
+    同一主机上的多个进程共享权重所在的页缓存。
+
+    参数:
+        model: load_backbone()返回的骨干网络
+        path: 输出的.safetensors文件路径
+    """
+    name = getattr(model, 'backbone_name', "rna_fm_t12")
+    save_safetensors(model.state_dict(), path, metadata={
+        'kind': "backbone",
+        'format_version': BACKBONE_FORMAT_VERSION,
+        'backbone': name,
+        'config': json.dumps(backbone_config(model)),
+    })
+    logger.info(f"骨干网络 {name} 已导出到 {path}")
+
+
+def load_backbone_safetensors(path, use_mmap=True):
+    """
+    从save_backbone()导出的文件加载骨干网络
+
+    在meta设备上构建模型（不分配内存、不运行随机初始化），再直接以文件映射中的张量替换参数
+    （load_state_dict(assign=True)）。torch.device上下文只作用于当前线程，
+    其他线程同时构建的模块（例如服务中加载的预测头）不受影响。
+
+    参数:
+        path: .safetensors文件路径
+        use_mmap: 是否零拷贝映射（否则读入进程内存）
+
+    返回:
+        model: 处于评估模式的骨干网络
+        alphabet: 对应的字母表
+    """
+    tensors, metadata = load_safetensors(path, use_mmap)
+    if metadata.get('kind') != "backbone":
+        raise ValueError(f"{path} 不是骨干网络权重文件")
+    if int(metadata.get('format_version', 1)) > BACKBONE_FORMAT_VERSION:
+        raise ValueError(f"{path} 的格式版本 {metadata['format_version']} 高于当前支持的 {BACKBONE_FORMAT_VERSION}")
+
+    name = metadata['backbone']
+    config = json.loads(metadata['config'])
+    if name == "stand_in":
+        alphabet = StandInAlphabet()
+        with torch.device("meta"):
+            model = StandInRNAFM(alphabet, **config)
+    elif name == "rna_fm_t12":
+        fm = import_fm()
+        alphabet = fm.Alphabet.from_architecture(config['arch'], theme="rna")
+        with torch.device("meta"):
+            model = fm.BioBertModel(Namespace(**config), alphabet)
+    else:
+        raise ValueError(f"未知的骨干网络: {name}，可选: {', '.join(BACKBONES)}")
+
+    model.load_state_dict(tensors, strict=True, assign=True)
+    remaining = [key for key, tensor in list(model.named_parameters()) + list(model.named_buffers()) if tensor.is_meta]
+    if remaining:
+        raise ValueError(f"{path} 缺少以下张量: {', '.join(remaining)}")
+    model.backbone_weights = file_fingerprint(path)
+    logger.info(f"以{'mmap' if use_mmap else '内存'}方式加载骨干网络 {name}: {path}")
+    return model.eval(), alphabet
+
+
+def load_backbone(name="rna_fm_t12", model_location=None):
+    """
+    按名称加载骨干网络
+
+    参数:
+        name: "rna_fm_t12"（预训练RNA-FM）或"stand_in"（随机初始化的替身）
+        model_location: 权重的本地路径（可选）；.safetensors文件（save_backbone()导出）以mmap方式加载，
+                        替身也可以由此加载导出的权重
+
+    返回:
+        model: 骨干网络
+        alphabet: 对应的字母表
+    """
+    if model_location is not None and is_safetensors(model_location):
+        model, alphabet = load_backbone_safetensors(model_location)
+        loaded_name = getattr(model, 'backbone_name', "rna_fm_t12")
+        if loaded_name != name:
+            raise ValueError(f"权重文件 {model_location} 属于骨干网络 {loaded_name}，而请求的是 {name}")
+        return model, alphabet
+
+    if name == "stand_in":
+        logger.warning("使用随机初始化的RNA-FM替身作为骨干网络，预测结果仅用于测试")
+        model, alphabet = stand_in_rna_fm()
+        # 替身的权重完全由默认参数和种子决定
+        model.backbone_weights = "stand_in:seed=0"
+        return model, alphabet
+    if name != "rna_fm_t12":
+        raise ValueError(f"未知的骨干网络: {name}，可选: {', '.join(BACKBONES)}")
+
+    fm = import_fm()
+    model, alphabet = fm.pretrained.rna_fm_t12(model_location=model_location)
+    # 未指定路径时由fm包下载官方预训练权重
+    model.backbone_weights = file_fingerprint(model_location) if model_location else "pretrained"
+    return model, alphabet
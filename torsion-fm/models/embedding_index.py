@@ -0,0 +1,399 @@
+"""
+RNA-FM嵌入相似度索引
+
+基于RNATorsionPredictor第12层输出构建两级索引:
+1. 链级索引：每条链的平均池化嵌入，用于查找相似链和近重复检测
+2. 残基级索引：逐残基嵌入及其真实扭转角，用于kNN扭转角预测
+
+检索后端只依赖NumPy，支持精确搜索（内积）和IVF倒排搜索（球面k-means聚类后只扫描最近的若干簇）。
+"""
+
+import logging
+import numpy as np
+import torch
+
+from utils.angle_utils import circular_statistics
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(vectors):
+    """L2归一化，使内积等价于余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorSearch:
+    """
+    基于NumPy的余弦相似度检索后端
+
+    n_lists为0时使用精确搜索；否则先用球面k-means将向量划分为n_lists个簇，
+    查询时只在最近的n_probe个簇中做精确比较。
+    """
+
+    # 分块大小：一块相似度矩阵为query_block x vector_block个float32（约16MB）
+    query_block = 256
+    vector_block = 16384
+
+    def __init__(self, vectors, n_lists=0, n_probe=8, n_iter=10, seed=0):
+        """
+        构建检索后端
+
+        参数:
+            vectors: 待检索的向量 [N, D]
+            n_lists: IVF簇数量，0表示精确搜索
+            n_probe: 查询时扫描的簇数量
+            n_iter: k-means迭代次数
+            seed: k-means初始化的随机种子
+        """
+        self.vectors = _normalize(vectors)
+        self.n_probe = n_probe
+        self.centroids = None
+        self.lists = None
+
+        if n_lists and len(self.vectors) > n_lists:
+            self._train_ivf(n_lists, n_iter, seed)
+
+    def _train_ivf(self, n_lists, n_iter, seed):
+        """球面k-means聚类并建立倒排列表"""
+        rng = np.random.default_rng(seed)
+        centroids = self.vectors[rng.choice(len(self.vectors), n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignment = np.argmax(self.vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, self.vectors)
+            counts = np.bincount(assignment, minlength=n_lists)
+            # 空簇保留原中心
+            centroids = np.where(counts[:, None] > 0, _normalize(sums), centroids)
+
+        assignment = np.argmax(self.vectors @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        self.centroids = centroids
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(n_lists)]
+
+    @classmethod
+    def from_state(cls, vectors, centroids, lists, n_probe):
+        """从保存的状态恢复（向量已归一化）"""
+        search = cls.__new__(cls)
+        search.vectors = vectors
+        search.n_probe = n_probe
+        search.centroids = centroids
+        search.lists = lists
+        return search
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries, k=10):
+        """
+        检索最相似的k个向量
+
+        查询和候选向量都按固定大小分块计算相似度，每块用argpartition更新逐查询的top-k，
+        相似度矩阵的内存不随查询数和库大小增长。
+
+        参数:
+            queries: 查询向量 [Q, D]
+            k: 返回的近邻数量
+
+        返回:
+            scores: 余弦相似度 [Q, k]
+            indices: 近邻索引 [Q, k]（不足k个时以-1填充）
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        k = min(k, len(self.vectors))
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        if k == 0:
+            return scores, indices
+
+        if self.centroids is None:
+            self._scan(queries, np.arange(len(queries)), np.arange(len(self.vectors)), scores, indices)
+        else:
+            # 按簇分组：每个簇只与探测到它的查询做一次矩阵乘法
+            probe = np.argpartition(-(queries @ self.centroids.T), min(self.n_probe, len(self.centroids)) - 1,
+                                    axis=1)[:, :self.n_probe]
+            query_rows = np.repeat(np.arange(len(queries)), probe.shape[1])
+            probed = probe.ravel()
+            order = np.argsort(probed, kind='stable')
+            query_rows, probed = query_rows[order], probed[order]
+            bounds = np.searchsorted(probed, np.arange(len(self.centroids) + 1))
+            for j in range(len(self.centroids)):
+                rows = query_rows[bounds[j]:bounds[j + 1]]
+                if len(rows) and len(self.lists[j]):
+                    self._scan(queries, rows, self.lists[j], scores, indices)
+
+        order = np.argsort(-scores, axis=1, kind='stable')
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    def _scan(self, queries, rows, candidates, scores, indices):
+        """将rows行查询与candidates逐块比较，原地更新scores/indices中的top-k"""
+        k = scores.shape[1]
+        for q in range(0, len(rows), self.query_block):
+            block_rows = rows[q:q + self.query_block]
+            block_queries = queries[block_rows]
+            best_scores, best_indices = scores[block_rows], indices[block_rows]
+            for v in range(0, len(candidates), self.vector_block):
+                block = candidates[v:v + self.vector_block]
+                similarity = block_queries @ self.vectors[block].T
+                if len(block) > k:
+                    part = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+                    similarity, block = np.take_along_axis(similarity, part, axis=1), block[part]
+                else:
+                    block = np.broadcast_to(block, similarity.shape)
+                merged_scores = np.concatenate([best_scores, similarity], axis=1)
+                merged_indices = np.concatenate([best_indices, block], axis=1)
+                part = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(merged_scores, part, axis=1)
+                best_indices = np.take_along_axis(merged_indices, part, axis=1)
+            scores[block_rows] = best_scores
+            indices[block_rows] = best_indices
+
+
+class EmbeddingIndex:
+    """
+    训练集RNA-FM嵌入索引
+
+    同时保存链级平均池化嵌入和残基级嵌入，以及残基对应的真实扭转角和掩码。
+    """
+
+    def __init__(self, chain_ids, chain_embeddings, residue_embeddings, residue_chain,
+                 residue_angles, residue_masks, torsion_types, n_lists=0, n_probe=8):
+        """
+        初始化索引
+
+        参数:
+            chain_ids: 链标识列表 [(pdb_id, chain_id), ...]
+            chain_embeddings: 链级平均池化嵌入 [N_chain, D]
+            residue_embeddings: 残基级嵌入 [N_res, D]
+            residue_chain: 每个残基所属的链索引 [N_res]
+            residue_angles: 残基的真实扭转角（度） [N_res, K]
+            residue_masks: 残基扭转角掩码 [N_res, K]
+            torsion_types: 扭转角类型列表（K个）
+            n_lists: 残基级IVF簇数量，0表示精确搜索
+            n_probe: 查询时扫描的簇数量
+        """
+        self.chain_ids = [tuple(chain_id) for chain_id in chain_ids]
+        self.torsion_types = list(torsion_types)
+        self.residue_chain = np.asarray(residue_chain, dtype=np.int64)
+        self.residue_angles = np.asarray(residue_angles, dtype=np.float32)
+        self.residue_masks = np.asarray(residue_masks, dtype=np.float32)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+
+        # 链数量通常较少，链级检索始终使用精确搜索
+        self.chain_search = VectorSearch(chain_embeddings)
+        self.residue_search = VectorSearch(residue_embeddings, n_lists=n_lists, n_probe=n_probe)
+        logger.info(f"嵌入索引: {len(self.chain_ids)} 条链, {len(self.residue_chain)} 个残基, "
+                    f"{'IVF(' + str(n_lists) + ')' if self.residue_search.centroids is not None else '精确'}搜索")
+
+    def query_chains(self, embeddings, k=10):
+        """
+        查找与查询序列最相似的训练链
+
+        参数:
+            embeddings: 查询序列的逐残基嵌入 [L, D]，或已池化的嵌入 [D]
+            k: 返回的链数量
+
+        返回:
+            list: [(pdb_id, chain_id, 余弦相似度), ...]，按相似度降序
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        pooled = embeddings.mean(axis=0) if embeddings.ndim == 2 else embeddings
+        scores, indices = self.chain_search.search(pooled[None, :], k)
+        return [
+            (*self.chain_ids[index], float(score))
+            for score, index in zip(scores[0], indices[0]) if index >= 0
+        ]
+
+    def find_near_duplicates(self, embeddings, threshold=0.99, k=10):
+        """
+        近重复检测：返回相似度不低于阈值的训练链
+
+        参数:
+            embeddings: 查询序列的逐残基嵌入 [L, D]
+            threshold: 余弦相似度阈值
+            k: 最多检查的候选链数量
+
+        返回:
+            list: [(pdb_id, chain_id, 余弦相似度), ...]
+        """
+        return [hit for hit in self.query_chains(embeddings, k) if hit[2] >= threshold]
+
+    def query_residues(self, embeddings, k=10):
+        """
+        残基级近邻检索
+
+        参数:
+            embeddings: 查询残基嵌入 [L, D]
+            k: 近邻数量
+
+        返回:
+            scores: [L, k]
+            indices: [L, k]
+        """
+        return self.residue_search.search(embeddings, k)
+
+    def save(self, path):
+        """保存索引到.npz文件"""
+        lists = self.residue_search.lists
+        np.savez(
+            path,
+            chain_ids=np.array(self.chain_ids, dtype=str).reshape(-1, 2),
+            chain_embeddings=self.chain_search.vectors,
+            residue_embeddings=self.residue_search.vectors,
+            residue_chain=self.residue_chain,
+            residue_angles=self.residue_angles,
+            residue_masks=self.residue_masks,
+            torsion_types=np.array(self.torsion_types, dtype=str),
+            n_probe=np.array(self.n_probe),
+            centroids=self.residue_search.centroids if lists is not None else np.zeros((0, 0), dtype=np.float32),
+            list_offsets=np.cumsum([0] + [len(l) for l in lists]) if lists is not None else np.zeros(0, dtype=np.int64),
+            list_members=np.concatenate(lists) if lists is not None else np.zeros(0, dtype=np.int64),
+        )
+        logger.info(f"嵌入索引已保存到 {path}")
+
+    @classmethod
+    def load(cls, path):
+        """从.npz文件加载索引（不重新训练IVF）"""
+        data = np.load(path)
+        index = cls.__new__(cls)
+        index.chain_ids = [tuple(row) for row in data['chain_ids'].tolist()]
+        index.torsion_types = data['torsion_types'].tolist()
+        index.residue_chain = data['residue_chain']
+        index.residue_angles = data['residue_angles']
+        index.residue_masks = data['residue_masks']
+        index.n_probe = int(data['n_probe'])
+        index.chain_search = VectorSearch.from_state(data['chain_embeddings'], None, None, index.n_probe)
+
+        offsets = data['list_offsets']
+        if len(offsets) > 0:
+            members = data['list_members']
+            lists = [members[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+            index.residue_search = VectorSearch.from_state(data['residue_embeddings'], data['centroids'], lists, index.n_probe)
+            index.n_lists = len(lists)
+        else:
+            index.residue_search = VectorSearch.from_state(data['residue_embeddings'], None, None, index.n_probe)
+            index.n_lists = 0
+        logger.info(f"从 {path} 加载了嵌入索引: {len(index.chain_ids)} 条链, {len(index.residue_chain)} 个残基")
+        return index
+
+
+class KNNTorsionPredictor:
+    """
+    kNN扭转角预测器
+
+    对查询序列的每个残基，在残基级索引中检索k个最近邻，按相似度加权对近邻的
+    真实扭转角取圆形均值（缺失的角度通过掩码排除）。不需要运行回归头。
+    """
+
+    def __init__(self, index, k=10, min_similarity=0.0):
+        """
+        初始化
+
+        参数:
+            index: EmbeddingIndex对象
+            k: 近邻数量
+            min_similarity: 参与投票的最低余弦相似度
+        """
+        self.index = index
+        self.k = k
+        self.min_similarity = min_similarity
+
+    def predict(self, embeddings):
+        """
+        预测单条序列的扭转角
+
+        参数:
+            embeddings: 查询序列的逐残基嵌入 [L, D]
+
+        返回:
+            predictions: 字典，键为扭转角类型，值为预测角度（度） [L]；没有满足min_similarity且
+                         该角度有效的近邻时为NaN
+            confidence: 字典，键为扭转角类型，值为平均合成向量长度 [L]（近邻角度越一致越接近1，无近邻时为0）
+        """
+        if isinstance(embeddings, torch.Tensor):
+            embeddings = embeddings.detach().cpu().numpy()
+        scores, indices = self.index.query_residues(embeddings, self.k)
+
+        valid = (indices >= 0) & (scores >= self.min_similarity)
+        safe_indices = np.where(valid, indices, 0)
+        weights = np.where(valid, np.maximum(scores, 0.0), 0.0)  # [L, k]
+
+        neighbor_angles = self.index.residue_angles[safe_indices]  # [L, k, K]
+        neighbor_masks = self.index.residue_masks[safe_indices]    # [L, k, K]
+        vote_weights = weights[:, :, None] * neighbor_masks
+        mean, resultant = circular_statistics(neighbor_angles, vote_weights, axis=1)
+        mean = np.where(vote_weights.sum(axis=1) > 0, mean, np.nan)
+
+        predictions = {}
+        confidence = {}
+        for i, angle_name in enumerate(self.index.torsion_types):
+            predictions[angle_name] = mean[:, i].astype(np.float32)
+            confidence[angle_name] = resultant[:, i].astype(np.float32)
+        return predictions, confidence
+
+
+def build_embedding_index(model, data_loader, device, torsion_types, n_lists=0, n_probe=8):
+    """
+    从训练数据构建嵌入索引
+
+    参数:
+        model: RNATorsionPredictor模型
+        data_loader: 训练集数据加载器（collate_fn输出的批次）
+        device: 设备
+        torsion_types: 扭转角类型列表
+        n_lists: 残基级IVF簇数量，0表示精确搜索
+        n_probe: 查询时扫描的簇数量
+
+    返回:
+        index: EmbeddingIndex对象
+    """
+    model.eval()
+    chain_ids = []
+    chain_embeddings = []
+    residue_embeddings = []
+    residue_chain = []
+    residue_angles = []
+    residue_masks = []
+
+    with torch.no_grad():
+        for batch in data_loader:
+            embeddings = model.embed(batch['tokens'].to(device)).float().cpu().numpy()
+
+            for i, sequence in enumerate(batch['sequences']):
+                length = min(len(sequence), embeddings.shape[1])
+                if length == 0:
+                    continue
+                emb = embeddings[i, :length]
+
+                angles = np.zeros((length, len(torsion_types)), dtype=np.float32)
+                masks = np.zeros((length, len(torsion_types)), dtype=np.float32)
+                for j, angle_name in enumerate(torsion_types):
+                    if angle_name in batch['angles']:
+                        n = min(length, batch['angles'][angle_name].shape[1])
+                        angles[:n, j] = batch['angles'][angle_name][i, :n].numpy()
+                        masks[:n, j] = batch['masks'][angle_name][i, :n].numpy()
+
+                residue_chain.append(np.full(length, len(chain_ids), dtype=np.int64))
+                chain_ids.append((batch['pdb_ids'][i], batch['chain_ids'][i]))
+                chain_embeddings.append(emb.mean(axis=0))
+                residue_embeddings.append(emb)
+                residue_angles.append(angles)
+                residue_masks.append(masks)
+
+    if not chain_ids:
+        raise ValueError("数据集为空，无法构建嵌入索引")
+
+    return EmbeddingIndex(
+        chain_ids,
+        np.stack(chain_embeddings),
+        np.concatenate(residue_embeddings),
+        np.concatenate(residue_chain),
+        np.concatenate(residue_angles),
+        np.concatenate(residue_masks),
+        torsion_types,
+        n_lists=n_lists,
+        n_probe=n_probe
+    )
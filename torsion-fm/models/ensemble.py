@@ -0,0 +1,113 @@
+# models/ensemble.py
+"""
+多检查点集成推理
+
+多个回归头检查点（不同随机种子或超参数训练得到）共享同一个RNA-FM骨干网络：
+每个批次只运行一次RNA-FM，所有成员在同一份嵌入上计算，
+再按圆形统计合并为圆形均值预测和圆形方差不确定度。
+"""
+
+import logging
+import torch
+import torch.nn as nn
+
+from .torsion_predictor import RNATorsionPredictor, load_checkpoint
+from utils.angle_utils import circular_mean_resultant
+
+logger = logging.getLogger(__name__)
+
+
+class TorsionEnsemble(nn.Module):
+    """
+    共享骨干网络的扭转角预测集成
+
+    各成员的扭转角类型可以不同，每种扭转角只在预测它的成员之间合并。
+    """
+
+    def __init__(self, members):
+        """
+        初始化集成模型
+
+        参数:
+            members: RNATorsionPredictor列表，必须共享同一个RNA-FM模型对象
+        """
+        super(TorsionEnsemble, self).__init__()
+        if not members:
+            raise ValueError("集成模型至少需要一个成员")
+        if any(member.rna_fm is not members[0].rna_fm for member in members):
+            raise ValueError("集成成员必须共享同一个RNA-FM模型对象")
+
+        self.members = nn.ModuleList(members)
+        self.rna_fm = members[0].rna_fm
+        self.alphabet = members[0].alphabet
+
+        # 按成员出现的顺序合并扭转角类型
+        self.torsion_types = []
+        for member in members:
+            for torsion_type in member.torsion_types:
+                if torsion_type not in self.torsion_types:
+                    self.torsion_types.append(torsion_type)
+
+    @classmethod
+    def from_checkpoints(cls, paths, rna_fm_model, alphabet):
+        """
+        从多个检查点构建集成模型
+
+        参数:
+            paths: 检查点路径列表（.pth或.safetensors）
+            rna_fm_model: 所有成员共享的RNA-FM模型对象
+            alphabet: RNA-FM字母表
+
+        返回:
+            ensemble: TorsionEnsemble
+        """
+        members = []
+        backbones = set()
+        for path in paths:
+            checkpoint = load_checkpoint(path)
+            backbones.add(checkpoint.get('backbone', "rna_fm_t12"))
+            members.append(RNATorsionPredictor.from_checkpoint(checkpoint, rna_fm_model, alphabet))
+            logger.info(f"加载集成成员: {path}（扭转角: {checkpoint['torsion_types']}）")
+        if len(backbones) > 1:
+            raise ValueError(f"集成成员使用了不同的骨干网络: {sorted(backbones)}")
+        return cls(members)
+
+    def forward(self, tokens):
+        """
+        前向传播（RNA-FM只运行一次）
+
+        参数:
+            tokens: 输入的RNA序列token张量 [batch_size, seq_len]
+
+        返回:
+            predictions: 字典，键为扭转角类型，值为圆形均值角度 [batch_size, seq_len-2]
+            uncertainty: 字典，键为扭转角类型，值为{'circular_variance': [batch_size, seq_len-2]}
+        """
+        embeddings = self.members[0].embed(tokens)
+        return self.predict_from_embeddings(embeddings)
+
+    def embed(self, tokens):
+        """使用共享的RNA-FM提取逐残基表示"""
+        return self.members[0].embed(tokens)
+
+    def predict_from_embeddings(self, embeddings):
+        """
+        在同一份嵌入上运行所有成员并合并
+
+        参数:
+            embeddings: embed()的输出 [batch_size, seq_len-2, embed_dim]
+
+        返回:
+            同forward()
+        """
+        member_predictions = [member.predict_from_embeddings(embeddings)[0] for member in self.members]
+
+        predictions = {}
+        uncertainty = {}
+        for torsion_type in self.torsion_types:
+            angles = torch.stack([p[torsion_type] for p in member_predictions if torsion_type in p])  # [M, B, L]
+            mean, resultant_length = circular_mean_resultant(angles, dim=0)
+            predictions[torsion_type] = mean
+            uncertainty[torsion_type] = {'circular_variance': 1.0 - resultant_length}
+
+        return predictions, uncertainty
@@ -24,7 +24,7 @@ class AngularLoss(nn.Module):
         super(AngularLoss, self).__init__()
         self.weight = weight
     
-    def forward(self, sin_cos_pred, angle_target, mask=None):
+    def forward(self, sin_cos_pred, angle_target, mask=None, normalizer=None):
         """
         计算角度损失
         
@@ -32,6 +32,8 @@ class AngularLoss(nn.Module):
             sin_cos_pred: 预测的sin和cos值 [batch_size, seq_len, 2]
             angle_target: 目标角度（度） [batch_size, seq_len]
             mask: 掩码张量，1表示有效值，0表示缺失值 [batch_size, seq_len]
+            normalizer: 可选的分母（有效值个数）。梯度累积时传入整个累积窗口的有效值总数，
+                        使各微批次的损失之和等于窗口内所有有效值的平均损失
         
         返回:
             loss: 损失值
@@ -58,7 +60,7 @@ class AngularLoss(nn.Module):
         if mask is not None:
             combined_loss = combined_loss * mask
             # 计算平均损失（只考虑有效值）
-            total_valid = mask.sum()
+            total_valid = mask.sum() if normalizer is None else normalizer
             if total_valid > 0:
                 return self.weight * combined_loss.sum() / total_valid
             else:
@@ -95,7 +97,7 @@ class TotalAngularLoss(nn.Module):
         for angle_name in torsion_types:
             self.angle_losses[angle_name] = AngularLoss(weight=self.weights.get(angle_name, 1.0))
     
-    def forward(self, sin_cos_preds, angle_targets, masks):
+    def forward(self, sin_cos_preds, angle_targets, masks, normalizers=None):
         """
         计算总损失
         
@@ -103,6 +105,7 @@ class TotalAngularLoss(nn.Module):
             sin_cos_preds: 字典，键为角度名，值为预测的sin和cos
             angle_targets: 字典，键为角度名，值为目标角度
             masks: 字典，键为角度名，值为掩码
+            normalizers: 可选的字典，键为角度名，值为该角度损失的分母（见AngularLoss）
         
         返回:
             total_loss: 总损失
@@ -116,7 +119,8 @@ class TotalAngularLoss(nn.Module):
                 loss = self.angle_losses[angle_name](
                     sin_cos_preds[angle_name],
                     angle_targets[angle_name],
-                    masks.get(angle_name, None)
+                    masks.get(angle_name, None),
+                    normalizers.get(angle_name) if normalizers is not None else None
                 )
                 
                 total_loss += loss
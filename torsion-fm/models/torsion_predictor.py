@@ -7,43 +7,103 @@ RNA扭转角预测模型定义
 """
 
 import os
-import sys
+import json
 import logging
+import threading
+from collections import namedtuple
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
 
-# 确保RNA-FM模块可以被正确导入
-try:
-    import fm
-except ImportError:
-    # 尝试添加fm模块路径
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(os.path.dirname(script_dir))
-    
-    possible_paths = [
-        os.path.join(project_root, "fm"),
-        os.path.join(project_root, "RNA-FM", "fm"),
-        os.path.join(os.path.dirname(project_root), "RNA-FM", "fm")
-    ]
-    
-    for path in possible_paths:
-        if os.path.exists(path):
-            sys.path.append(os.path.dirname(path))
-            try:
-                import fm
-                break
-            except ImportError:
-                continue
-    else:
-        raise ImportError(
-            "无法导入fm模块。请确保RNA-FM已正确安装，或在环境变量中设置正确的路径。"
-            "您可以尝试: pip install rna-fm 或手动指定RNA-FM的路径。"
-        )
+from utils.angle_utils import circular_mean_resultant, von_mises_concentration
+from utils.prediction_cache import file_sha256, model_cache_key, normalize_sequence
+from utils.safetensors_io import is_safetensors, save_safetensors, load_safetensors
 
 logger = logging.getLogger(__name__)
 
+# 检查点格式版本（写入safetensors头部的元数据和.pth字典）
+CHECKPOINT_FORMAT_VERSION = 1
+
+# 默认预测头的名称（对应模型上注册的feature_extractor/regression_heads）
+DEFAULT_HEAD = "default"
+
+# 一个预测头版本的不可变快照
+TorsionHead = namedtuple('TorsionHead', ['name', 'feature_extractor', 'regression_heads', 'torsion_types',
+                                         'hidden_dim', 'layer_norm', 'model_id', 'source'])
+
+
+def head_structure(state):
+    """由特征提取器的state_dict推断(hidden_dim, layer_norm)"""
+    layer_norm = state['0.weight'].dim() == 1
+    hidden_dim = state['1.weight' if layer_norm else '0.weight'].shape[0]
+    return hidden_dim, layer_norm
+
+
+def save_checkpoint(checkpoint, path):
+    """
+    保存检查点字典（先写临时文件再重命名，避免中断时损坏检查点）
+
+    参数:
+        checkpoint: 字典，包含feature_extractor、regression_heads、torsion_types和backbone
+        path: 保存路径；扩展名为.safetensors时张量按"<分组>.<参数名>"展平，其余字段写入头部元数据，
+              否则使用torch.save
+    """
+    if not is_safetensors(path):
+        tmp_path = f"{path}.tmp"
+        torch.save(checkpoint, tmp_path)
+        os.replace(tmp_path, path)
+        return
+
+    hidden_dim, layer_norm = head_structure(checkpoint['feature_extractor'])
+    tensors = {f"feature_extractor.{k}": v for k, v in checkpoint['feature_extractor'].items()}
+    tensors.update({f"regression_heads.{k}": v for k, v in checkpoint['regression_heads'].items()})
+    save_safetensors(tensors, path, metadata={
+        'kind': "torsion_head",
+        'format_version': CHECKPOINT_FORMAT_VERSION,
+        'torsion_types': json.dumps(checkpoint['torsion_types']),
+        'hidden_dim': hidden_dim,
+        'layer_norm': "true" if layer_norm else "false",
+        'backbone': checkpoint.get('backbone', "rna_fm_t12"),
+    })
+
+
+def load_checkpoint(path, use_mmap=True):
+    """
+    读取RNATorsionPredictor.save()保存的检查点
+
+    参数:
+        path: .pth文件（torch.save）或.safetensors文件（以mmap方式零拷贝加载）
+        use_mmap: safetensors文件是否映射加载
+
+    返回:
+        checkpoint: 字典，包含feature_extractor、regression_heads两个state_dict，
+                    以及torsion_types、backbone等元数据
+    """
+    if not is_safetensors(path):
+        return torch.load(path, map_location="cpu")
+
+    tensors, metadata = load_safetensors(path, use_mmap)
+    if metadata.get('kind') != "torsion_head":
+        raise ValueError(f"{path} 不是扭转角预测头检查点")
+    version = int(metadata.get('format_version', 1))
+    if version > CHECKPOINT_FORMAT_VERSION:
+        raise ValueError(f"{path} 的格式版本 {version} 高于当前支持的 {CHECKPOINT_FORMAT_VERSION}")
+
+    checkpoint = {'feature_extractor': {}, 'regression_heads': {}}
+    for name, tensor in tensors.items():
+        group, key = name.split(".", 1)
+        checkpoint[group][key] = tensor
+    checkpoint.update({
+        'torsion_types': json.loads(metadata['torsion_types']),
+        'backbone': metadata.get('backbone', "rna_fm_t12"),
+        'hidden_dim': int(metadata['hidden_dim']),
+        'layer_norm': metadata.get('layer_norm') == "true",
+        'format_version': version,
+    })
+    return checkpoint
+
 class RNATorsionPredictor(nn.Module):
     """
     基于RNA-FM的扭转角预测模型
@@ -86,15 +146,19 @@ class RNATorsionPredictor(nn.Module):
             torsion_types = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "chi"]
         
         self.torsion_types = torsion_types
+        self.hidden_dim = hidden_dim
+        self.dropout = dropout
+        self.layer_norm = layer_norm
         
         # 加载RNA-FM模型（如果未提供）
         if rna_fm_model is None or alphabet is None:
+            from .backbones import load_backbone
             if pretrained_model_path is None:
                 logger.info("未提供预训练模型路径，使用默认RNA-FM模型")
-                self.rna_fm, self.alphabet = fm.pretrained.rna_fm_t12()
+                self.rna_fm, self.alphabet = load_backbone("rna_fm_t12")
             else:
                 logger.info(f"从路径加载RNA-FM模型: {pretrained_model_path}")
-                self.rna_fm, self.alphabet = fm.pretrained.rna_fm_t12(model_location=pretrained_model_path)
+                self.rna_fm, self.alphabet = load_backbone("rna_fm_t12", model_location=pretrained_model_path)
         else:
             logger.info("使用提供的RNA-FM模型")
             self.rna_fm = rna_fm_model
@@ -103,16 +167,50 @@ class RNATorsionPredictor(nn.Module):
         # 冻结RNA-FM参数
         self._freeze_rnafm_parameters()
         
+        # 批次内重复序列只运行一次骨干网络（见embed()）
+        self.dedup_backbone = True
+        self.backbone_rows = 0
+        self.backbone_unique_rows = 0
+        self.last_backbone_rows = (0, 0)
+        
+        # 按长度分组运行骨干网络（见embed()）
+        self.pack_backbone = False
+        self.pack_tolerance = 0.1
+        
         # 获取RNA-FM输出维度
         self.embed_dim = 640  # RNA-FM的嵌入维度是640
         
-        # 创建共享的特征提取层
+        # 创建共享的特征提取层和每种扭转角的回归头
+        self.feature_extractor, self.regression_heads = self._build_head_modules(
+            self.embed_dim, hidden_dim, dropout, layer_norm, torsion_types)
+        
+        # 初始化权重
+        self._init_weights()
+        
+        # 命名预测头：默认头就是上面注册的feature_extractor/regression_heads，
+        # 其他头注册在extra_heads中（随模型一起移动设备、切换模式）。
+        # _heads是名称到TorsionHead快照的字典，只整体替换不原地修改：
+        # 读取方每次调用取一次快照，切换预测头时正在进行的前向传播不受影响
+        self.extra_heads = nn.ModuleDict()
+        self._head_lock = threading.Lock()
+        self._heads = {}
+        self._publish_default_head(None, None)
+    
+    @staticmethod
+    def _build_head_modules(embed_dim, hidden_dim, dropout, layer_norm, torsion_types):
+        """
+        构建特征提取器和回归头
+        
+        返回:
+            feature_extractor: nn.Sequential
+            regression_heads: nn.ModuleDict，每种扭转角一个输出sin和cos的线性层
+        """
         layers = []
         if layer_norm:
-            layers.append(nn.LayerNorm(self.embed_dim))
+            layers.append(nn.LayerNorm(embed_dim))
         
         layers.extend([
-            nn.Linear(self.embed_dim, hidden_dim),
+            nn.Linear(embed_dim, hidden_dim),
             nn.GELU(),
             nn.Dropout(dropout),
             nn.Linear(hidden_dim, hidden_dim),
@@ -120,16 +218,14 @@ class RNATorsionPredictor(nn.Module):
             nn.Dropout(dropout)
         ])
         
-        self.feature_extractor = nn.Sequential(*layers)
+        feature_extractor = nn.Sequential(*layers)
         
         # 为每种扭转角构建回归头
-        self.regression_heads = nn.ModuleDict()
+        regression_heads = nn.ModuleDict()
         for torsion_type in torsion_types:
             # 我们预测sin和cos，这样可以处理角度的周期性
-            self.regression_heads[torsion_type] = nn.Linear(hidden_dim, 2)
-        
-        # 初始化权重
-        self._init_weights()
+            regression_heads[torsion_type] = nn.Linear(hidden_dim, 2)
+        return feature_extractor, regression_heads
     
     def _init_weights(self):
         """初始化模型权重，使用适合回归任务的初始化方法"""
@@ -153,39 +249,170 @@ class RNATorsionPredictor(nn.Module):
             param.requires_grad = False
         logger.info("RNA-FM参数已冻结")
     
-    def forward(self, tokens):
+    def forward(self, tokens, head=None):
         """
         前向传播
         
         参数:
             tokens: 输入的RNA序列token张量 [batch_size, seq_len]
+            head: 预测头名称或get_head()返回的快照（None表示默认头）
         
         返回:
             predictions: 字典，键为扭转角类型，值为预测的角度
             sin_cos: 字典，键为扭转角类型，值为预测的sin和cos
         """
+        embeddings = self.embed(tokens)
+        return self.predict_from_embeddings(embeddings, head)
+    
+    def embed(self, tokens):
+        """
+        使用RNA-FM提取第12层的逐残基表示（已去除特殊标记）
+        
+        tokens需要用alphabet.padding_idx右填充（batch converter和collate_fn的做法），
+        骨干网络据此屏蔽填充位置，每条序列的表示与批次中其他序列的长度无关。
+        每条序列的真实长度由非填充token数得到：去掉首尾的<cls>/<eos>后，
+        第i条序列的残基位于输出的[0, 长度)，之后的位置（<eos>和填充）置零。
+        
+        dedup_backbone开启时，批次中完全相同的token行（多模型条目、对称组装体中的重复链）
+        只送入RNA-FM一次，再按原位置散回。骨干网络冻结且在no_grad下运行，
+        散回是普通的索引操作，回归层的梯度与逐行计算完全一致。
+        pack_backbone开启时，按长度把序列分成填充比例不超过pack_tolerance的若干组，
+        每组截断到组内最大长度后分别送入RNA-FM，填充位置基本不再消耗计算。
+        
+        参数:
+            tokens: 输入的RNA序列token张量 [batch_size, seq_len]
+        
+        返回:
+            embeddings: [batch_size, seq_len-2, embed_dim]
+        """
+        backbone_tokens, inverse = self._unique_rows(tokens)
+        # 每行的token数（包括<cls>和<eos>）
+        token_lengths = backbone_tokens.ne(self.alphabet.padding_idx).sum(dim=1)
+        
         # 使用RNA-FM提取特征
         with torch.no_grad():
-            results = self.rna_fm(tokens, repr_layers=[12], need_head_weights=False)
-        
-        # 获取最后一层的表示
-        embeddings = results["representations"][12]  # [batch_size, seq_len, embed_dim]
+            if self.pack_backbone and backbone_tokens.shape[0] > 1:
+                embeddings = self._packed_representations(backbone_tokens, token_lengths)
+            else:
+                results = self.rna_fm(backbone_tokens, repr_layers=[12], need_head_weights=False)
+                # 获取最后一层的表示
+                embeddings = results["representations"][12]  # [unique_rows, seq_len, embed_dim]
+        if inverse is not None:
+            embeddings = embeddings[inverse]  # [batch_size, seq_len, embed_dim]
+            token_lengths = token_lengths[inverse]
         
         # RNA-FM会添加特殊标记，我们需要去除它们
-        # 通常第一个标记是<s>，最后一个标记是</s>
-        # 去除特殊标记，只保留实际序列对应的表示
+        # 第一个标记是<cls>，每条序列的<eos>紧跟在最后一个残基之后，其后是填充
         embeddings = embeddings[:, 1:-1, :]  # [batch_size, seq_len-2, embed_dim]
+        positions = torch.arange(embeddings.shape[1], device=embeddings.device)
+        residue_mask = positions.unsqueeze(0) < (token_lengths - 2).unsqueeze(1)  # [batch_size, seq_len-2]
+        if not residue_mask.all():
+            embeddings = embeddings * residue_mask.unsqueeze(-1).to(embeddings.dtype)
+        return embeddings
+    
+    def _pack_groups(self, token_lengths):
+        """
+        按长度把行分组：行按长度升序排列后依次加入当前组，
+        加入后组内填充比例超过pack_tolerance时另起一组
+        
+        返回:
+            groups: 列表，每个元素为(行下标张量, 组内最大token数)
+        """
+        order = torch.argsort(token_lengths)
+        sorted_lengths = token_lengths[order].tolist()
+        
+        groups = []
+        start, total = 0, 0
+        for i, length in enumerate(sorted_lengths):
+            count = i - start + 1
+            if count > 1 and 1.0 - (total + length) / (count * length) > self.pack_tolerance:
+                groups.append((order[start:i], sorted_lengths[i - 1]))
+                start, total = i, 0
+            total += length
+        groups.append((order[start:], sorted_lengths[-1]))
+        return groups
+    
+    def _packed_representations(self, tokens, token_lengths):
+        """
+        按长度分组运行RNA-FM，拼回原批次的布局
+        
+        返回:
+            representations: [batch_size, seq_len, embed_dim]，每行超出该组最大长度的位置为零
+        """
+        representations = None
+        for rows, length in self._pack_groups(token_lengths):
+            results = self.rna_fm(tokens[rows, :length], repr_layers=[12], need_head_weights=False)
+            group = results["representations"][12]
+            if representations is None:
+                representations = group.new_zeros(tokens.shape[0], tokens.shape[1], group.shape[-1])
+            representations[rows, :length] = group
+        return representations
+    
+    def _unique_rows(self, tokens):
+        """
+        找出批次中不重复的token行，并累计去重统计
+        
+        返回:
+            backbone_tokens: 需要送入骨干网络的token [unique_rows, seq_len]
+            inverse: 原批次每一行对应的唯一行下标 [batch_size]；没有重复行时为None
+        """
+        batch_size = tokens.shape[0]
+        backbone_tokens, inverse = tokens, None
+        if self.dedup_backbone and batch_size > 1:
+            unique_tokens, unique_inverse = torch.unique(tokens, dim=0, return_inverse=True)
+            if unique_tokens.shape[0] < batch_size:
+                backbone_tokens, inverse = unique_tokens, unique_inverse
+        
+        self.last_backbone_rows = (batch_size, backbone_tokens.shape[0])
+        self.backbone_rows += batch_size
+        self.backbone_unique_rows += backbone_tokens.shape[0]
+        return backbone_tokens, inverse
+    
+    def dedup_stats(self, reset=False):
+        """
+        骨干网络去重统计
+        
+        参数:
+            reset: 读取后是否清零
+        
+        返回:
+            stats: 字典，包含rows（输入行数）、unique_rows（实际送入骨干网络的行数）和
+                   dedup_ratio（省去的骨干网络计算比例）
+        """
+        rows, unique_rows = self.backbone_rows, self.backbone_unique_rows
+        if reset:
+            self.backbone_rows = 0
+            self.backbone_unique_rows = 0
+        return {
+            'rows': rows,
+            'unique_rows': unique_rows,
+            'dedup_ratio': 1.0 - unique_rows / rows if rows else 0.0,
+        }
+    
+    def predict_from_embeddings(self, embeddings, head=None):
+        """
+        在RNA-FM表示上运行特征提取器和回归头
+        
+        参数:
+            embeddings: embed()的输出 [batch_size, seq_len-2, embed_dim]
+            head: 预测头名称或get_head()返回的快照（None表示默认头）
+        
+        返回:
+            predictions: 字典，键为扭转角类型，值为预测的角度
+            sin_cos: 字典，键为扭转角类型，值为预测的sin和cos
+        """
+        head = self.get_head(head)
         
         # 应用特征提取器
-        features = self.feature_extractor(embeddings)  # [batch_size, seq_len-2, hidden_dim]
+        features = head.feature_extractor(embeddings)  # [batch_size, seq_len-2, hidden_dim]
         
         # 预测各种扭转角
         predictions = {}
         sin_cos = {}
         
-        for torsion_type in self.torsion_types:
+        for torsion_type in head.torsion_types:
             # 对每个残基位置进行预测
-            output = self.regression_heads[torsion_type](features)  # [batch_size, seq_len-2, 2]
+            output = head.regression_heads[torsion_type](features)  # [batch_size, seq_len-2, 2]
             
             # 分离sin和cos预测
             sin_pred = output[:, :, 0]  # [batch_size, seq_len-2]
@@ -208,13 +435,17 @@ class RNATorsionPredictor(nn.Module):
         保存模型参数（不包括RNA-FM）
         
         参数:
-            path: 保存路径
+            path: 保存路径；扩展名为.safetensors时保存为safetensors格式（元数据写入头部），否则使用torch.save
         """
         # 只保存训练过的部分（特征提取器和回归头）
-        torch.save({
+        save_checkpoint({
             'feature_extractor': self.feature_extractor.state_dict(),
             'regression_heads': self.regression_heads.state_dict(),
-            'torsion_types': self.torsion_types
+            'torsion_types': self.torsion_types,
+            'backbone': getattr(self.rna_fm, 'backbone_name', "rna_fm_t12"),
+            'hidden_dim': self.hidden_dim,
+            'layer_norm': self.layer_norm,
+            'format_version': CHECKPOINT_FORMAT_VERSION
         }, path)
         logger.info(f"模型已保存到 {path}")
     
@@ -225,7 +456,7 @@ class RNATorsionPredictor(nn.Module):
         参数:
             path: 加载路径
         """
-        checkpoint = torch.load(path, map_location=lambda storage, loc: storage)
+        checkpoint = load_checkpoint(path)
         self.feature_extractor.load_state_dict(checkpoint['feature_extractor'])
         self.regression_heads.load_state_dict(checkpoint['regression_heads'])
         logger.info(f"从 {path} 加载了模型")
@@ -234,19 +465,248 @@ class RNATorsionPredictor(nn.Module):
         if 'torsion_types' in checkpoint:
             self.torsion_types = checkpoint['torsion_types']
             logger.info(f"加载了扭转角类型: {self.torsion_types}")
-    
-    def predict_single_sequence(self, sequence):
+        with self._head_lock:
+            self._publish_default_head(file_sha256(path), path)
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint, rna_fm_model, alphabet):
+        """
+        由save()保存的检查点构建模型，回归层结构（隐藏层维度、是否有层归一化）从参数形状推断
+
+        参数:
+            checkpoint: 检查点路径（.pth或.safetensors）或load_checkpoint()返回的字典
+            rna_fm_model: RNA-FM模型对象（多个检查点可以共享同一个）
+            alphabet: RNA-FM字母表
+
+        返回:
+            model: 加载了参数的RNATorsionPredictor
+        """
+        if isinstance(checkpoint, str):
+            checkpoint = load_checkpoint(checkpoint)
+        state = checkpoint['feature_extractor']
+        hidden_dim, layer_norm = head_structure(state)
+
+        model = cls(rna_fm_model, alphabet, torsion_types=checkpoint['torsion_types'],
+                    hidden_dim=hidden_dim, layer_norm=layer_norm)
+        model.feature_extractor.load_state_dict(state)
+        model.regression_heads.load_state_dict(checkpoint['regression_heads'])
+        return model
+
+    @property
+    def model_id(self):
+        """默认预测头的模型标识（检查点内容哈希，作为预测缓存键的一部分；None表示不使用缓存）"""
+        return self._heads[DEFAULT_HEAD].model_id
+
+    @model_id.setter
+    def model_id(self, value):
+        with self._head_lock:
+            self._publish_default_head(value, self._heads[DEFAULT_HEAD].source)
+
+    def _publish_default_head(self, model_id, source):
+        """按当前注册的特征提取器和回归头发布默认头快照（调用方持有_head_lock，构造函数中除外）"""
+        heads = dict(self._heads)
+        heads[DEFAULT_HEAD] = TorsionHead(DEFAULT_HEAD, self.feature_extractor, self.regression_heads,
+                                          list(self.torsion_types), self.hidden_dim, self.layer_norm,
+                                          model_id, source)
+        self._heads = heads
+
+    def get_head(self, head=None):
+        """
+        取预测头快照
+
+        同一次预测应只取一次快照，之后的前向传播和缓存键都使用它，保证结果来自同一个版本。
+
+        参数:
+            head: 预测头名称（None表示默认头），或已经取得的TorsionHead快照
+
+        返回:
+            TorsionHead
+        """
+        if isinstance(head, TorsionHead):
+            return head
+        name = DEFAULT_HEAD if head is None else head
+        try:
+            return self._heads[name]
+        except KeyError:
+            raise KeyError(f"未知的预测头: {name}，可用: {', '.join(self._heads)}") from None
+
+    def head_names(self):
+        """已加载的预测头名称列表（默认头在前）"""
+        return list(self._heads)
+
+    def _build_head(self, name, checkpoint):
+        """由检查点构建新的预测头模块（不影响正在使用的预测头），并检查与常驻骨干网络是否匹配"""
+        source = checkpoint if isinstance(checkpoint, str) else None
+        if source is not None:
+            checkpoint = load_checkpoint(source)
+
+        backbone = checkpoint.get('backbone', "rna_fm_t12")
+        resident = getattr(self.rna_fm, 'backbone_name', "rna_fm_t12")
+        if backbone != resident:
+            raise ValueError(f"预测头 {name} 基于骨干网络 {backbone} 训练，与常驻的 {resident} 不一致")
+
+        state = checkpoint['feature_extractor']
+        hidden_dim, layer_norm = head_structure(state)
+        input_dim = state['1.weight' if layer_norm else '0.weight'].shape[1]
+        if input_dim != self.embed_dim:
+            raise ValueError(f"预测头 {name} 的输入维度 {input_dim} 与骨干网络的嵌入维度 {self.embed_dim} 不一致")
+
+        torsion_types = list(checkpoint['torsion_types'])
+        feature_extractor, regression_heads = self._build_head_modules(
+            self.embed_dim, hidden_dim, self.dropout, layer_norm, torsion_types)
+        feature_extractor.load_state_dict(state)
+        regression_heads.load_state_dict(checkpoint['regression_heads'])
+
+        # 与当前默认头保持相同的设备、精度和训练/评估模式
+        reference = next(self.feature_extractor.parameters())
+        for module in (feature_extractor, regression_heads):
+            module.to(device=reference.device, dtype=reference.dtype)
+            module.train(self.training)
+
+        model_id = file_sha256(source) if source is not None else None
+        return TorsionHead(name, feature_extractor, regression_heads, torsion_types,
+                           hidden_dim, layer_norm, model_id, source)
+
+    def swap_head(self, checkpoint, name=DEFAULT_HEAD, strict=True):
+        """
+        加载预测头检查点并原子地替换（或新增）同名预测头，骨干网络保持常驻不重新加载
+
+        新模块在锁外构建和加载，锁内只做校验和一次字典替换；替换前已经取得快照的预测继续使用旧版本。
+
+        参数:
+            checkpoint: 检查点路径（.pth或.safetensors）或load_checkpoint()返回的字典；
+                        传入路径时以文件内容哈希作为该预测头的缓存标识，传入字典时该预测头不使用缓存
+            name: 预测头名称（DEFAULT_HEAD替换模型上注册的默认头）
+            strict: 替换已有预测头时是否要求扭转角类型和隐藏层维度与旧版本一致
+
+        返回:
+            head: 新的TorsionHead快照
+        """
+        if not name or "." in name:
+            raise ValueError(f"无效的预测头名称: {name!r}")
+        new = self._build_head(name, checkpoint)
+
+        with self._head_lock:
+            current = self._heads.get(name)
+            if strict and current is not None:
+                if set(new.torsion_types) != set(current.torsion_types):
+                    raise ValueError(f"预测头 {name} 的扭转角类型 {new.torsion_types} "
+                                     f"与当前版本 {current.torsion_types} 不一致")
+                if new.hidden_dim != current.hidden_dim:
+                    raise ValueError(f"预测头 {name} 的隐藏层维度 {new.hidden_dim} "
+                                     f"与当前版本 {current.hidden_dim} 不一致")
+
+            if name == DEFAULT_HEAD:
+                self.feature_extractor = new.feature_extractor
+                self.regression_heads = new.regression_heads
+                self.torsion_types = new.torsion_types
+                self.hidden_dim = new.hidden_dim
+                self.layer_norm = new.layer_norm
+                self._publish_default_head(new.model_id, new.source)
+            else:
+                self.extra_heads[name] = nn.ModuleDict({
+                    'feature_extractor': new.feature_extractor,
+                    'regression_heads': new.regression_heads,
+                })
+                heads = dict(self._heads)
+                heads[name] = new
+                self._heads = heads
+
+        logger.info(f"预测头 {name} 已{'替换' if current is not None else '加载'}"
+                    f"（来源: {new.source or '检查点字典'}，扭转角: {new.torsion_types}）")
+        return new
+
+    def remove_head(self, name):
+        """
+        卸载一个命名预测头（默认头不能卸载）
+
+        参数:
+            name: 预测头名称
+        """
+        if name == DEFAULT_HEAD:
+            raise ValueError("默认预测头不能卸载，请使用swap_head()替换")
+        with self._head_lock:
+            if name not in self._heads:
+                raise KeyError(f"未知的预测头: {name}")
+            heads = dict(self._heads)
+            del heads[name]
+            self._heads = heads
+            del self.extra_heads[name]
+        logger.info(f"预测头 {name} 已卸载")
+
+    def predict_with_uncertainty(self, tokens, num_samples=20, head=None):
+        """
+        Monte-Carlo dropout预测：RNA-FM只运行一次，嵌入沿批次维扩展num_samples倍，
+        在开启dropout的回归层中一次前向得到全部采样
+
+        第一个Dropout之前的层是确定性的，只在原始批次上计算一次，之后才扩展。
+
+        参数:
+            tokens: 输入的RNA序列token张量 [batch_size, seq_len]
+            num_samples: 采样次数T
+            head: 预测头名称或get_head()返回的快照（None表示默认头）
+
+        返回:
+            predictions: 字典，键为扭转角类型，值为采样的圆形均值角度 [batch_size, seq_len-2]
+            uncertainty: 字典，键为扭转角类型，值为{'concentration': von Mises集中度 [batch_size, seq_len-2]}
+        """
+        head = self.get_head(head)
+        embeddings = self.embed(tokens)
+        batch_size, seq_len = embeddings.shape[:2]
+
+        layers = list(head.feature_extractor)
+        split = next((i for i, layer in enumerate(layers) if isinstance(layer, nn.Dropout)), len(layers))
+        dropouts = [layer for layer in layers if isinstance(layer, nn.Dropout)]
+        was_training = [layer.training for layer in dropouts]
+
+        try:
+            for layer in dropouts:
+                layer.train()
+            with torch.no_grad():
+                hidden = embeddings
+                for layer in layers[:split]:
+                    hidden = layer(hidden)
+                # [B, L, H] => [T*B, L, H]（样本t对应第t段批次）
+                hidden = hidden.unsqueeze(0).expand(num_samples, -1, -1, -1).reshape(num_samples * batch_size, seq_len, -1)
+                for layer in layers[split:]:
+                    hidden = layer(hidden)
+
+                predictions = {}
+                uncertainty = {}
+                for torsion_type in head.torsion_types:
+                    output = head.regression_heads[torsion_type](hidden)
+                    angle_deg = torch.rad2deg(torch.atan2(output[:, :, 0], output[:, :, 1]))
+                    mean, resultant_length = circular_mean_resultant(angle_deg.view(num_samples, batch_size, seq_len), dim=0)
+                    predictions[torsion_type] = mean
+                    uncertainty[torsion_type] = {'concentration': von_mises_concentration(resultant_length)}
+        finally:
+            for layer, training in zip(dropouts, was_training):
+                layer.train(training)
+
+        return predictions, uncertainty
+
+    def predict_single_sequence(self, sequence, cache=None, head=None):
         """
         为单个RNA序列预测扭转角
         
         参数:
             sequence: RNA序列字符串
+            cache: 可选的PredictionCache；预测头带有model_id时按（序列, 检查点, 选项）查询和写入
+            head: 预测头名称（None表示默认头）
         
         返回:
             dict: 每种扭转角类型的预测角度
         """
+        head = self.get_head(head)
+        key = model_cache_key(self, sequence, head=head, mc_samples=0) if cache is not None else None
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        
         # 将序列转换为token
         batch_converter = self.alphabet.get_batch_converter()
+        sequence = normalize_sequence(sequence)
         data = [("RNA", sequence)]
         _, _, tokens = batch_converter(data)
         
@@ -257,7 +717,7 @@ class RNATorsionPredictor(nn.Module):
         # 进行预测
         self.eval()
         with torch.no_grad():
-            predictions, _ = self.forward(tokens)
+            predictions, _ = self.forward(tokens, head)
         
         # 提取每种扭转角的预测结果
         result = {}
@@ -267,4 +727,6 @@ class RNATorsionPredictor(nn.Module):
             seq_len = min(len(sequence), angle_preds.shape[1])
             result[angle_name] = angle_preds[0, :seq_len].cpu().numpy()
         
-        return result
\ No newline at end of file
+        if key is not None:
+            cache.put(key, result)
+        return result
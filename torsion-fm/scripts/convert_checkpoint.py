@@ -0,0 +1,70 @@
+"""
+检查点格式转换脚本
+
+将torch.save保存的预测头检查点转换为safetensors格式（或反向转换），
+以及把骨干网络权重导出为safetensors文件，供预测/服务进程以mmap方式共享加载。
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.torsion_predictor import load_checkpoint, save_checkpoint
+from models.backbones import BACKBONES, load_backbone, save_backbone
+
+logger = logging.getLogger(__name__)
+
+
+def convert_head(input_path, output_path):
+    """
+    转换预测头检查点格式（按扩展名决定输出格式）
+
+    Args:
+        input_path: 输入检查点（.pth或.safetensors）
+        output_path: 输出检查点（.pth或.safetensors）
+    """
+    checkpoint = load_checkpoint(input_path, use_mmap=False)
+    save_checkpoint(checkpoint, output_path)
+    logger.info(f"已将 {input_path} 转换为 {output_path}（扭转角: {checkpoint['torsion_types']}）")
+
+
+def export_backbone(name, output_path, model_location=None):
+    """
+    导出骨干网络权重为safetensors格式
+
+    Args:
+        name: 骨干网络名称
+        output_path: 输出的.safetensors文件
+        model_location: RNA-FM预训练权重的本地路径（可选，默认按fm包的方式下载）
+    """
+    model, _ = load_backbone(name, model_location)
+    save_backbone(model, output_path)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="检查点格式转换（pth <-> safetensors）与骨干网络权重导出")
+    parser.add_argument("--input", type=str, default=None, help="输入的预测头检查点")
+    parser.add_argument("--output", type=str, required=True, help="输出文件（扩展名决定格式）")
+    parser.add_argument("--backbone", type=str, default=None, choices=BACKBONES,
+                        help="导出骨干网络权重（不转换预测头）")
+    parser.add_argument("--model_location", type=str, default=None, help="RNA-FM预训练权重的本地路径")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.backbone:
+        export_backbone(args.backbone, args.output, args.model_location)
+    elif args.input:
+        convert_head(args.input, args.output)
+    else:
+        parser.error("需要提供 --input（转换预测头）或 --backbone（导出骨干网络）")
+
+if __name__ == "__main__":
+    main()
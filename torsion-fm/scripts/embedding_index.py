@@ -0,0 +1,154 @@
+"""
+嵌入索引构建与查询脚本
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+from functools import partial
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import Config
+from data.dataset import RNATorsionDataset, collate_fn, split_dataset
+from models.embedding_index import EmbeddingIndex, KNNTorsionPredictor, build_embedding_index
+from scripts.predict import load_model, load_structures
+
+
+SPLITS = ("train", "val", "test", "all")
+
+
+def build_index(data_dir, model_path, output_file, device="cuda", batch_size=8, n_lists=0, n_probe=8,
+                split="train", cache_dir=None, seed=42):
+    """
+    构建训练集嵌入索引
+
+    默认只索引训练集划分（与train.py相同的比例和seed），验证/测试集的链查询时不会找到自身。
+    训练时使用了数据缓存时应传入同一个cache_dir，保证样本顺序和划分与训练时一致。
+
+    Args:
+        data_dir: 训练数据目录
+        model_path: 模型检查点路径
+        output_file: 输出的.npz索引文件
+        device: 设备（'cuda'或'cpu'）
+        batch_size: 提取嵌入时的批次大小
+        n_lists: 残基级IVF簇数量，0表示精确搜索
+        n_probe: 查询时扫描的簇数量
+        split: 索引的数据划分（train/val/test，或all表示整个目录）
+        cache_dir: 数据集缓存目录（训练时为<output_dir>/cache）
+        seed: 数据集划分的随机种子
+    """
+    if split not in SPLITS:
+        raise ValueError(f"不支持的数据划分: {split}，可选: {SPLITS}")
+    device = torch.device(device if torch.cuda.is_available() else "cpu")
+    model, alphabet, torsion_types = load_model(model_path, device)
+
+    dataset = RNATorsionDataset(data_dir, alphabet, torsion_types, cache_dir=cache_dir)
+    if split != "all":
+        subsets = split_dataset(dataset, Config.TRAIN_RATIO, Config.VAL_RATIO, Config.TEST_RATIO, seed)
+        dataset = subsets[SPLITS.index(split)]
+        logging.info(f"索引 {split} 划分: {len(dataset)} 条链")
+    data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, collate_fn=partial(collate_fn, padding_idx=alphabet.padding_idx))
+
+    index = build_embedding_index(model, data_loader, device, torsion_types, n_lists=n_lists, n_probe=n_probe)
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    index.save(output_file)
+    return index
+
+
+def query_index(index_file, model_path, input_file, k=10, threshold=0.99, device="cuda"):
+    """
+    查询输入结构的相似训练链、近重复链和kNN扭转角预测
+
+    Args:
+        index_file: .npz索引文件
+        model_path: 模型检查点路径
+        input_file: 输入的pkl或PDB/mmCIF文件
+        k: 近邻数量
+        threshold: 近重复判定的余弦相似度阈值
+        device: 设备（'cuda'或'cpu'）
+
+    Returns:
+        reports: 每条链的查询结果列表
+    """
+    device = torch.device(device if torch.cuda.is_available() else "cpu")
+    model, alphabet, _ = load_model(model_path, device)
+    index = EmbeddingIndex.load(index_file)
+    knn = KNNTorsionPredictor(index, k=k)
+
+    reports = []
+    for result in load_structures(input_file):
+        _, _, tokens = alphabet.get_batch_converter()([("RNA", result['sequence'])])
+        with torch.no_grad():
+            embeddings = model.embed(tokens.to(device))[0].float().cpu().numpy()
+
+        predictions, confidence = knn.predict(embeddings)
+        reports.append({
+            'pdb_id': result['pdb_id'],
+            'chain_id': result['chain_id'],
+            'similar_chains': index.query_chains(embeddings, k),
+            'near_duplicates': index.find_near_duplicates(embeddings, threshold, k),
+            # 没有近邻的残基预测为NaN，JSON中写为null
+            'knn_predictions': {angle: [None if np.isnan(v) else v for v in values.tolist()]
+                                for angle, values in predictions.items()},
+            'knn_confidence': {angle: values.tolist() for angle, values in confidence.items()},
+        })
+    return reports
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="RNA-FM嵌入索引")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="构建索引")
+    build_parser.add_argument("--data_dir", type=str, required=True, help="训练数据目录")
+    build_parser.add_argument("--model_path", type=str, required=True, help="模型检查点路径")
+    build_parser.add_argument("--output_file", type=str, required=True, help="输出的.npz索引文件")
+    build_parser.add_argument("--batch_size", type=int, default=8, help="批次大小")
+    build_parser.add_argument("--n_lists", type=int, default=0, help="IVF簇数量（0为精确搜索）")
+    build_parser.add_argument("--n_probe", type=int, default=8, help="查询时扫描的簇数量")
+    build_parser.add_argument("--device", type=str, default="cuda", help="设备（'cuda'或'cpu'）")
+    build_parser.add_argument("--split", type=str, default="train", choices=SPLITS, help="索引的数据划分")
+    build_parser.add_argument("--cache_dir", type=str, default=None, help="训练时使用的数据集缓存目录")
+
+    query_parser = subparsers.add_parser("query", help="查询索引")
+    query_parser.add_argument("--index_file", type=str, required=True, help=".npz索引文件")
+    query_parser.add_argument("--model_path", type=str, required=True, help="模型检查点路径")
+    query_parser.add_argument("--input_file", type=str, required=True, help="输入的pkl或PDB/mmCIF文件")
+    query_parser.add_argument("--k", type=int, default=10, help="近邻数量")
+    query_parser.add_argument("--threshold", type=float, default=0.99, help="近重复相似度阈值")
+    query_parser.add_argument("--output_file", type=str, default=None, help="结果JSON文件（默认打印）")
+    query_parser.add_argument("--device", type=str, default="cuda", help="设备（'cuda'或'cpu'）")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == "build":
+        build_index(args.data_dir, args.model_path, args.output_file, args.device,
+                    args.batch_size, args.n_lists, args.n_probe, args.split, args.cache_dir)
+    else:
+        reports = query_index(args.index_file, args.model_path, args.input_file,
+                              args.k, args.threshold, args.device)
+        if args.output_file:
+            with open(args.output_file, 'w') as f:
+                json.dump(reports, f)
+            logging.info(f"查询结果已保存到: {args.output_file}")
+        else:
+            for report in reports:
+                print(f"{report['pdb_id']}_{report['chain_id']}:")
+                for pdb_id, chain_id, score in report['similar_chains']:
+                    print(f"  {pdb_id}_{chain_id}: {score:.4f}")
+                print(f"  近重复: {len(report['near_duplicates'])} 条")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+"""
+批量扭转角提取脚本
+
+将结构归档（单结构pkl目录、PDB/mmCIF文件、Training_Dict_single格式的pkl或.rnaidx索引文件）
+并行分块处理为逐残基的列式扭转角表。每个数据块完成后立即写出分片并记录进度，
+中断后重新运行同一命令即可从断点继续。
+"""
+
+import os
+import sys
+import json
+import glob
+import pickle
+import hashlib
+import pickletools
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import Config
+from data.preprocessing import process_pdb_file
+from data.adapters import adapt_training_dict_single
+from data.structure_io import is_structure_file, process_structure_file
+from data.structure_store import (
+    IndexedStructureStore, STORE_EXTENSION, is_structure_store, source_identity, store_matches_source,
+    write_structure_store
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "progress.json"
+PARTS_DIR = "parts"
+OUTPUT_FORMATS = ("parquet", "csv")
+
+
+# pickle虚拟机栈上MARK的占位
+_MARK = object()
+
+
+def _peek_pkl_layout(path, max_opcodes=100000):
+    """
+    只扫描pickle操作码判断pkl的布局，不构建任何对象
+
+    单结构pkl是带'rna_dic'键的结构记录（process_pdb_file读取的格式），
+    多结构pkl（Training_Dict_single）是结构ID到这种记录的字典。两种格式中'rna_dic'都排在
+    记录的前几个键，因此只需读取文件开头：看第一个'rna_dic'键属于最外层字典还是嵌套字典。
+
+    Args:
+        path: pkl文件路径
+        max_opcodes: 最多扫描的操作码数
+
+    Returns:
+        layout: 'single'、'training_dict'，无法判断（格式不符或文件损坏）时为None
+    """
+    stack = []
+    top = None
+    try:
+        with open(path, 'rb') as f:
+            for count, (opcode, arg, _) in enumerate(pickletools.genops(f)):
+                if count >= max_opcodes or opcode.name == 'STOP':
+                    return None
+                if opcode.name == 'MARK':
+                    stack.append(_MARK)
+                    continue
+                if isinstance(arg, str) and opcode.stack_after == [pickletools.pyunicode]:
+                    if arg == 'rna_dic':
+                        # 键所属的字典：最近的MARK下方（SETITEMS），没有MARK时为栈顶（SETITEM）
+                        marks = [i for i, item in enumerate(stack) if item is _MARK]
+                        container = stack[marks[-1] - 1] if marks and marks[-1] > 0 else (stack[-1] if stack else None)
+                        return 'single' if container is top else 'training_dict'
+                    stack.append(arg)
+                    continue
+
+                # 其余操作码按pickletools记录的栈效果模拟，值用占位对象代替
+                popped = []
+                for item in reversed(opcode.stack_before):
+                    if item is pickletools.stackslice:
+                        while stack and stack[-1] is not _MARK:
+                            stack.pop()
+                    elif item is pickletools.markobject:
+                        if stack:
+                            stack.pop()
+                    else:
+                        popped.append(stack.pop() if stack else None)
+                if opcode.stack_before and opcode.stack_after == opcode.stack_before[:1] and popped:
+                    # SETITEM(S)/APPEND(S)/MEMOIZE等：容器本身留在栈上
+                    stack.append(popped[-1])
+                    continue
+                for _ in opcode.stack_after:
+                    stack.append(object())
+                if top is None and opcode.name in ('EMPTY_DICT', 'DICT'):
+                    top = stack[-1]
+    except Exception:
+        return None
+    return None
+
+
+def _load_training_dict(path):
+    """
+    完整加载pkl并判断布局（_peek_pkl_layout无法判断时的回退）
+
+    Returns:
+        data: 多结构字典；单结构记录或无法识别时为None
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    except Exception as e:
+        # 无法读取的文件按单结构处理，由工作进程记录错误
+        logger.warning(f"无法读取 {path}，按单结构文件处理: {e}")
+        return None
+    if not isinstance(data, dict) or 'rna_dic' in data:
+        return None
+    if any(isinstance(item, dict) and 'rna_dic' in item for item in data.values()):
+        return data
+    return None
+
+
+def _pkl_layout(path, layouts):
+    """
+    判断pkl布局，结果按文件大小/修改时间缓存在layouts中（保存在进度文件里，续跑时不再检查）
+
+    Args:
+        path: pkl文件路径
+        layouts: {绝对路径: {'size', 'mtime_ns', 'layout'}}，原地更新
+
+    Returns:
+        layout: 'single'或'training_dict'
+    """
+    key = os.path.abspath(path)
+    identity = source_identity(path)
+    cached = layouts.get(key)
+    if cached is not None and identity is not None and \
+            (cached['size'], cached['mtime_ns']) == (identity['size'], identity['mtime_ns']):
+        return cached['layout']
+
+    layout = _peek_pkl_layout(path)
+    if layout is None:
+        layout = 'single' if _load_training_dict(path) is None else 'training_dict'
+    if identity is not None:
+        layouts[key] = dict(identity, layout=layout)
+    return layout
+
+
+def collect_sources(inputs, work_dir, resume=True, layouts=None):
+    """
+    将输入路径展开为数据源列表
+
+    Args:
+        inputs: 文件或目录路径列表
+        work_dir: 工作目录，未转换（或索引已过期）的多结构pkl会在这里生成索引文件
+        resume: 为False时总是重新生成工作目录中的索引文件
+        layouts: pkl布局缓存（见_pkl_layout），原地更新
+
+    Returns:
+        sources: 列表，元素为('store', 索引文件路径)、('file', 单结构pkl路径)或('structure', PDB/mmCIF路径)
+    """
+    layouts = {} if layouts is None else layouts
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, "*.pkl"))))
+            paths.extend(sorted(glob.glob(os.path.join(path, f"*{STORE_EXTENSION}"))))
+            paths.extend(sorted(p for p in glob.glob(os.path.join(path, "*")) if is_structure_file(p)))
+        else:
+            paths.append(path)
+
+    sources = []
+    seen_stores = set()
+    for path in paths:
+        if is_structure_file(path):
+            sources.append(('structure', path))
+            continue
+        if path.endswith(STORE_EXTENSION) or is_structure_store(path):
+            store_path = path
+        elif _pkl_layout(path, layouts) == 'single':
+            sources.append(('file', path))
+            continue
+        else:
+            # 多结构pkl先转换为索引文件，工作进程才能按键随机读取；
+            # 只复用由当前版本源文件生成的索引，--no_resume时总是重新生成工作目录中的副本
+            sibling = os.path.splitext(path)[0] + STORE_EXTENSION
+            store_path = os.path.join(work_dir, os.path.splitext(os.path.basename(path))[0] + STORE_EXTENSION)
+            if store_matches_source(sibling, path):
+                store_path = sibling
+            elif not (resume and store_matches_source(store_path, path)):
+                logger.info(f"转换为索引文件: {path} -> {store_path}")
+                source = source_identity(path)
+                with open(path, 'rb') as f:
+                    write_structure_store(pickle.load(f), store_path, source=source)
+
+        store_path = os.path.abspath(store_path)
+        if store_path not in seen_stores:
+            seen_stores.add(store_path)
+            sources.append(('store', store_path))
+
+    return sources
+
+
+def build_chunks(sources, chunk_size):
+    """
+    将数据源划分为确定性的数据块
+
+    Args:
+        sources: collect_sources返回的数据源列表
+        chunk_size: 每个数据块包含的结构数
+
+    Returns:
+        chunks: 列表，元素为{'chunk_id', 'kind', 'path', 'items'}
+    """
+    chunks = []
+    for file_kind in ('file', 'structure'):
+        files = [path for kind, path in sources if kind == file_kind]
+        for start in range(0, len(files), chunk_size):
+            chunks.append({'kind': file_kind, 'path': None, 'items': files[start:start + chunk_size]})
+
+    for kind, path in sources:
+        if kind != 'store':
+            continue
+        with IndexedStructureStore(path) as store:
+            # 多链结构在适配阶段会被跳过，这里直接根据索引元数据过滤
+            keys = [key for key in store if not store.metadata(key)['if_multi_chain']]
+        for start in range(0, len(keys), chunk_size):
+            chunks.append({'kind': 'store', 'path': path, 'items': keys[start:start + chunk_size]})
+
+    for i, chunk in enumerate(chunks):
+        chunk['chunk_id'] = f"{i:06d}"
+    return chunks
+
+
+def structures_to_columns(structures, torsion_types):
+    """
+    将处理后的结构列表转换为逐残基的列数据
+
+    Args:
+        structures: process_pdb_file/adapt_training_dict_single返回的结构字典列表
+        torsion_types: 扭转角类型列表
+
+    Returns:
+        columns: 字典，键为列名，值为NumPy数组
+    """
+    columns = {name: [] for name in ['pdb_id', 'chain_id', 'residue_id', 'residue']}
+    for angle_name in torsion_types:
+        columns[angle_name] = []
+        columns[f"{angle_name}_mask"] = []
+
+    for structure in structures:
+        sequence = structure['sequence']
+        residue_ids = structure['sorted_residue_ids']
+        n = min(len(sequence), len(residue_ids))
+        if n == 0:
+            continue
+
+        columns['pdb_id'].append(np.full(n, structure['pdb_id'], dtype=object))
+        columns['chain_id'].append(np.full(n, structure['chain_id'], dtype=object))
+        columns['residue_id'].append(np.array([str(r) for r in residue_ids[:n]], dtype=object))
+        columns['residue'].append(np.array(list(sequence[:n]), dtype=object))
+
+        for angle_name in torsion_types:
+            angles = np.asarray(structure['torsion_angles'].get(angle_name, np.zeros(n)), dtype=np.float32)[:n]
+            masks = np.asarray(structure['torsion_masks'].get(angle_name, np.zeros(n)), dtype=np.int8)[:n]
+            columns[angle_name].append(angles)
+            columns[f"{angle_name}_mask"].append(masks)
+
+    return {
+        name: np.concatenate(values) if values else np.array([], dtype=object)
+        for name, values in columns.items()
+    }
+
+
+def _write_frame(df, path, output_format):
+    """以指定格式写出数据表（先写临时文件再重命名，保证分片完整）"""
+    tmp_path = path + ".tmp"
+    if output_format == "parquet":
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _featurize_chunk(chunk, torsion_types, parts_dir, output_format):
+    """工作进程：处理一个数据块并写出分片，返回(chunk_id, 结构数, 残基数)"""
+    if chunk['kind'] == 'file':
+        structures = []
+        for path in chunk['items']:
+            result = process_pdb_file(path)
+            if result is not None:
+                structures.append(result)
+    elif chunk['kind'] == 'structure':
+        structures = []
+        for path in chunk['items']:
+            structures.extend(process_structure_file(path))
+    else:
+        with IndexedStructureStore(chunk['path']) as store:
+            structures = adapt_training_dict_single({key: store[key] for key in chunk['items']})
+
+    columns = structures_to_columns(structures, torsion_types)
+    part_path = os.path.join(parts_dir, f"chunk_{chunk['chunk_id']}.{output_format}")
+    _write_frame(pd.DataFrame(columns), part_path, output_format)
+    return chunk['chunk_id'], len(structures), len(columns['pdb_id'])
+
+
+def _fingerprint(sources, chunks, torsion_types, output_format):
+    """计算任务指纹，输入（包括文件内容的大小/修改时间）或参数变化时拒绝复用旧进度"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([torsion_types, output_format]).encode())
+    for kind, path in sources:
+        digest.update(json.dumps([kind, os.path.abspath(path), source_identity(path)]).encode())
+    for chunk in chunks:
+        digest.update(json.dumps([chunk['chunk_id'], chunk['path'], [str(i) for i in chunk['items']]]).encode())
+    return digest.hexdigest()
+
+
+def _load_manifest(path):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return None
+
+
+def _save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def featurize(inputs, output_dir, torsion_types=None, num_workers=4, chunk_size=256,
+              output_format="parquet", resume=True):
+    """
+    并行提取逐残基扭转角表
+
+    Args:
+        inputs: 输入文件或目录列表
+        output_dir: 输出目录
+        torsion_types: 扭转角类型列表，默认使用Config.TORSION_TYPES
+        num_workers: 工作进程数
+        chunk_size: 每个数据块包含的结构数
+        output_format: 输出格式（'parquet'或'csv'）
+        resume: 是否复用已完成的数据块
+
+    Returns:
+        output_path: 合并后的输出文件路径
+
+    Raises:
+        RuntimeError: 有数据块处理失败（失败的数据块记录在进度文件中，重新运行时只重试这些数据块）
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {output_format}，可选: {OUTPUT_FORMATS}")
+    torsion_types = list(torsion_types or Config.TORSION_TYPES)
+
+    parts_dir = os.path.join(output_dir, PARTS_DIR)
+    os.makedirs(parts_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+
+    manifest = _load_manifest(manifest_path) if resume else None
+    layouts = dict(manifest.get('layouts', {})) if manifest is not None else {}
+    sources = collect_sources(inputs, output_dir, resume=resume, layouts=layouts)
+    chunks = build_chunks(sources, chunk_size)
+    fingerprint = _fingerprint(sources, chunks, torsion_types, output_format)
+    logger.info(f"共 {len(sources)} 个数据源，划分为 {len(chunks)} 个数据块")
+
+    if manifest is not None and manifest.get('fingerprint') != fingerprint:
+        raise ValueError(f"输出目录 {output_dir} 中的进度与当前输入或参数不一致，请更换输出目录或使用 --no_resume")
+    if manifest is None:
+        manifest = {'fingerprint': fingerprint, 'completed': {}}
+    manifest['layouts'] = layouts
+    _save_manifest(manifest_path, manifest)
+
+    completed = manifest['completed']
+    failed = manifest.setdefault('failed', {})
+    pending = [
+        chunk for chunk in chunks
+        if not (chunk['chunk_id'] in completed and
+                os.path.exists(os.path.join(parts_dir, f"chunk_{chunk['chunk_id']}.{output_format}")))
+    ]
+    logger.info(f"已完成 {len(chunks) - len(pending)} 个数据块，待处理 {len(pending)} 个")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=max(1, num_workers)) as executor:
+            futures = {
+                executor.submit(_featurize_chunk, chunk, torsion_types, parts_dir, output_format): chunk['chunk_id']
+                for chunk in pending
+            }
+            for future in as_completed(futures):
+                chunk_id = futures[future]
+                try:
+                    _, num_structures, num_residues = future.result()
+                except Exception as e:
+                    # 单个数据块失败不影响其他数据块，记录后继续
+                    failed[chunk_id] = f"{type(e).__name__}: {e}"
+                    _save_manifest(manifest_path, manifest)
+                    logger.error(f"数据块 {chunk_id} 处理失败: {failed[chunk_id]}")
+                    continue
+                failed.pop(chunk_id, None)
+                completed[chunk_id] = {'structures': num_structures, 'residues': num_residues}
+                _save_manifest(manifest_path, manifest)
+                logger.info(f"数据块 {chunk_id} 完成: {num_structures} 个结构, {num_residues} 个残基 "
+                            f"({len(completed)}/{len(chunks)})")
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} 个数据块处理失败（{', '.join(sorted(failed))}），未合并输出；"
+                           f"详情见 {manifest_path}，重新运行同一命令将只重试这些数据块")
+
+    # 按数据块顺序合并分片
+    output_path = os.path.join(output_dir, f"torsion_features.{output_format}")
+    part_paths = [os.path.join(parts_dir, f"chunk_{chunk['chunk_id']}.{output_format}") for chunk in chunks]
+    if output_format == "parquet":
+        frames = [pd.read_parquet(path) for path in part_paths]
+    else:
+        frames = [pd.read_csv(path, dtype={'residue_id': str}) for path in part_paths]
+    merged = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(structures_to_columns([], torsion_types))
+    _write_frame(merged, output_path, output_format)
+
+    total_structures = sum(info['structures'] for info in completed.values())
+    logger.info(f"扭转角表已保存到: {output_path}，共 {total_structures} 个结构, {len(merged)} 个残基")
+    return output_path
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="批量提取RNA扭转角")
+    parser.add_argument("--inputs", type=str, nargs="+", required=True, help="输入文件或目录")
+    parser.add_argument("--output_dir", type=str, required=True, help="输出目录")
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count(), help="工作进程数")
+    parser.add_argument("--chunk_size", type=int, default=256, help="每个数据块的结构数")
+    parser.add_argument("--format", type=str, default="parquet", choices=OUTPUT_FORMATS, help="输出格式")
+    parser.add_argument("--no_resume", action="store_true", help="忽略已有进度，重新处理")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    featurize(args.inputs, args.output_dir, num_workers=args.num_workers, chunk_size=args.chunk_size,
+              output_format=args.format, resume=not args.no_resume)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+饱和突变扫描脚本
+
+为一条RNA序列生成全部单点（可选双点）替换，按批次进行前向传播，
+逐变体、逐残基输出相对野生型的扭转角圆形差值。
+"""
+
+import os
+import sys
+import csv
+import logging
+import argparse
+from itertools import combinations, islice
+import numpy as np
+import torch
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+NUCLEOTIDES = "ACGU"
+
+
+def _scan_positions(sequence, positions):
+    if positions is None:
+        positions = range(len(sequence))
+    return sorted(set(p for p in positions if 0 <= p < len(sequence)))
+
+
+def count_variants(sequence, positions=None, double=False, nucleotides=NUCLEOTIDES):
+    """
+    不生成序列，直接计算generate_variants()产生的变体数
+
+    Args:
+        同generate_variants()
+
+    Returns:
+        count: 变体数
+    """
+    choices = [sum(base != sequence[pos] for base in nucleotides) for pos in _scan_positions(sequence, positions)]
+    total = sum(choices)
+    if double:
+        # 不同位置两两组合：sum_{i<j} k_i*k_j
+        total += (total ** 2 - sum(k * k for k in choices)) // 2
+    return total
+
+
+def generate_variants(sequence, positions=None, double=False, nucleotides=NUCLEOTIDES):
+    """
+    逐个生成突变体（不包含野生型）
+
+    替换碱基总是不同于野生型，不同的(位置, 碱基)单点突变和不同位置组合的双点突变
+    不会产生相同的序列，因此无需去重。
+
+    Args:
+        sequence: 野生型序列
+        positions: 可选的扫描位置（0起始），默认全部位置
+        double: 是否同时生成双点突变
+        nucleotides: 可替换的碱基
+
+    Yields:
+        (标签, 突变序列)，标签如"A12G"或"A12G:C15U"
+    """
+    singles = [
+        (pos, base) for pos in _scan_positions(sequence, positions) for base in nucleotides if base != sequence[pos]
+    ]
+
+    def label(mutations):
+        return ":".join(f"{sequence[pos]}{pos + 1}{base}" for pos, base in mutations)
+
+    def apply(mutations):
+        chars = list(sequence)
+        for pos, base in mutations:
+            chars[pos] = base
+        return "".join(chars)
+
+    for mutation in singles:
+        yield label((mutation,)), apply((mutation,))
+    if double:
+        for a, b in combinations(singles, 2):
+            if a[0] != b[0]:
+                yield label((a, b)), apply((a, b))
+
+
+def circular_delta(pred, reference):
+    """圆形差值（度），范围[-180, 180)"""
+    return torch.remainder(pred - reference + 180.0, 360.0) - 180.0
+
+
+def mutation_scan(model, alphabet, sequence, positions=None, double=False, batch_size=64, device=None):
+    """
+    批量突变扫描
+
+    Args:
+        model: RNATorsionPredictor模型
+        alphabet: RNA-FM字母表
+        sequence: 野生型序列
+        positions: 可选的扫描位置（0起始）
+        double: 是否包含双点突变
+        batch_size: 每次前向传播的变体数
+        device: 设备，默认与模型相同
+
+    Yields:
+        record: 字典，包含'variant'（标签）、'sequence'以及'deltas'
+                （键为扭转角类型，值为长度L的NumPy数组，变体减野生型）
+    """
+    if device is None:
+        device = next(model.parameters()).device
+    batch_converter = alphabet.get_batch_converter()
+    model.eval()
+
+    # 野生型只计算一次，作为所有变体的参照
+    _, _, wt_tokens = batch_converter([("WT", sequence)])
+    with torch.no_grad():
+        wt_predictions, _ = model(wt_tokens.to(device))
+    length = len(sequence)
+    wt = {angle: values[:, :length] for angle, values in wt_predictions.items()}
+
+    logger.info(f"序列长度 {length}，共 {count_variants(sequence, positions, double)} 个变体，批次大小 {batch_size}")
+
+    # 变体按批次惰性生成，内存中最多只有一个批次的序列；所有变体与野生型等长，每个批次都无需填充
+    variants = generate_variants(sequence, positions, double)
+    while True:
+        chunk = list(islice(variants, batch_size))
+        if not chunk:
+            break
+        _, _, tokens = batch_converter(chunk)
+        with torch.no_grad():
+            predictions, _ = model(tokens.to(device))
+
+        deltas = {
+            angle: circular_delta(values[:, :length], wt[angle]).cpu().numpy()
+            for angle, values in predictions.items()
+        }
+        for i, (label, mutated) in enumerate(chunk):
+            yield {
+                'variant': label,
+                'sequence': mutated,
+                'deltas': {angle: values[i] for angle, values in deltas.items()}
+            }
+
+
+def run_mutscan(sequence, model_path, output_dir, positions=None, double=False, batch_size=64, device="cuda"):
+    """
+    运行突变扫描并流式写出结果
+
+    输出两个文件:
+        mutscan_residues.csv: 每个变体每个残基的扭转角差值
+        mutscan_summary.csv: 每个变体的平均绝对差值
+
+    Args:
+        sequence: 野生型序列
+        model_path: 模型检查点路径
+        output_dir: 输出目录
+        positions: 可选的扫描位置（1起始，与输出标签一致）
+        double: 是否包含双点突变
+        batch_size: 每次前向传播的变体数
+        device: 设备（'cuda'或'cpu'）
+    """
+    from scripts.predict import load_model
+
+    os.makedirs(output_dir, exist_ok=True)
+    device = torch.device(device if torch.cuda.is_available() else "cpu")
+    model, alphabet, torsion_types = load_model(model_path, device)
+
+    sequence = sequence.upper().replace("T", "U")
+    zero_based = [p - 1 for p in positions] if positions else None
+
+    residues_path = os.path.join(output_dir, "mutscan_residues.csv")
+    summary_path = os.path.join(output_dir, "mutscan_summary.csv")
+    count = 0
+    with open(residues_path, 'w', newline='') as residues_file, open(summary_path, 'w', newline='') as summary_file:
+        residues_writer = csv.writer(residues_file)
+        summary_writer = csv.writer(summary_file)
+        residues_writer.writerow(['variant', 'residue_index', 'residue'] + [f"{a}_delta" for a in torsion_types])
+        summary_writer.writerow(['variant'] + [f"{a}_mean_abs_delta" for a in torsion_types])
+
+        positions_column = np.arange(1, len(sequence) + 1)
+        for record in mutation_scan(model, alphabet, sequence, zero_based, double, batch_size, device):
+            deltas = np.stack([record['deltas'][a] for a in torsion_types], axis=1).astype(np.float64)
+            residues_writer.writerows(
+                [record['variant'], pos, base, *row]
+                for pos, base, row in zip(positions_column, record['sequence'], np.round(deltas, 4).tolist())
+            )
+            summary_writer.writerow([record['variant'], *np.round(np.abs(deltas).mean(axis=0), 4).tolist()])
+            count += 1
+
+    logging.info(f"突变扫描完成: {count} 个变体，结果已保存到 {residues_path} 和 {summary_path}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="RNA饱和突变扫描")
+    parser.add_argument("--sequence", type=str, required=True, help="野生型RNA序列")
+    parser.add_argument("--model_path", type=str, required=True, help="模型检查点路径")
+    parser.add_argument("--output_dir", type=str, required=True, help="输出目录")
+    parser.add_argument("--positions", type=int, nargs="+", default=None, help="扫描位置（1起始），默认全部")
+    parser.add_argument("--double", action="store_true", help="同时扫描双点突变")
+    parser.add_argument("--batch_size", type=int, default=64, help="每次前向传播的变体数")
+    parser.add_argument("--device", type=str, default="cuda", help="设备（'cuda'或'cpu'）")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    run_mutscan(args.sequence, args.model_path, args.output_dir, args.positions,
+                args.double, args.batch_size, args.device)
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,7 @@ import sys
 import logging
 import torch
 import argparse
-import json
-import pandas as pd
+from itertools import islice
 from datetime import datetime
 
 # 添加项目根目录到路径
@@ -17,8 +16,15 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config.config import Config
 from data.preprocessing import process_pdb_file
-from models.torsion_predictor import RNATorsionPredictor
-import fm
+from data.structure_io import is_structure_file, process_structure_file
+from models.torsion_predictor import RNATorsionPredictor, load_checkpoint
+from models.backbones import load_backbone
+from models.attention import ATTENTION_IMPLEMENTATIONS, attention_override, set_attention_implementation
+from models.ensemble import TorsionEnsemble
+from utils.profiling import ProfilerSession
+from utils.adaptive_batching import AdaptiveBatcher, MemoryEstimator, default_memory_budget_mb
+from utils.prediction_cache import PredictionCache, file_sha256, model_cache_key, normalize_sequence
+from utils.prediction_writers import OUTPUT_FORMATS, BULK_FORMATS, prediction_columns, open_writer
 
 def setup_logger(log_dir):
     """设置日志记录器"""
@@ -48,15 +54,33 @@ def setup_logger(log_dir):
     
     return logger
 
-def predict(input_file, model_path, output_dir, device="cuda"):
+def predict(input_file, model_path, output_dir, device="cuda", chains=None, profile=False, profile_steps=3,
+            mc_samples=0, cache=None, output_formats=("csv", "json"), bulk=False, backbone_path=None, attention=None,
+            memory_budget_mb=None, max_batch_size=Config.INFERENCE_MAX_BATCH_SIZE):
     """
     预测RNA扭转角
     
     Args:
-        input_file: 输入的pkl文件路径
-        model_path: 模型检查点路径
+        input_file: 输入的pkl文件或PDB/mmCIF结构文件路径，也可以是目录或路径列表（逐个文件流式处理）
+        model_path: 模型检查点路径；给出多个路径时以集成模式预测（共享一次RNA-FM前向传播），
+                    并额外输出每种扭转角的圆形方差
         output_dir: 输出目录
         device: 设备（'cuda'或'cpu'）
+        chains: 可选的链ID列表（仅对结构文件有效）
+        profile: 是否用torch.profiler采集前profile_steps个窗口的预测，结果保存在output_dir/profile
+        profile_steps: 采集的窗口数（每个窗口最多Config.PREDICT_WINDOW条链）
+        mc_samples: 大于0时使用Monte-Carlo dropout估计不确定度（采样次数），额外输出每种扭转角的集中度
+        cache: 可选的PredictionCache，相同序列、检查点和选项的预测只计算一次
+        output_formats: 输出格式列表（csv/json/jsonl/parquet）
+        bulk: 批量模式，所有结构流式追加到output_dir/predictions.<格式>（带pdb_id列），
+              否则每个结构输出<pdb_id>_predictions.<格式>
+        backbone_path: 骨干网络权重的本地路径（.safetensors文件以mmap方式加载）
+        attention: 骨干网络注意力实现（dense/sdpa/chunked，None表示使用Config.BACKBONE_ATTENTION）
+        memory_budget_mb: 单个批次的内存预算（MB，None表示按设备自动选择，见create_batcher）
+        max_batch_size: 批次大小上限（1表示逐条预测）
+    
+    Returns:
+        cache_stats: 缓存命中统计（未使用缓存时为None）
     """
     # 创建输出目录
     os.makedirs(output_dir, exist_ok=True)
@@ -65,107 +89,362 @@ def predict(input_file, model_path, output_dir, device="cuda"):
     device = torch.device(device if torch.cuda.is_available() else "cpu")
     logging.info(f"使用设备: {device}")
     
+    model, alphabet, torsion_types = load_model(model_path, device, backbone_path, attention)
+    if mc_samples > 0 and isinstance(model, TorsionEnsemble):
+        raise ValueError("集成模式已提供圆形方差不确定度，不能同时使用Monte-Carlo dropout")
+    
+    if bulk and any(fmt not in BULK_FORMATS for fmt in output_formats):
+        raise ValueError(f"批量模式支持的输出格式: {', '.join(BULK_FORMATS)}")
+    
+    batcher = create_batcher(model, device, memory_budget_mb, max_batch_size, mc_samples)
+    
+    profiler = ProfilerSession(os.path.join(output_dir, "profile"), enabled=profile,
+                               wait=0, warmup=0, active=profile_steps)
+    bulk_writers = []
+    if bulk:
+        bulk_writers = [open_writer(fmt, os.path.join(output_dir, f"predictions.{fmt}"), bulk=True)
+                        for fmt in output_formats]
+    profiler.start()
+    num_structures = 0
+    try:
+        structures = iter_structures(input_file, chains)
+        # 按窗口读取结构，窗口内的序列由batcher按长度和内存预算组合成批次，结果按输入顺序写出
+        while True:
+            window = list(islice(structures, Config.PREDICT_WINDOW))
+            if not window:
+                break
+            num_structures += len(window)
+            sequences = [result['sequence'] for _, result in window]
+            window_arrays = predict_sequences(model, alphabet, sequences, device, mc_samples, cache, batcher=batcher)
+            profiler.step()
+            
+            for (pdb_id, result), arrays in zip(window, window_arrays):
+                sequence = result['sequence']
+                logging.info(f"{pdb_id} 序列长度: {len(sequence)}")
+                if arrays is None:
+                    logging.error(f"{pdb_id} 单独预测仍然内存不足，已跳过")
+                    continue
+                columns = prediction_columns(result, arrays, torsion_types)
+                
+                if bulk:
+                    for writer in bulk_writers:
+                        writer.write(pdb_id, sequence, columns)
+                    continue
+                
+                for fmt in output_formats:
+                    path = os.path.join(output_dir, f"{pdb_id}_predictions.{fmt}")
+                    with open_writer(fmt, path) as writer:
+                        writer.write(pdb_id, sequence, columns)
+                    logging.info(f"预测结果已保存到: {path}")
+    finally:
+        for writer in bulk_writers:
+            writer.close()
+            logging.info(f"预测结果已保存到: {writer.path}（{writer.rows} 行）")
+    
+    profiler.stop()
+    batcher.log_stats()
+    if num_structures == 0:
+        logging.error(f"无法处理文件: {input_file}")
+        return None
+    
+    cache_stats = None
+    if cache is not None:
+        cache_stats = cache.stats()
+        logging.info(f"预测缓存: 内存命中 {cache_stats['memory_hits']}，磁盘命中 {cache_stats['disk_hits']}，"
+                     f"未命中 {cache_stats['misses']}，命中率 {cache_stats['hit_rate']:.1%}")
+    logging.info("预测完成")
+    return cache_stats
+
+def create_prediction_cache(cache_dir=None, memory_items=Config.PREDICTION_CACHE_MEMORY_ITEMS,
+                            max_mb=Config.PREDICTION_CACHE_MAX_MB):
+    """
+    创建预测缓存
+    
+    Args:
+        cache_dir: 磁盘缓存目录（None表示只使用内存缓存）
+        memory_items: 内存LRU中保留的序列数
+        max_mb: 磁盘缓存的总大小上限（MB）
+    
+    Returns:
+        cache: PredictionCache
+    """
+    return PredictionCache(memory_items, cache_dir, int(max_mb * 1024 ** 2))
+
+def load_model(model_path, device, backbone_path=None, attention=None):
+    """
+    加载RNA-FM和训练好的扭转角预测头
+    
+    Args:
+        model_path: 模型检查点路径（.pth或.safetensors），或多个检查点路径的列表（集成模式，所有成员共享一个RNA-FM）
+        device: torch.device
+        backbone_path: 骨干网络权重的本地路径（.safetensors文件以mmap方式加载，同一主机上的进程共享页缓存）
+        attention: 骨干网络注意力实现（dense/sdpa/chunked，None表示使用Config.BACKBONE_ATTENTION）
+    
+    Returns:
+        model: 处于评估模式的RNATorsionPredictor（多个检查点时为TorsionEnsemble）
+        alphabet: RNA-FM字母表
+        torsion_types: 检查点中的扭转角类型列表
+    """
+    model_paths = [model_path] if isinstance(model_path, str) else list(model_path)
+    
+    # 加载检查点以获取扭转角类型和训练时使用的骨干网络
+    logging.info(f"加载模型检查点: {model_paths[0]}")
+    checkpoint = load_checkpoint(model_paths[0])
+    
     # 加载RNA-FM模型
     logging.info("加载RNA-FM模型...")
-    rna_fm_model, alphabet = fm.pretrained.rna_fm_t12()
+    rna_fm_model, alphabet = load_backbone(checkpoint.get('backbone', "rna_fm_t12"), backbone_path)
     rna_fm_model.eval()  # 设为评估模式
     rna_fm_model.to(device)
+    set_attention_implementation(rna_fm_model, attention or Config.BACKBONE_ATTENTION, Config.BACKBONE_ATTENTION_CHUNK)
     logging.info("RNA-FM模型加载完成")
     
-    # 加载检查点以获取扭转角类型
-    logging.info(f"加载模型检查点: {model_path}")
-    checkpoint = torch.load(model_path, map_location="cpu")
-    torsion_types = checkpoint['torsion_types']
-    
-    # 创建模型
-    model = RNATorsionPredictor(rna_fm_model, alphabet, torsion_types)
-    
-    # 加载模型参数
-    model.feature_extractor.load_state_dict(checkpoint['feature_extractor'])
-    model.regression_heads.load_state_dict(checkpoint['regression_heads'])
+    # 创建模型并加载参数
+    if len(model_paths) > 1:
+        model = TorsionEnsemble.from_checkpoints(model_paths, rna_fm_model, alphabet)
+        logging.info(f"集成模式: {len(model_paths)} 个检查点共享一个RNA-FM")
+    else:
+        model = RNATorsionPredictor.from_checkpoint(checkpoint, rna_fm_model, alphabet)
     model.to(device)
     model.eval()
     
-    # 处理输入文件
-    logging.info(f"处理输入文件: {input_file}")
+    # 检查点内容哈希作为预测缓存的模型标识（集成模式组合各成员的哈希）
+    model.model_id = "+".join(sorted(file_sha256(path) for path in model_paths))
+    
+    return model, alphabet, model.torsion_types
+
+def load_structures(input_file, chains=None):
+    """
+    读取预测输入
+    
+    Args:
+        input_file: pkl文件或PDB/mmCIF结构文件（可带.gz）
+        chains: 可选的链ID列表（仅对结构文件有效）
+    
+    Returns:
+        structures: 结构结果字典列表
+    """
+    if is_structure_file(input_file):
+        return process_structure_file(input_file, chains)
+    
     result = process_pdb_file(input_file)
+    return [result] if result is not None else []
+
+def expand_inputs(input_file):
+    """
+    将输入展开为文件列表（目录中按文件名顺序取pkl和PDB/mmCIF文件）
     
-    if result is None:
-        logging.error(f"无法处理文件: {input_file}")
-        return
-    
-    # 提取序列
-    sequence = result['sequence']
-    logging.info(f"序列长度: {len(sequence)}")
-    
-    # 将序列转换为token
-    data = [("RNA", sequence)]
-    _, _, tokens = alphabet.get_batch_converter()(data)
-    tokens = tokens.to(device)
-    
-    # 预测
-    logging.info("进行预测...")
-    with torch.no_grad():
-        predictions, _ = model(tokens)
-    
-    # 准备结果
-    results = []
-    
-    for i in range(len(sequence)):
-        residue_result = {
-            'residue_id': result['sorted_residue_ids'][i] if i < len(result['sorted_residue_ids']) else i + 1,
-            'residue': sequence[i] if i < len(sequence) else "X",
-        }
-        
-        # 添加每种扭转角的预测值
-        for angle_name in torsion_types:
-            if angle_name in predictions and i < predictions[angle_name].shape[1]:
-                residue_result[f"{angle_name}_pred"] = float(predictions[angle_name][0, i].cpu().numpy())
+    Args:
+        input_file: 文件或目录路径，或路径列表
+    
+    Returns:
+        paths: 文件路径列表
+    """
+    inputs = [input_file] if isinstance(input_file, str) else list(input_file)
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            paths.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.endswith(".pkl") or is_structure_file(name))
+        else:
+            paths.append(path)
+    return paths
+
+def iter_structures(input_file, chains=None):
+    """
+    逐个读取输入文件，生成(pdb_id, 结构字典)
+    
+    Args:
+        input_file: 见expand_inputs()
+        chains: 可选的链ID列表（仅对结构文件有效）
+    """
+    for path in expand_inputs(input_file):
+        logging.info(f"处理输入文件: {path}")
+        structures = load_structures(path, chains)
+        if not structures:
+            logging.error(f"无法处理文件: {path}")
+            continue
+        for result in structures:
+            # 结构文件可能包含多条RNA链，按链分别输出
+            if is_structure_file(path):
+                yield f"{result['pdb_id']}_{result['chain_id']}", result
             else:
-                residue_result[f"{angle_name}_pred"] = None
-        
-        # 如果有真实值，也添加
-        if 'torsion_angles' in result:
-            for angle_name in torsion_types:
-                if angle_name in result['torsion_angles'] and i < len(result['torsion_angles'][angle_name]):
-                    # 检查掩码是否为有效值
-                    if result['torsion_masks'][angle_name][i] > 0:
-                        residue_result[f"{angle_name}_true"] = result['torsion_angles'][angle_name][i]
-                    else:
-                        residue_result[f"{angle_name}_true"] = None
-                else:
-                    residue_result[f"{angle_name}_true"] = None
+                yield os.path.basename(path).split('.')[0], result
+
+def predict_sequence(model, alphabet, sequence, device, mc_samples=0, cache=None, head=None):
+    """
+    预测单条序列，返回逐残基的numpy数组
+    
+    Args:
+        model: 扭转角预测模型
+        alphabet: RNA-FM字母表
+        sequence: RNA序列
+        device: 设备
+        mc_samples: Monte-Carlo dropout采样次数（0表示普通预测）
+        cache: 可选的PredictionCache
+        head: 预测头名称（None表示默认头；集成模式不支持）
+    
+    Returns:
+        arrays: 字典，键为扭转角类型（预测值）或"<扭转角>_<不确定度名称>"，值为[seq_len]数组
+    """
+    return predict_sequences(model, alphabet, [sequence], device, mc_samples, cache, head)[0]
+
+def predict_sequences(model, alphabet, sequences, device, mc_samples=0, cache=None, head=None, batcher=None):
+    """
+    批量预测多条序列：先查缓存，未命中的序列按batcher划分批次运行前向传播
+    
+    Args:
+        model: 扭转角预测模型
+        alphabet: RNA-FM字母表
+        sequences: RNA序列列表
+        device: 设备
+        mc_samples: Monte-Carlo dropout采样次数（0表示普通预测）
+        cache: 可选的PredictionCache
+        head: 预测头名称（None表示默认头；集成模式不支持）
+        batcher: 可选的AdaptiveBatcher（None表示所有未命中的序列作为一个批次）
+    
+    Returns:
+        results: 与sequences一一对应的数组字典（见predict_sequence）；
+                 batcher跳过的内存不足的序列为None
+    """
+    # 只取一次预测头快照：缓存键和前向传播使用同一个版本，预测过程中替换预测头不影响本次结果
+    head_kwargs = {}
+    if isinstance(model, RNATorsionPredictor):
+        head_kwargs['head'] = model.get_head(head)
+    elif head is not None:
+        raise ValueError("集成模式不支持选择预测头")
+    
+    sequences = [normalize_sequence(sequence) for sequence in sequences]
+    results = [None] * len(sequences)
+    keys = [None] * len(sequences)
+    pending = {}  # 序列 -> 需要该序列结果的位置
+    for i, sequence in enumerate(sequences):
+        if cache is not None:
+            keys[i] = model_cache_key(model, sequence, mc_samples=mc_samples, **head_kwargs)
+            results[i] = cache.get(keys[i]) if keys[i] is not None else None
+            if results[i] is not None:
+                continue
+        pending.setdefault(sequence, []).append(i)
+    if not pending:
+        return results
+    
+    unique = list(pending)
+    batch_converter = alphabet.get_batch_converter()
+    
+    def run(indices):
+        _, _, tokens = batch_converter([("RNA", unique[i]) for i in indices])
+        tokens = tokens.to(device)
+        if mc_samples > 0:
+            predictions, uncertainty = model.predict_with_uncertainty(tokens, mc_samples, **head_kwargs)
+        else:
+            with torch.no_grad():
+                predictions, extra = model(tokens, **head_kwargs)
+            # 集成模式额外返回每种扭转角的不确定度（圆形方差）
+            uncertainty = extra if isinstance(model, TorsionEnsemble) else {}
         
-        results.append(residue_result)
-    
-    # 保存结果
-    pdb_id = os.path.basename(input_file).split('.')[0]
-    
-    # 保存为CSV
-    csv_path = os.path.join(output_dir, f"{pdb_id}_predictions.csv")
-    pd.DataFrame(results).to_csv(csv_path, index=False)
-    logging.info(f"预测结果已保存到: {csv_path}")
-    
-    # 保存为JSON
-    json_path = os.path.join(output_dir, f"{pdb_id}_predictions.json")
-    with open(json_path, 'w') as f:
-        json.dump({
-            'pdb_id': pdb_id,
-            'sequence': sequence,
-            'predictions': results
-        }, f, indent=2)
-    logging.info(f"预测结果已保存到: {json_path}")
+        outputs = []
+        for row, i in enumerate(indices):
+            length = len(unique[i])
+            arrays = {}
+            for angle_name, values in predictions.items():
+                arrays[angle_name] = values[row, :length].cpu().numpy()
+                for name, extra_values in uncertainty.get(angle_name, {}).items():
+                    arrays[f"{angle_name}_{name}"] = extra_values[row, :length].cpu().numpy()
+            outputs.append(arrays)
+        return outputs
     
-    logging.info("预测完成")
+    def run_chunked(indices):
+        # 单条序列内存不足时临时使用查询分块的注意力
+        with attention_override(model.rna_fm, "chunked", Config.BACKBONE_ATTENTION_CHUNK):
+            return run(indices)
+    
+    logging.info(f"进行预测（{len(unique)} 条序列）...")
+    if batcher is None:
+        outputs = run(list(range(len(unique))))
+    else:
+        outputs = batcher.run([len(sequence) + 2 for sequence in unique], run, fallback=run_chunked, skip_failed=True)
+    
+    for sequence, arrays in zip(unique, outputs):
+        for i in pending[sequence]:
+            results[i] = arrays
+            if arrays is not None and keys[i] is not None:
+                cache.put(keys[i], arrays)
+    return results
+
+def create_batcher(model, device, memory_budget_mb=None, max_batch_size=Config.INFERENCE_MAX_BATCH_SIZE, mc_samples=0,
+                   pad_tolerance=Config.INFERENCE_PAD_TOLERANCE):
+    """
+    创建按内存预算划分批次的AdaptiveBatcher
+    
+    Args:
+        model: 扭转角预测模型
+        device: 设备
+        memory_budget_mb: 单个批次的内存预算（MB，None表示GPU上取空闲显存的80%，CPU上取Config.INFERENCE_MEMORY_BUDGET_MB）
+        max_batch_size: 批次大小上限
+        mc_samples: Monte-Carlo dropout采样次数
+        pad_tolerance: 每个批次允许的最大填充比例（None表示不限制）
+    
+    Returns:
+        batcher: AdaptiveBatcher
+    """
+    if memory_budget_mb is None:
+        memory_budget_mb = default_memory_budget_mb(device, Config.INFERENCE_MEMORY_BUDGET_MB)
+    logging.info(f"自适应批次: 内存预算 {memory_budget_mb:.0f}MB，批次上限 {max_batch_size} 条")
+    return AdaptiveBatcher(MemoryEstimator.from_model(model), memory_budget_mb, max_batch_size, mc_samples,
+                           pad_tolerance)
+
+def predict_structure(model, alphabet, result, torsion_types, device, mc_samples=0, cache=None, head=None):
+    """
+    预测单个结构的扭转角
+    
+    Args:
+        model: 扭转角预测模型
+        alphabet: RNA-FM字母表
+        result: process_pdb_file/process_structure_file返回的结构字典
+        torsion_types: 扭转角类型列表
+        device: 设备
+        mc_samples: Monte-Carlo dropout采样次数（0表示普通预测）
+        cache: 可选的PredictionCache
+        head: 预测头名称（None表示默认头）
+    
+    Returns:
+        columns: 逐残基的结果列（见utils.prediction_writers.prediction_columns）
+    """
+    arrays = predict_sequence(model, alphabet, result['sequence'], device, mc_samples, cache, head)
+    return prediction_columns(result, arrays, torsion_types)
 
 def main():
     """主函数"""
     # 解析命令行参数
     parser = argparse.ArgumentParser(description="预测RNA扭转角")
-    parser.add_argument("--input_file", type=str, required=True, help="输入的pkl文件路径")
-    parser.add_argument("--model_path", type=str, required=True, help="模型检查点路径")
+    parser.add_argument("--input_file", type=str, nargs="+", required=True,
+                        help="输入的pkl文件或PDB/mmCIF结构文件路径（可以给出多个文件或目录）")
+    parser.add_argument("--model_path", type=str, nargs="+", required=True,
+                        help="模型检查点路径（给出多个时以集成模式预测，共享一次RNA-FM前向传播）")
     parser.add_argument("--output_dir", type=str, required=True, help="输出目录")
     parser.add_argument("--device", type=str, default="cuda", help="设备（'cuda'或'cpu'）")
+    parser.add_argument("--chains", type=str, nargs="+", default=None, help="只预测指定的链（仅对结构文件有效）")
+    parser.add_argument("--profile", action="store_true", help="用torch.profiler采集预测过程")
+    parser.add_argument("--profile_steps", type=int, default=3, help="采集的预测窗口数")
+    parser.add_argument("--mc_samples", type=int, default=0, help="Monte-Carlo dropout采样次数（0表示不估计不确定度）")
+    parser.add_argument("--cache_dir", type=str, default=Config.PREDICTION_CACHE_DIR,
+                        help="预测缓存目录（按序列、检查点内容和选项寻址，跨运行复用）")
+    parser.add_argument("--cache_memory_items", type=int, default=Config.PREDICTION_CACHE_MEMORY_ITEMS,
+                        help="内存缓存的序列数")
+    parser.add_argument("--cache_max_mb", type=float, default=Config.PREDICTION_CACHE_MAX_MB, help="磁盘缓存的大小上限（MB）")
+    parser.add_argument("--no_cache", action="store_true", help="不使用预测缓存")
+    parser.add_argument("--output_formats", type=str, nargs="+", default=["csv", "json"], choices=OUTPUT_FORMATS,
+                        help="输出格式")
+    parser.add_argument("--bulk", action="store_true",
+                        help="批量模式：所有结构流式写入output_dir/predictions.<格式>（csv/jsonl/parquet）")
+    parser.add_argument("--backbone_path", type=str, default=Config.BACKBONE_PATH,
+                        help="骨干网络权重路径（.safetensors以mmap方式加载）")
+    parser.add_argument("--attention", type=str, default=Config.BACKBONE_ATTENTION, choices=ATTENTION_IMPLEMENTATIONS,
+                        help="骨干网络注意力实现（sdpa/chunked不物化完整的注意力矩阵，适合长序列）")
+    parser.add_argument("--memory_budget_mb", type=float, default=None,
+                        help="单个批次前向传播的内存预算（MB，默认GPU上取空闲显存的80%%，CPU上取配置值）")
+    parser.add_argument("--max_batch_size", type=int, default=Config.INFERENCE_MAX_BATCH_SIZE,
+                        help="批次大小上限（1表示逐条预测）")
     
     args = parser.parse_args()
     
@@ -182,7 +461,11 @@ def main():
     logging.info(f"设备: {args.device}")
     
     # 执行预测
-    predict(args.input_file, args.model_path, args.output_dir, args.device)
+    cache = None if args.no_cache else create_prediction_cache(args.cache_dir, args.cache_memory_items,
+                                                               args.cache_max_mb)
+    predict(args.input_file, args.model_path, args.output_dir, args.device, args.chains,
+            args.profile, args.profile_steps, args.mc_samples, cache, args.output_formats, args.bulk,
+            args.backbone_path, args.attention, args.memory_budget_mb, args.max_batch_size)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,525 @@
+# scripts/serve.py
+"""
+asyncio预测接口与本地预测服务
+
+AsyncTorsionPredictor在专用的单线程执行器中运行推理：并发的await predict(seq)
+先进入有界队列（队列满时等待，形成背压），工作协程把等待中的请求合并为一个批次，
+交给scripts.predict.predict_sequences（预测缓存、按内存预算组批）一次完成，
+事件循环不会被前向传播阻塞。请求被取消时，尚未开始计算的序列不再进入批次。
+
+serve()把AsyncTorsionPredictor暴露为本地TCP服务（每行一个JSON请求/响应），
+AsyncTorsionClient是对应的客户端，predict/stats/swap_head的接口与本地预测器相同。
+
+协议（UTF-8，每行一个JSON对象）:
+    {"id": 1, "op": "predict", "sequence": "ACGU...", "head": null}
+    {"id": 2, "op": "stats"}
+    {"id": 3, "op": "swap_head", "checkpoint": "head.safetensors", "name": "default", "strict": true}
+    {"id": 1, "op": "cancel"}          # 取消id为1的请求（不返回响应）
+响应:
+    {"id": 1, "result": {...}} 或 {"id": 1, "error": "..."}
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import Config
+from models.torsion_predictor import DEFAULT_HEAD, RNATorsionPredictor
+from scripts.predict import load_model, predict_sequences, create_batcher, create_prediction_cache
+
+logger = logging.getLogger(__name__)
+
+# 单个响应（长序列的全部扭转角和不确定度）可能超过asyncio默认的64KB行长度上限
+_STREAM_LIMIT = 1 << 24
+
+
+class AsyncTorsionPredictor:
+    """在专用执行器中运行推理、合并并发请求的asyncio预测器"""
+
+    def __init__(self, model, alphabet, device, mc_samples=0, cache=None, batcher=None,
+                 max_batch_size=Config.INFERENCE_MAX_BATCH_SIZE, max_wait_ms=Config.SERVE_MAX_WAIT_MS,
+                 max_queue=Config.SERVE_MAX_QUEUE):
+        """
+        Args:
+            model: 处于评估模式的RNATorsionPredictor或TorsionEnsemble
+            alphabet: RNA-FM字母表
+            device: 设备
+            mc_samples: Monte-Carlo dropout采样次数（0表示普通预测）
+            cache: 可选的PredictionCache（线程安全，执行器线程内读写）
+            batcher: 可选的AdaptiveBatcher，合并后的请求再按内存预算划分批次
+            max_batch_size: 每次合并的最大请求数
+            max_wait_ms: 第一个请求到达后等待更多请求合并的最长时间（毫秒）
+            max_queue: 等待队列的容量，队列满时predict()等待（背压）
+        """
+        self.model = model
+        self.alphabet = alphabet
+        self.device = device
+        self.mc_samples = mc_samples
+        self.cache = cache
+        self.batcher = batcher
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        # 单线程执行器：同一时刻只有一个批次在计算，其间到达的请求在队列中累积成下一个批次
+        self._executor = None
+        self._queue = None
+        self._worker = None
+        self._stats = {'requests': 0, 'completed': 0, 'cancelled': 0, 'failed': 0, 'batches': 0}
+
+    @classmethod
+    def from_checkpoint(cls, model_path, device="cuda", backbone_path=None, attention=None, cache=None,
+                        memory_budget_mb=None, mc_samples=0, **kwargs):
+        """
+        加载检查点并创建预测器（同scripts.predict.load_model）
+
+        Args:
+            model_path: 检查点路径，或多个路径的列表（集成模式）
+            device: 设备
+            backbone_path: 骨干网络权重的本地路径
+            attention: 骨干网络注意力实现
+            cache: 可选的PredictionCache
+            memory_budget_mb: 单个批次的内存预算（MB，None表示按设备自动选择）
+            mc_samples: Monte-Carlo dropout采样次数
+            **kwargs: 传给构造函数的其他参数
+
+        Returns:
+            predictor: AsyncTorsionPredictor（尚未启动）
+        """
+        device = torch.device(device if torch.cuda.is_available() else "cpu")
+        model, alphabet, _ = load_model(model_path, device, backbone_path, attention)
+        max_batch_size = kwargs.get('max_batch_size', Config.INFERENCE_MAX_BATCH_SIZE)
+        batcher = create_batcher(model, device, memory_budget_mb, max_batch_size, mc_samples)
+        return cls(model, alphabet, device, mc_samples, cache, batcher, **kwargs)
+
+    async def start(self):
+        """启动执行器和合并批次的工作协程"""
+        if self._worker is not None:
+            return self
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="torsion-predict")
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = asyncio.create_task(self._run())
+        return self
+
+    async def close(self):
+        """停止工作协程，取消仍在等待的请求，并关闭执行器"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        self._worker = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _resolve_head(self, head):
+        # 提交时取预测头快照：请求使用提交时的版本，合并批次时按快照分组
+        if isinstance(self.model, RNATorsionPredictor):
+            return self.model.get_head(head)
+        if head is not None:
+            raise ValueError("集成模式不支持选择预测头")
+        return None
+
+    async def submit(self, sequence, head=None):
+        """
+        提交一条序列，队列满时等待
+
+        Args:
+            sequence: RNA序列
+            head: 预测头名称（None表示默认头）
+
+        Returns:
+            future: 结果为预测数组字典的asyncio.Future
+        """
+        if self._worker is None:
+            raise RuntimeError("预测器尚未启动，请先调用start()或使用async with")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((sequence, self._resolve_head(head), future))
+        self._stats['requests'] += 1
+        return future
+
+    async def predict(self, sequence, head=None):
+        """
+        预测单条序列
+
+        Args:
+            sequence: RNA序列
+            head: 预测头名称（None表示默认头；集成模式不支持）
+
+        Returns:
+            arrays: 字典，键为扭转角类型（预测值）或"<扭转角>_<不确定度名称>"，值为[seq_len]数组
+        """
+        future = await self.submit(sequence, head)
+        try:
+            # shield之外取消：调用方被取消时只取消这个future，工作协程据此跳过该请求
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    def swap_head(self, checkpoint, name=DEFAULT_HEAD, strict=True):
+        """替换或新增预测头（见RNATorsionPredictor.swap_head），已提交的请求仍使用提交时的版本"""
+        if not isinstance(self.model, RNATorsionPredictor):
+            raise ValueError("集成模式不支持替换预测头")
+        return self.model.swap_head(checkpoint, name, strict)
+
+    def stats(self):
+        """
+        返回请求、批次、缓存和内存组批的统计
+
+        Returns:
+            stats: 字典，含requests、completed、cancelled、failed、batches、mean_batch_size、queue_depth，
+                   以及cache（PredictionCache.stats()）和batcher（AdaptiveBatcher.stats()）
+        """
+        stats = dict(self._stats)
+        stats['mean_batch_size'] = stats['completed'] / stats['batches'] if stats['batches'] else 0.0
+        stats['queue_depth'] = self._queue.qsize() if self._queue is not None else 0
+        stats['cache'] = self.cache.stats() if self.cache is not None else None
+        stats['batcher'] = self.batcher.stats() if self.batcher is not None else None
+        return stats
+
+    async def _collect(self):
+        """取出第一个请求，再在max_wait内合并更多请求，最多max_batch_size个"""
+        items = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(items) < self.max_batch_size:
+            if not self._queue.empty():
+                items.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._collect()
+            live = [item for item in items if not item[2].done()]
+            self._stats['cancelled'] += len(items) - len(live)
+
+            # 同一批次内按预测头快照分组，每组一次predict_sequences
+            groups = {}
+            for item in live:
+                groups.setdefault(id(item[1]), []).append(item)
+            for group in groups.values():
+                sequences = [sequence for sequence, _, _ in group]
+                head = group[0][1]
+                try:
+                    results = await loop.run_in_executor(
+                        self._executor, predict_sequences, self.model, self.alphabet, sequences, self.device,
+                        self.mc_samples, self.cache, head, self.batcher)
+                except asyncio.CancelledError:
+                    for _, _, future in group:
+                        future.cancel()
+                    raise
+                except Exception as error:
+                    logger.exception("批次预测失败")
+                    for _, _, future in group:
+                        if not future.done():
+                            future.set_exception(error)
+                    self._stats['failed'] += len(group)
+                    continue
+
+                self._stats['batches'] += 1
+                for (sequence, _, future), arrays in zip(group, results):
+                    if future.done():
+                        # 计算期间被取消
+                        self._stats['cancelled'] += 1
+                    elif arrays is None:
+                        future.set_exception(MemoryError(f"长度为 {len(sequence)} 的序列单独预测仍然内存不足"))
+                        self._stats['failed'] += 1
+                    else:
+                        future.set_result(arrays)
+                        self._stats['completed'] += 1
+
+
+# ---------------------------------------------------------------------------
+# 本地预测服务
+# ---------------------------------------------------------------------------
+
+def _encode(message):
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8')
+
+
+async def _handle_connection(predictor, reader, writer):
+    """处理一个客户端连接：每个predict请求一个任务，响应按完成顺序写回"""
+    tasks = {}
+    write_lock = asyncio.Lock()
+    loop = asyncio.get_running_loop()
+
+    async def respond(message):
+        async with write_lock:
+            writer.write(_encode(message))
+            await writer.drain()
+
+    async def run_predict(request_id, future):
+        try:
+            arrays = await future
+            await respond({'id': request_id, 'result': {name: values.tolist() for name, values in arrays.items()}})
+        except asyncio.CancelledError:
+            future.cancel()
+        except Exception as error:
+            await respond({'id': request_id, 'error': f"{type(error).__name__}: {error}"})
+        finally:
+            tasks.pop(request_id, None)
+
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            request_id = None
+            try:
+                request = json.loads(line)
+                request_id = request.get('id')
+                op = request.get('op', "predict")
+                if op == "predict":
+                    # 等到队列有空位才读取下一行：队列满时背压传递到客户端的TCP连接
+                    future = await predictor.submit(request['sequence'], request.get('head'))
+                    tasks[request_id] = asyncio.create_task(run_predict(request_id, future))
+                elif op == "cancel":
+                    task = tasks.get(request_id)
+                    if task is not None:
+                        task.cancel()
+                elif op == "stats":
+                    await respond({'id': request_id, 'result': predictor.stats()})
+                elif op == "swap_head":
+                    # 加载检查点在默认线程池中进行，不等待推理执行器
+                    head = await loop.run_in_executor(
+                        None, predictor.swap_head, request['checkpoint'], request.get('name', DEFAULT_HEAD),
+                        request.get('strict', True))
+                    await respond({'id': request_id, 'result': {'name': head.name, 'model_id': head.model_id,
+                                                                'torsion_types': head.torsion_types}})
+                else:
+                    raise ValueError(f"未知的请求类型: {op}")
+            except Exception as error:
+                await respond({'id': request_id, 'error': f"{type(error).__name__}: {error}"})
+    finally:
+        # 连接断开时取消该连接上所有未完成的请求
+        for task in list(tasks.values()):
+            task.cancel()
+        writer.close()
+
+
+async def serve(predictor, host=Config.SERVE_HOST, port=Config.SERVE_PORT, ready=None):
+    """
+    以TCP服务运行预测器，直到被取消
+
+    Args:
+        predictor: AsyncTorsionPredictor
+        host: 监听地址（默认只监听本机）
+        port: 监听端口（0表示由系统分配）
+        ready: 可选的asyncio.Future，服务开始监听后设为实际的(host, port)
+    """
+    async with predictor:
+        server = await asyncio.start_server(lambda r, w: _handle_connection(predictor, r, w),
+                                            host, port, limit=_STREAM_LIMIT)
+        address = server.sockets[0].getsockname()[:2]
+        logger.info(f"预测服务监听 {address[0]}:{address[1]}")
+        if ready is not None:
+            ready.set_result(address)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            logger.info(f"预测服务停止，统计: {predictor.stats()}")
+
+
+class AsyncTorsionClient:
+    """本地预测服务的asyncio客户端，接口与AsyncTorsionPredictor相同"""
+
+    def __init__(self, host=Config.SERVE_HOST, port=Config.SERVE_PORT, max_in_flight=Config.SERVE_MAX_QUEUE):
+        """
+        Args:
+            host: 服务地址
+            port: 服务端口
+            max_in_flight: 同时等待响应的最大请求数（超过时predict()等待）
+        """
+        self.host = host
+        self.port = port
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._reader = None
+        self._writer = None
+        self._listener = None
+
+    async def start(self):
+        """连接服务"""
+        if self._listener is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port, limit=_STREAM_LIMIT)
+            self._listener = asyncio.create_task(self._listen())
+        return self
+
+    async def close(self):
+        """断开连接，未完成的请求以ConnectionError结束"""
+        if self._listener is None:
+            return
+        self._writer.close()
+        self._listener.cancel()
+        try:
+            await self._listener
+        except asyncio.CancelledError:
+            pass
+        self._fail_pending(ConnectionError("与预测服务的连接已关闭"))
+        self._listener = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _fail_pending(self, error):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    async def _listen(self):
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                self._fail_pending(ConnectionError("预测服务断开了连接"))
+                return
+            message = json.loads(line)
+            future = self._pending.pop(message.get('id'), None)
+            if future is None or future.done():
+                continue
+            if 'error' in message:
+                future.set_exception(RuntimeError(message['error']))
+            else:
+                future.set_result(message['result'])
+
+    async def _request(self, message):
+        if self._listener is None:
+            raise RuntimeError("客户端尚未连接，请先调用start()或使用async with")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(_encode({'id': request_id, **message}))
+        try:
+            await self._writer.drain()
+            return await future
+        except asyncio.CancelledError:
+            # 通知服务端不再需要这个结果
+            self._pending.pop(request_id, None)
+            if not self._writer.is_closing():
+                self._writer.write(_encode({'id': request_id, 'op': "cancel"}))
+            raise
+
+    async def predict(self, sequence, head=None):
+        """预测单条序列，返回{名称: numpy数组}字典（见AsyncTorsionPredictor.predict）"""
+        async with self._slots:
+            result = await self._request({'op': "predict", 'sequence': sequence, 'head': head})
+        return {name: np.asarray(values, dtype=np.float32) for name, values in result.items()}
+
+    async def stats(self):
+        """返回服务端的统计（见AsyncTorsionPredictor.stats）"""
+        return await self._request({'op': "stats"})
+
+    async def swap_head(self, checkpoint, name=DEFAULT_HEAD, strict=True):
+        """
+        让服务端加载预测头检查点（路径在服务端解析）
+
+        Returns:
+            info: 字典，含name、model_id和torsion_types
+        """
+        return await self._request({'op': "swap_head", 'checkpoint': checkpoint, 'name': name, 'strict': strict})
+
+
+def run_server(model_path, host=Config.SERVE_HOST, port=Config.SERVE_PORT, device="cuda", mc_samples=0,
+               cache=None, backbone_path=None, attention=None, memory_budget_mb=None,
+               max_batch_size=Config.INFERENCE_MAX_BATCH_SIZE, max_wait_ms=Config.SERVE_MAX_WAIT_MS,
+               max_queue=Config.SERVE_MAX_QUEUE, heads=None):
+    """
+    加载模型并运行预测服务（阻塞直到Ctrl-C）
+
+    Args:
+        model_path: 检查点路径，或多个路径的列表（集成模式）
+        host: 监听地址
+        port: 监听端口
+        device: 设备
+        mc_samples: Monte-Carlo dropout采样次数
+        cache: 可选的PredictionCache
+        backbone_path: 骨干网络权重的本地路径
+        attention: 骨干网络注意力实现
+        memory_budget_mb: 单个批次的内存预算（MB）
+        max_batch_size: 每次合并的最大请求数
+        max_wait_ms: 合并请求的最长等待时间（毫秒）
+        max_queue: 等待队列的容量
+        heads: 可选的额外预测头列表，每项为"名称=检查点路径"
+    """
+    predictor = AsyncTorsionPredictor.from_checkpoint(
+        model_path, device, backbone_path, attention, cache, memory_budget_mb, mc_samples,
+        max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, max_queue=max_queue)
+    for spec in heads or []:
+        name, _, path = spec.partition("=")
+        if not path:
+            raise ValueError(f"预测头需要以 名称=检查点路径 的形式给出: {spec}")
+        predictor.swap_head(path, name)
+        logger.info(f"已加载预测头 {name}: {path}")
+    try:
+        asyncio.run(serve(predictor, host, port))
+    except KeyboardInterrupt:
+        logger.info("预测服务已停止")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="本地扭转角预测服务（asyncio，合并并发请求为批次）")
+    parser.add_argument("--model_path", type=str, nargs="+", required=True,
+                        help="模型检查点路径（给出多个时以集成模式预测）")
+    parser.add_argument("--heads", type=str, nargs="+", default=None, help="额外的预测头（名称=检查点路径）")
+    parser.add_argument("--host", type=str, default=Config.SERVE_HOST, help="监听地址")
+    parser.add_argument("--port", type=int, default=Config.SERVE_PORT, help="监听端口")
+    parser.add_argument("--device", type=str, default="cuda", help="设备（'cuda'或'cpu'）")
+    parser.add_argument("--mc_samples", type=int, default=0, help="Monte-Carlo dropout采样次数（0表示不估计不确定度）")
+    parser.add_argument("--cache_dir", type=str, default=Config.PREDICTION_CACHE_DIR, help="预测缓存目录")
+    parser.add_argument("--no_cache", action="store_true", help="不使用预测缓存")
+    parser.add_argument("--backbone_path", type=str, default=Config.BACKBONE_PATH,
+                        help="骨干网络权重路径（.safetensors以mmap方式加载）")
+    parser.add_argument("--attention", type=str, default=Config.BACKBONE_ATTENTION,
+                        choices=["dense", "sdpa", "chunked"], help="骨干网络注意力实现")
+    parser.add_argument("--memory_budget_mb", type=float, default=None, help="单个批次前向传播的内存预算（MB）")
+    parser.add_argument("--max_batch_size", type=int, default=Config.INFERENCE_MAX_BATCH_SIZE, help="每次合并的最大请求数")
+    parser.add_argument("--max_wait_ms", type=float, default=Config.SERVE_MAX_WAIT_MS, help="合并请求的最长等待时间（毫秒）")
+    parser.add_argument("--max_queue", type=int, default=Config.SERVE_MAX_QUEUE, help="等待队列的容量（背压）")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    cache = None if args.no_cache else create_prediction_cache(args.cache_dir)
+    run_server(args.model_path, args.host, args.port, args.device, args.mc_samples, cache, args.backbone_path,
+               args.attention, args.memory_budget_mb, args.max_batch_size, args.max_wait_ms, args.max_queue,
+               args.heads)
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,6 @@ import sys
 import logging
 import torch
 import torch.optim as optim
-from torch.utils.tensorboard import SummaryWriter
 import numpy as np
 import random
 import argparse
@@ -20,10 +19,20 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append('D:\\source\\myvscode\\python_work\\RNA-FM')
 from config.config import Config
 from data.dataset import RNATorsionDataset, create_data_loaders
+from data.prefetch import PrefetchLoader
 from models.torsion_predictor import RNATorsionPredictor
+from models.backbones import load_backbone
+from models.attention import ATTENTION_IMPLEMENTATIONS, set_attention_implementation
 from models.loss import TotalAngularLoss
 from utils.evaluation import evaluate_model
-import fm
+from utils.adaptive_batching import AdaptiveBatcher, MemoryEstimator, default_memory_budget_mb
+from utils.telemetry import StepTelemetry
+from utils.profiling import ProfilerSession
+from utils.checkpoint import CheckpointManager, capture_rng_state, restore_rng_state, load_training_state
+from utils.distributed import (
+    init_distributed, cleanup_distributed, bind_core_group, barrier, broadcast_parameters,
+    all_reduce_gradients, all_reduce_sums, broadcast_object, all_gather_object, launch
+)
 
 def setup_logger(log_dir):
     """设置日志记录器"""
@@ -64,6 +73,42 @@ def seed_everything(seed):
     torch.backends.cudnn.deterministic = True
     torch.backends.cudnn.benchmark = False
 
+def count_valid_residues(batch, torsion_types):
+    """统计批次中至少有一个有效扭转角的残基数"""
+    masks = [batch['masks'][angle] for angle in torsion_types if angle in batch['masks']]
+    if not masks:
+        return 0
+    return int((torch.stack(masks).amax(dim=0) > 0).sum().item())
+
+def accumulation_windows(data_loader, torsion_types, residue_budget, start=0):
+    """
+    按有效残基预算把微批次组成梯度累积窗口
+    
+    累计的有效残基数（多进程时为所有rank之和）达到residue_budget后结束一个窗口，
+    各rank因此总是在同一个微批次处执行优化步。residue_budget<=0时每个批次单独成一个窗口。
+    
+    Args:
+        data_loader: 训练数据加载器
+        torsion_types: 扭转角类型列表
+        residue_budget: 每个优化步的目标有效残基数
+        start: 第一个批次的编号（断点续训时不为0）
+    
+    Yields:
+        window: 列表，元素为(批次编号, 批次)
+    """
+    window = []
+    residues = 0
+    for batch_idx, batch in enumerate(data_loader, start=start):
+        window.append((batch_idx, batch))
+        if residue_budget > 0:
+            residues += all_reduce_sums([count_valid_residues(batch, torsion_types)])[0]
+        if residue_budget <= 0 or residues >= residue_budget:
+            yield window
+            window = []
+            residues = 0
+    if window:
+        yield window
+
 def train_model(cfg):
     """
     训练模型
@@ -71,8 +116,26 @@ def train_model(cfg):
     Args:
         cfg: 配置对象
     """
-    # 设置随机种子
-    seed_everything(42)
+    # 初始化多进程数据并行（WORLD_SIZE未设置时为单进程训练）
+    rank, world_size = init_distributed(cfg.DISTRIBUTED_BACKEND)
+    is_main = rank == 0
+    if world_size > 1:
+        cores = bind_core_group(int(os.environ.get("LOCAL_RANK", rank)),
+                                int(os.environ.get("LOCAL_WORLD_SIZE", world_size)))
+        logging.info(f"rank {rank}/{world_size} 绑定 {len(cores)} 个CPU核心")
+    
+    # 设置随机种子（各rank的dropout使用不同的随机流）
+    seed_everything(42 + rank)
+    
+    # 恢复训练时沿用原实验目录，保证最佳模型和TensorBoard日志连续
+    resume_state = None
+    if cfg.RESUME:
+        resume_state, resume_path = load_training_state(cfg.RESUME)
+        cfg.EXPERIMENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(resume_path))))
+        logging.info(f"恢复训练，实验目录: {cfg.EXPERIMENT_DIR}")
+    
+    # 各rank的实验目录以rank 0为准（torchrun启动时每个进程各自生成了实验ID）
+    cfg.EXPERIMENT_DIR = broadcast_object(cfg.EXPERIMENT_DIR)
     
     # 设置设备
     device = torch.device(cfg.DEVICE if torch.cuda.is_available() else "cpu")
@@ -80,19 +143,24 @@ def train_model(cfg):
     
     # 加载RNA-FM模型
     logging.info("加载RNA-FM模型...")
-    rna_fm_model, alphabet = fm.pretrained.rna_fm_t12()
+    rna_fm_model, alphabet = load_backbone(cfg.BACKBONE, cfg.BACKBONE_PATH)
     rna_fm_model.eval()  # 设为评估模式
+    set_attention_implementation(rna_fm_model, cfg.BACKBONE_ATTENTION, cfg.BACKBONE_ATTENTION_CHUNK)
     rna_fm_model.to(device)
     logging.info("RNA-FM模型加载完成")
     
-    # 创建数据集
+    # 创建数据集（rank 0先处理并写缓存，其余rank随后直接读取缓存）
     logging.info(f"创建数据集，从目录: {cfg.DATA_DIR}")
+    if not is_main:
+        barrier()
     dataset = RNATorsionDataset(
         cfg.DATA_DIR, 
         alphabet, 
         cfg.TORSION_TYPES,
         cache_dir=os.path.join(cfg.OUTPUT_DIR, "cache")
     )
+    if is_main:
+        barrier()
     
     # 创建数据加载器
     logging.info("创建数据加载器...")
@@ -102,9 +170,16 @@ def train_model(cfg):
         train_ratio=cfg.TRAIN_RATIO,
         val_ratio=cfg.VAL_RATIO,
         test_ratio=cfg.TEST_RATIO,
-        num_workers=cfg.NUM_WORKERS
+        num_workers=cfg.NUM_WORKERS,
+        num_replicas=world_size,
+        rank=rank,
+        padding_idx=alphabet.padding_idx
     )
     
+    # 预取包装：下一个批次的collate和设备拷贝与当前批次的计算重叠
+    train_batches = PrefetchLoader(train_loader, device, cfg.PREFETCH_DEPTH)
+    val_batches = PrefetchLoader(val_loader, device, cfg.PREFETCH_DEPTH)
+    
     # 创建模型
     logging.info("创建扭转角预测模型...")
     model = RNATorsionPredictor(
@@ -114,8 +189,16 @@ def train_model(cfg):
         hidden_dim=cfg.HIDDEN_DIM,
         dropout=cfg.DROPOUT
     )
+    model.dedup_backbone = cfg.BACKBONE_DEDUP
+    model.pack_backbone = cfg.BACKBONE_PACKING
+    model.pack_tolerance = cfg.BACKBONE_PACK_TOLERANCE
     model.to(device)
     
+    # 只有特征提取器和回归头参与训练，各rank从rank 0的初始权重开始
+    trainable_modules = [model.feature_extractor, model.regression_heads]
+    broadcast_parameters(trainable_modules)
+    trainable_params = [p for module in trainable_modules for p in module.parameters()]
+    
     # 定义损失函数和优化器
     criterion = TotalAngularLoss(cfg.TORSION_TYPES)
     optimizer = optim.Adam(
@@ -125,9 +208,31 @@ def train_model(cfg):
     )
     
     # 创建TensorBoard写入器
-    tb_dir = os.path.join(cfg.EXPERIMENT_DIR, "tensorboard")
-    os.makedirs(tb_dir, exist_ok=True)
-    writer = SummaryWriter(tb_dir)
+    writer = None
+    if is_main:
+        tb_dir = os.path.join(cfg.EXPERIMENT_DIR, "tensorboard")
+        os.makedirs(tb_dir, exist_ok=True)
+        # tensorboard导入较慢，只在主进程真正训练时加载
+        from torch.utils.tensorboard import SummaryWriter
+        writer = SummaryWriter(tb_dir)
+    
+    # 逐步遥测（只在rank 0上记录）
+    telemetry = StepTelemetry(
+        os.path.join(cfg.EXPERIMENT_DIR, "telemetry.jsonl"),
+        writer=writer,
+        enabled=cfg.TELEMETRY and is_main,
+        every_steps=cfg.TELEMETRY_EVERY_STEPS,
+        device=device
+    )
+    
+    # 按需性能分析（只在rank 0上采集有限的若干步）
+    profiler = ProfilerSession(
+        os.path.join(cfg.EXPERIMENT_DIR, "profile"),
+        enabled=cfg.PROFILE and is_main,
+        wait=cfg.PROFILE_WAIT,
+        warmup=cfg.PROFILE_WARMUP,
+        active=cfg.PROFILE_ACTIVE
+    )
     
     # 保存检查点的目录
     checkpoint_dir = os.path.join(cfg.EXPERIMENT_DIR, "checkpoints")
@@ -138,69 +243,206 @@ def train_model(cfg):
     early_stop_counter = 0
     early_stop_patience = 10
     
+    # 训练进度
+    start_epoch = 0
+    start_samples = 0
+    global_step = 0
+    epoch_progress = None
+    checkpoint_manager = CheckpointManager(
+        os.path.join(checkpoint_dir, "training_state"),
+        keep_last=cfg.KEEP_LAST_CHECKPOINTS,
+        every_steps=cfg.CHECKPOINT_EVERY_STEPS,
+        every_minutes=cfg.CHECKPOINT_EVERY_MINUTES
+    )
+    
+    if resume_state is not None:
+        model.feature_extractor.load_state_dict(resume_state['feature_extractor'])
+        model.regression_heads.load_state_dict(resume_state['regression_heads'])
+        optimizer.load_state_dict(resume_state['optimizer'])
+        start_epoch = resume_state['epoch']
+        # 恢复位置以epoch内已训练的全局样本数表示，批次大小或进程数改变后仍然精确
+        start_samples = resume_state['samples_in_epoch']
+        saved_layout = (resume_state['batch_size'], resume_state['world_size'])
+        if saved_layout != (cfg.BATCH_SIZE, world_size):
+            logging.info(f"批次大小/进程数由 {saved_layout[0]}/{saved_layout[1]} 变为 {cfg.BATCH_SIZE}/{world_size}，"
+                         f"按全局样本位置 {start_samples} 继续")
+        global_step = resume_state['global_step']
+        best_val_loss = resume_state['best_val_loss']
+        early_stop_counter = resume_state['early_stop_counter']
+        epoch_progress = resume_state['epoch_progress']
+        rank_rng_states = resume_state.get('rank_rng_states')
+        if rank_rng_states and len(rank_rng_states) == world_size:
+            restore_rng_state(rank_rng_states[rank])
+        else:
+            restore_rng_state(resume_state['rng_state'])
+    
+    def save_training_state(epoch, batch_in_epoch, samples_in_epoch, progress):
+        """保存当前完整训练状态，恢复后可从epoch内的下一个批次继续（所有rank都需调用，只有rank 0写文件）"""
+        rank_rng_states = all_gather_object(capture_rng_state())
+        if not is_main:
+            return
+        checkpoint_manager.save({
+            'epoch': epoch,
+            'batch_in_epoch': batch_in_epoch,
+            'samples_in_epoch': samples_in_epoch,
+            'global_step': global_step,
+            'feature_extractor': model.feature_extractor.state_dict(),
+            'regression_heads': model.regression_heads.state_dict(),
+            'torsion_types': model.torsion_types,
+            'optimizer': optimizer.state_dict(),
+            'best_val_loss': best_val_loss,
+            'early_stop_counter': early_stop_counter,
+            'epoch_progress': progress,
+            'rng_state': rank_rng_states[0],
+            'rank_rng_states': rank_rng_states,
+            'batch_size': cfg.BATCH_SIZE,
+            'world_size': world_size
+        }, global_step)
+    
     # 训练循环
     logging.info(f"开始训练，共{cfg.NUM_EPOCHS}个epoch")
-    for epoch in range(cfg.NUM_EPOCHS):
+    profiler.start()
+    for epoch in range(start_epoch, cfg.NUM_EPOCHS):
+        if early_stop_counter >= early_stop_patience:
+            break
+        
         # 训练阶段
         model.train()
+        model.dedup_stats(reset=True)
         train_loss = 0.0
         train_loss_dict = {angle: 0.0 for angle in cfg.TORSION_TYPES}
+        num_batches = 0
+        
+        # 从epoch中间恢复时跳过已训练的样本，并恢复已累计的损失
+        train_loader.sampler.set_epoch(epoch)
+        batch_offset = 0
+        epoch_start_samples = 0
+        if epoch == start_epoch and start_samples > 0:
+            epoch_start_samples = start_samples
+            batch_offset = train_loader.sampler.set_global_start_index(start_samples) // cfg.BATCH_SIZE
+            if epoch_progress is not None:
+                train_loss = epoch_progress['train_loss']
+                train_loss_dict = dict(epoch_progress['train_loss_dict'])
+                num_batches = epoch_progress['num_batches']
+            logging.info(f"从 Epoch {epoch+1} 的第 {start_samples} 个样本之后继续训练")
         
         start_time = time.time()
-        for batch_idx, batch in enumerate(train_loader):
-            # 将数据移到设备上
-            tokens = batch['tokens'].to(device)
-            
-            # 前向传播
-            predictions, sin_cos_preds = model(tokens)
+        num_micro_batches = 0
+        train_batches.reset_stats()
+        seen_wait, seen_transfer = 0.0, 0.0
+        windows = accumulation_windows(train_batches, cfg.TORSION_TYPES, cfg.EFFECTIVE_BATCH_RESIDUES, start=batch_offset)
+        for window in windows:
+            telemetry.begin_step(global_step + 1)
+            telemetry.add_time("data_wait", train_batches.data_wait_time - seen_wait)
+            telemetry.add_time("h2d", train_batches.transfer_time - seen_transfer)
+            seen_wait, seen_transfer = train_batches.data_wait_time, train_batches.transfer_time
             
-            # 计算损失
-            angle_targets = {angle: batch['angles'][angle].to(device) for angle in cfg.TORSION_TYPES if angle in batch['angles']}
-            angle_masks = {angle: batch['masks'][angle].to(device) for angle in cfg.TORSION_TYPES if angle in batch['masks']}
+            # 整个窗口（所有rank）每种角度的有效值总数作为损失分母：各微批次的损失之和等于窗口平均损失，
+            # 与微批次长度无关；除以world_size是因为梯度all-reduce时会再取一次平均
+            counts = all_reduce_sums([
+                sum(batch['masks'][angle].sum().item() for _, batch in window if angle in batch['masks'])
+                for angle in cfg.TORSION_TYPES
+            ])
+            normalizers = {angle: count / world_size for angle, count in zip(cfg.TORSION_TYPES, counts)}
             
-            loss, loss_dict = criterion(sin_cos_preds, angle_targets, angle_masks)
-            
-            # 反向传播和优化
             optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+            step_loss = 0.0
+            for batch_idx, batch in window:
+                # 批次已由PrefetchLoader送到设备上
+                tokens = batch['tokens']
+                telemetry.add_batch(batch)
+                
+                # 前向传播（骨干网络和回归头分开计时）
+                with telemetry.stage("backbone"):
+                    embeddings = model.embed(tokens)
+                telemetry.add_backbone_rows(*model.last_backbone_rows)
+                with telemetry.stage("head"):
+                    predictions, sin_cos_preds = model.predict_from_embeddings(embeddings)
+                
+                # 计算损失
+                angle_targets = {angle: batch['angles'][angle] for angle in cfg.TORSION_TYPES if angle in batch['angles']}
+                angle_masks = {angle: batch['masks'][angle] for angle in cfg.TORSION_TYPES if angle in batch['masks']}
+                
+                with telemetry.stage("loss"):
+                    loss, loss_dict = criterion(sin_cos_preds, angle_targets, angle_masks, normalizers)
+                
+                # 反向传播（梯度在窗口内累积，计算图逐个微批次释放）
+                with telemetry.stage("backward"):
+                    loss.backward()
+                
+                # 累计损失
+                step_loss += loss.item()
+                for angle, angle_loss in loss_dict.items():
+                    train_loss_dict[angle] += angle_loss
+            
+            # 同步梯度并更新参数
+            with telemetry.stage("optimizer"):
+                all_reduce_gradients(trainable_params)
+                optimizer.step()
             
-            # 累计损失
-            train_loss += loss.item()
-            for angle, angle_loss in loss_dict.items():
-                train_loss_dict[angle] += angle_loss
+            train_loss += step_loss
+            num_batches += 1
+            num_micro_batches += len(window)
+            global_step += 1
+            telemetry.end_step(global_step, epoch, step_loss)
+            profiler.step()
             
             # 记录进度
-            if (batch_idx + 1) % 10 == 0:
-                logging.info(f"Epoch {epoch+1}/{cfg.NUM_EPOCHS}, Batch {batch_idx+1}/{len(train_loader)}, Loss: {loss.item():.4f}")
+            if global_step % 10 == 0:
+                logging.info(f"Epoch {epoch+1}/{cfg.NUM_EPOCHS}, Batch {batch_idx+1}/{len(train_loader)}, "
+                             f"Step {global_step}, Loss: {step_loss:.4f}")
+            
+            # 按步数或时间间隔保存完整训练状态（是否保存以rank 0的判断为准）
+            if broadcast_object(checkpoint_manager.should_save(global_step)):
+                # 每个批次所有rank合计消耗全局顺序中接下来的BATCH_SIZE * world_size个样本
+                samples_in_epoch = epoch_start_samples + (batch_idx + 1 - batch_offset) * cfg.BATCH_SIZE * world_size
+                save_training_state(epoch, batch_idx + 1, samples_in_epoch, {
+                    'train_loss': train_loss,
+                    'train_loss_dict': train_loss_dict,
+                    'num_batches': num_batches
+                })
         
-        # 计算平均训练损失
-        train_loss /= len(train_loader)
-        train_loss_dict = {angle: loss / len(train_loader) for angle, loss in train_loss_dict.items()}
+        # 计算平均训练损失（多进程时汇总所有rank）
+        sums = all_reduce_sums([train_loss, num_batches] + [train_loss_dict[angle] for angle in cfg.TORSION_TYPES])
+        total_batches = max(sums[1], 1)
+        train_loss = sums[0] / total_batches
+        train_loss_dict = {angle: loss / total_batches for angle, loss in zip(cfg.TORSION_TYPES, sums[2:])}
         
         # 记录训练损失到TensorBoard
-        writer.add_scalar("Loss/train", train_loss, epoch)
-        for angle, loss in train_loss_dict.items():
-            writer.add_scalar(f"Loss_train/{angle}", loss, epoch)
+        if writer is not None:
+            writer.add_scalar("Loss/train", train_loss, epoch)
+            for angle, loss in train_loss_dict.items():
+                writer.add_scalar(f"Loss_train/{angle}", loss, epoch)
         
         end_time = time.time()
         logging.info(f"Epoch {epoch+1}/{cfg.NUM_EPOCHS} 训练完成，耗时: {end_time - start_time:.2f}秒, 平均损失: {train_loss:.4f}")
+        dedup = model.dedup_stats()
+        if dedup['rows']:
+            logging.info(f"骨干网络去重: {dedup['rows']} 条序列中 {dedup['unique_rows']} 条送入RNA-FM（省去 {dedup['dedup_ratio']:.1%}）")
+        logging.info(f"数据等待: {train_batches.data_wait_time:.2f}秒 "
+                     f"(占本epoch训练时间的 {100 * train_batches.data_wait_time / max(end_time - start_time, 1e-9):.1f}%)")
+        if writer is not None:
+            writer.add_scalar("Time/train_data_wait", train_batches.data_wait_time, epoch)
+            writer.add_scalar("Time/train_epoch", end_time - start_time, epoch)
+        if cfg.EFFECTIVE_BATCH_RESIDUES > 0 and num_batches:
+            logging.info(f"梯度累积: 本epoch共 {num_micro_batches} 个微批次，平均每个优化步 {num_micro_batches / num_batches:.1f} 个")
         
         # 验证阶段
         model.eval()
         val_loss = 0.0
         val_loss_dict = {angle: 0.0 for angle in cfg.TORSION_TYPES}
         
+        val_batches.reset_stats()
         with torch.no_grad():
-            for batch in val_loader:
-                tokens = batch['tokens'].to(device)
+            for batch in val_batches:
+                tokens = batch['tokens']
                 
                 # 前向传播
                 predictions, sin_cos_preds = model(tokens)
                 
                 # 计算损失
-                angle_targets = {angle: batch['angles'][angle].to(device) for angle in cfg.TORSION_TYPES if angle in batch['angles']}
-                angle_masks = {angle: batch['masks'][angle].to(device) for angle in cfg.TORSION_TYPES if angle in batch['masks']}
+                angle_targets = {angle: batch['angles'][angle] for angle in cfg.TORSION_TYPES if angle in batch['angles']}
+                angle_masks = {angle: batch['masks'][angle] for angle in cfg.TORSION_TYPES if angle in batch['masks']}
                 
                 loss, loss_dict = criterion(sin_cos_preds, angle_targets, angle_masks)
                 
@@ -209,16 +451,21 @@ def train_model(cfg):
                 for angle, angle_loss in loss_dict.items():
                     val_loss_dict[angle] += angle_loss
         
-        # 计算平均验证损失
-        val_loss /= len(val_loader)
-        val_loss_dict = {angle: loss / len(val_loader) for angle, loss in val_loss_dict.items()}
+        # 计算平均验证损失（多进程时汇总所有rank，各rank得到相同的结果）
+        sums = all_reduce_sums([val_loss, len(val_loader)] + [val_loss_dict[angle] for angle in cfg.TORSION_TYPES])
+        total_batches = max(sums[1], 1)
+        val_loss = sums[0] / total_batches
+        val_loss_dict = {angle: loss / total_batches for angle, loss in zip(cfg.TORSION_TYPES, sums[2:])}
         
         # 记录验证损失到TensorBoard
-        writer.add_scalar("Loss/val", val_loss, epoch)
-        for angle, loss in val_loss_dict.items():
-            writer.add_scalar(f"Loss_val/{angle}", loss, epoch)
+        if writer is not None:
+            writer.add_scalar("Loss/val", val_loss, epoch)
+            for angle, loss in val_loss_dict.items():
+                writer.add_scalar(f"Loss_val/{angle}", loss, epoch)
         
-        logging.info(f"Epoch {epoch+1}/{cfg.NUM_EPOCHS} 验证完成，平均损失: {val_loss:.4f}")
+        logging.info(f"Epoch {epoch+1}/{cfg.NUM_EPOCHS} 验证完成，平均损失: {val_loss:.4f}，数据等待: {val_batches.data_wait_time:.2f}秒")
+        if writer is not None:
+            writer.add_scalar("Time/val_data_wait", val_batches.data_wait_time, epoch)
         
         # 检查是否需要保存最佳模型
         if val_loss < best_val_loss:
@@ -226,29 +473,40 @@ def train_model(cfg):
             early_stop_counter = 0
             
             # 保存最佳模型
-            best_model_path = os.path.join(checkpoint_dir, "best_model.pth")
-            model.save(best_model_path)
-            logging.info(f"最佳模型已保存，验证损失: {val_loss:.4f}")
+            if is_main:
+                best_model_path = os.path.join(checkpoint_dir, f"best_model.{cfg.MODEL_FORMAT}")
+                model.save(best_model_path)
+                logging.info(f"最佳模型已保存，验证损失: {val_loss:.4f}")
         else:
             early_stop_counter += 1
             logging.info(f"验证损失未改善，早停计数器: {early_stop_counter}/{early_stop_patience}")
         
         # 每5个epoch保存一次检查点
-        if (epoch + 1) % 5 == 0:
-            checkpoint_path = os.path.join(checkpoint_dir, f"checkpoint_epoch{epoch+1}.pth")
+        if (epoch + 1) % 5 == 0 and is_main:
+            checkpoint_path = os.path.join(checkpoint_dir, f"checkpoint_epoch{epoch+1}.{cfg.MODEL_FORMAT}")
             model.save(checkpoint_path)
             logging.info(f"Epoch {epoch+1} 检查点已保存")
         
+        # epoch结束（含验证和早停计数）后保存训练状态，恢复时从下一个epoch开始
+        save_training_state(epoch + 1, 0, 0, None)
+        
         # 早停
         if early_stop_counter >= early_stop_patience:
             logging.info(f"早停触发，{early_stop_patience}个epoch未改善")
             break
     
+    profiler.stop()
     logging.info("训练完成")
     
+    # 测试集评估只在rank 0上进行
+    if not is_main:
+        telemetry.close()
+        cleanup_distributed()
+        return
+    
     # 在测试集上评估最佳模型
     logging.info("加载最佳模型并在测试集上评估...")
-    best_model_path = os.path.join(checkpoint_dir, "best_model.pth")
+    best_model_path = os.path.join(checkpoint_dir, f"best_model.{cfg.MODEL_FORMAT}")
     model.load(best_model_path)
     
     print("\n开始评估模型...")
@@ -257,7 +515,11 @@ def train_model(cfg):
         test_results_dir = os.path.join(cfg.EXPERIMENT_DIR, "test_results")
         os.makedirs(test_results_dir, exist_ok=True)
         logging.info(f"测试结果将保存到: {test_results_dir}")
-        metrics = evaluate_model(model, test_loader, device, cfg.TORSION_TYPES, test_results_dir)
+        # 测试集按内存预算重新组批，长序列内存不足时拆分重试而不是中断评估
+        batcher = AdaptiveBatcher(MemoryEstimator.from_model(model),
+                                  default_memory_budget_mb(device, cfg.INFERENCE_MEMORY_BUDGET_MB),
+                                  cfg.INFERENCE_MAX_BATCH_SIZE, pad_tolerance=cfg.INFERENCE_PAD_TOLERANCE)
+        metrics = evaluate_model(model, test_loader, device, cfg.TORSION_TYPES, test_results_dir, batcher)
         
         print(f"评估完成，详细指标: {metrics}")
     except Exception as e:
@@ -271,7 +533,35 @@ def train_model(cfg):
         logging.info(f"{name}: {value:.4f}")
     
     # 关闭TensorBoard写入器
+    telemetry.close()
     writer.close()
+    cleanup_distributed()
+
+def _train_worker(cfg):
+    """分布式训练中每个rank的入口（spawn出的子进程需要重新配置日志）"""
+    rank = int(os.environ.get("RANK", "0"))
+    if rank == 0:
+        setup_logger(os.path.join(cfg.EXPERIMENT_DIR, "logs"))
+    else:
+        logging.basicConfig(level=logging.WARNING,
+                            format=f'%(asctime)s - rank{rank} - %(name)s - %(levelname)s - %(message)s')
+    train_model(cfg)
+
+def run_training(cfg):
+    """
+    按配置选择单进程训练或多进程数据并行训练
+    
+    已由torchrun启动（环境变量WORLD_SIZE已设置）时直接训练；
+    否则当NPROC_PER_NODE或NNODES大于1时在本机启动NPROC_PER_NODE个rank。
+    
+    Args:
+        cfg: 配置对象
+    """
+    if int(os.environ.get("WORLD_SIZE", "1")) > 1 or (cfg.NPROC_PER_NODE <= 1 and cfg.NNODES <= 1):
+        train_model(cfg)
+        return
+    launch(_train_worker, (cfg,), nproc_per_node=cfg.NPROC_PER_NODE, nnodes=cfg.NNODES,
+           node_rank=cfg.NODE_RANK, master_addr=cfg.MASTER_ADDR, master_port=cfg.MASTER_PORT)
 
 def main():
     """主函数"""
@@ -283,6 +573,26 @@ def main():
     parser.add_argument("--num_epochs", type=int, default=20, help="训练轮数")
     parser.add_argument("--learning_rate", type=float, default=1e-4, help="学习率")
     parser.add_argument("--device", type=str, default="cuda", help="设备（'cuda'或'cpu'）")
+    parser.add_argument("--no_backbone_dedup", action="store_true", help="关闭批次内重复序列的骨干网络去重")
+    parser.add_argument("--backbone_packing", action="store_true", help="按长度分组运行骨干网络（减少填充位置的计算）")
+    parser.add_argument("--attention", type=str, default=None, choices=ATTENTION_IMPLEMENTATIONS,
+                        help="骨干网络注意力实现（sdpa/chunked不物化完整的注意力矩阵，适合长序列）")
+    parser.add_argument("--resume", type=str, default=None, help="从训练状态检查点（文件或实验目录）恢复训练")
+    parser.add_argument("--checkpoint_every_steps", type=int, default=None, help="每隔多少步保存训练状态")
+    parser.add_argument("--checkpoint_every_minutes", type=float, default=None, help="每隔多少分钟保存训练状态")
+    parser.add_argument("--keep_last_checkpoints", type=int, default=None, help="保留最近的训练状态数量")
+    parser.add_argument("--effective_batch_residues", type=int, default=None, help="每个优化步的目标有效残基数（梯度累积，0表示不累积）")
+    parser.add_argument("--telemetry", action="store_true", default=None, help="记录逐步的分阶段耗时和吞吐量")
+    parser.add_argument("--no_telemetry", dest="telemetry", action="store_false", help="关闭逐步遥测")
+    parser.add_argument("--telemetry_every_steps", type=int, default=None, help="每隔多少步采样一次遥测")
+    parser.add_argument("--profile", action="store_true", help="用torch.profiler采集若干训练步")
+    parser.add_argument("--profile_steps", type=int, default=None, help="采集的训练步数")
+    parser.add_argument("--profile_wait", type=int, default=None, help="开始采集前跳过的训练步数")
+    parser.add_argument("--nproc_per_node", type=int, default=None, help="本机数据并行进程数（通常等于socket数或核心组数）")
+    parser.add_argument("--nnodes", type=int, default=None, help="参与训练的机器数")
+    parser.add_argument("--node_rank", type=int, default=None, help="本机编号（0为主节点）")
+    parser.add_argument("--master_addr", type=str, default=None, help="主节点地址")
+    parser.add_argument("--master_port", type=int, default=None, help="主节点端口")
     
     args = parser.parse_args()
     
@@ -302,6 +612,35 @@ def main():
         cfg.LEARNING_RATE = args.learning_rate
     if args.device:
         cfg.DEVICE = args.device
+    if args.no_backbone_dedup:
+        cfg.BACKBONE_DEDUP = False
+    if args.backbone_packing:
+        cfg.BACKBONE_PACKING = True
+    if args.attention:
+        cfg.BACKBONE_ATTENTION = args.attention
+    if args.resume:
+        cfg.RESUME = args.resume
+    if args.checkpoint_every_steps is not None:
+        cfg.CHECKPOINT_EVERY_STEPS = args.checkpoint_every_steps
+    if args.checkpoint_every_minutes is not None:
+        cfg.CHECKPOINT_EVERY_MINUTES = args.checkpoint_every_minutes
+    if args.keep_last_checkpoints is not None:
+        cfg.KEEP_LAST_CHECKPOINTS = args.keep_last_checkpoints
+    if args.telemetry is not None:
+        cfg.TELEMETRY = args.telemetry
+    if args.telemetry_every_steps is not None:
+        cfg.TELEMETRY_EVERY_STEPS = args.telemetry_every_steps
+    if args.profile:
+        cfg.PROFILE = True
+    if args.profile_steps is not None:
+        cfg.PROFILE_ACTIVE = args.profile_steps
+    if args.profile_wait is not None:
+        cfg.PROFILE_WAIT = args.profile_wait
+    if args.effective_batch_residues is not None:
+        cfg.EFFECTIVE_BATCH_RESIDUES = args.effective_batch_residues
+    for name in ("nproc_per_node", "nnodes", "node_rank", "master_addr", "master_port"):
+        if getattr(args, name) is not None:
+            setattr(cfg, name.upper(), getattr(args, name))
     
     # 设置日志记录器
     logger = setup_logger(os.path.join(cfg.EXPERIMENT_DIR, "logs"))
@@ -310,7 +649,7 @@ def main():
     logging.info(f"配置: {vars(cfg)}")
     
     # 训练模型
-    train_model(cfg)
+    run_training(cfg)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
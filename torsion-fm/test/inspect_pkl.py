@@ -1,20 +1,31 @@
 # inspect_pkl.py
-import pickle
 import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data.structure_store import IndexedStructureStore, open_structure_source
 
 def inspect_pkl(pkl_path):
-    """详细检查PKL文件的结构"""
-    with open(pkl_path, 'rb') as f:
-        data = pickle.load(f)
+    """详细检查PKL文件（或索引化结构存储）的结构"""
+    data = open_structure_source(pkl_path)
     
     print(f"数据类型: {type(data)}")
     
-    if isinstance(data, dict):
+    # 索引化存储直接从索引给出摘要，不需要读取任何结构记录
+    if isinstance(data, IndexedStructureStore):
+        multi_chain = sum(1 for key in data if data.metadata(key)['if_multi_chain'])
+        residues = [data.metadata(key)['num_residues'] for key in data]
+        print(f"索引化存储: {data.path}")
+        print(f"结构数量: {len(data)}, PDB ID数量: {len(data.pdb_ids())}, 多链结构: {multi_chain}")
+        if residues:
+            print(f"残基数: 最小 {min(residues)}, 最大 {max(residues)}, 总计 {sum(residues)}")
+    
+    if isinstance(data, (dict, IndexedStructureStore)):
         print(f"字典键数量: {len(data.keys())}")
         print(f"部分键: {list(data.keys())[:10]}")
         
         # 检查第一个元素的结构
-        first_key = list(data.keys())[0]
+        first_key = next(iter(data))
         first_item = data[first_key]
         print(f"\n第一个元素 (键={first_key}) 的类型: {type(first_item)}")
         
@@ -1,9 +1,9 @@
 # test_adapter.py
 import os
-import pickle
 import logging
 import torch
 from data.adapters import adapt_training_dict_single
+from data.structure_store import open_structure_source
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, 
@@ -14,14 +14,13 @@ def test_adapter(pkl_file, output_dir=None):
     """测试数据适配器"""
     logger.info(f"测试适配器: {pkl_file}")
     
-    # 加载PKL文件
-    with open(pkl_file, 'rb') as f:
-        data = pickle.load(f)
+    # 加载PKL文件（存在索引化存储时按需读取）
+    data = open_structure_source(pkl_file)
     
     logger.info(f"加载了数据，包含 {len(data)} 个结构")
     
     # 输出第一个结构的信息
-    first_key = list(data.keys())[0]
+    first_key = next(iter(data))
     first_item = data[first_key]
     logger.info(f"第一个结构 (键={first_key}):")
     logger.info(f"  PDB ID: {first_item.get('pdb_id', 'unknown')}")
@@ -0,0 +1,303 @@
+"""
+批量推理与评估的自适应批次划分
+
+按序列长度估计一个批次前向传播的峰值内存，在内存预算内把序列组合成批次
+（长度相近的序列放在一起，减少填充）；前向传播仍然因内存不足失败时，
+把批次对半拆分后重试，单条序列仍然失败时可以回退到更省内存的实现（例如chunked注意力）。
+选择的批次大小、拆分和回退都会记录到日志。
+
+内存估计只是粗略的上界（以float32前向、无梯度为准），预算应留出余量；
+估计偏低时由拆分重试兜底，不会导致整个任务失败。
+"""
+
+import gc
+import logging
+import threading
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+_OOM_MESSAGES = ("out of memory", "can't allocate memory", "not enough memory", "failed to allocate memory")
+
+# 注意力分数矩阵（softmax前后、dropout掩码等）同时存在的份数，按benchmarks/attention_memory.py的测量取整
+_SCORE_COPIES = {"dense": 2.0, "chunked": 2.0, "sdpa": 1.0}
+# sdpa在CPU/GPU上由融合内核按块计算，分数矩阵的查询维按这个块大小计
+_SDPA_BLOCK = 128
+
+
+def is_oom_error(error):
+    """判断异常是否为内存分配失败（CPU的MemoryError或CUDA/CPU分配器的RuntimeError）"""
+    if isinstance(error, MemoryError):
+        return True
+    if isinstance(error, RuntimeError):
+        message = str(error).lower()
+        return any(text in message for text in _OOM_MESSAGES)
+    return False
+
+
+def release_memory():
+    """内存分配失败后释放缓存的内存，再重试"""
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def default_memory_budget_mb(device, fallback_mb):
+    """
+    默认的内存预算
+
+    Args:
+        device: torch.device或设备字符串
+        fallback_mb: CPU上（或无法查询显存时）使用的预算
+
+    Returns:
+        budget_mb: GPU上为当前空闲显存的80%，否则为fallback_mb
+    """
+    device = torch.device(device)
+    if device.type == "cuda" and torch.cuda.is_available():
+        free, _ = torch.cuda.mem_get_info(device)
+        return free / 1024 ** 2 * 0.8
+    return fallback_mb
+
+
+class MemoryEstimator:
+    """按批次大小和token长度估计前向传播的峰值内存"""
+
+    def __init__(self, embed_dim=640, ffn_embed_dim=5120, attention_heads=20, head_hidden_dim=256,
+                 num_torsions=7, num_heads=1, attention="dense", chunk_size=256, bytes_per_element=4):
+        """
+        Args:
+            embed_dim: 骨干网络的嵌入维度
+            ffn_embed_dim: 骨干网络前馈层的维度
+            attention_heads: 注意力头数
+            head_hidden_dim: 回归头的隐藏层维度
+            num_torsions: 扭转角类型数
+            num_heads: 共享骨干网络的预测头数（集成成员数）
+            attention: 注意力实现（dense/sdpa/chunked）
+            chunk_size: chunked实现每次处理的查询数
+            bytes_per_element: 激活值的字节数
+        """
+        self.embed_dim = embed_dim
+        self.ffn_embed_dim = ffn_embed_dim
+        self.attention_heads = attention_heads
+        self.head_hidden_dim = head_hidden_dim
+        self.num_torsions = num_torsions
+        self.num_heads = num_heads
+        self.attention = attention
+        self.chunk_size = chunk_size
+        self.bytes_per_element = bytes_per_element
+
+    @classmethod
+    def from_model(cls, model):
+        """
+        从RNATorsionPredictor或TorsionEnsemble读取结构参数
+
+        Args:
+            model: 扭转角预测模型
+
+        Returns:
+            estimator: MemoryEstimator
+        """
+        from models.backbones import backbone_config
+        from models.attention import current_attention_implementation
+
+        members = list(model.members) if hasattr(model, 'members') else [model]
+        config = backbone_config(model.rna_fm)
+        attention, chunk_size = current_attention_implementation(model.rna_fm)
+        parameter = next(model.rna_fm.parameters(), None)
+        return cls(
+            embed_dim=config['embed_dim'],
+            ffn_embed_dim=config['ffn_embed_dim'],
+            attention_heads=config['attention_heads'],
+            head_hidden_dim=max(member.hidden_dim for member in members),
+            num_torsions=max(len(member.torsion_types) for member in members),
+            num_heads=len(members),
+            attention=attention,
+            chunk_size=chunk_size or 256,
+            bytes_per_element=parameter.element_size() if parameter is not None else 4,
+        )
+
+    def estimate(self, batch_size, max_tokens, mc_samples=0, attention=None):
+        """
+        估计一个批次前向传播的峰值内存
+
+        Args:
+            batch_size: 批次大小
+            max_tokens: 批次中最长的token长度（含cls/eos）
+            mc_samples: Monte-Carlo dropout采样次数（回归头的激活值按采样数放大）
+            attention: 覆盖构造时的注意力实现
+
+        Returns:
+            memory_mb: 估计的峰值内存（MB）
+        """
+        attention = attention or self.attention
+        rows = batch_size * max_tokens
+        # 一层Transformer同时存在的激活值：残差、LayerNorm、q/k/v、注意力输出以及两份前馈层中间结果
+        layer = rows * (6 * self.embed_dim + 2 * self.ffn_embed_dim)
+        if attention == "dense":
+            queries = max_tokens
+        elif attention == "chunked":
+            queries = min(self.chunk_size, max_tokens)
+        else:
+            queries = min(_SDPA_BLOCK, max_tokens)
+        scores = _SCORE_COPIES.get(attention, 1.0) * batch_size * self.attention_heads * queries * max_tokens
+        # 回归头：每种扭转角一个隐藏层，MC dropout把嵌入沿批次维扩展mc_samples倍
+        samples = max(1, mc_samples)
+        head = rows * samples * self.num_heads * (self.embed_dim + self.head_hidden_dim * (self.num_torsions + 1))
+        return (layer + scores + head) * self.bytes_per_element / 1024 ** 2
+
+
+class AdaptiveBatcher:
+    """在内存预算内划分批次，内存不足时拆分重试"""
+
+    def __init__(self, estimator, memory_budget_mb=4096, max_batch_size=32, mc_samples=0, pad_tolerance=None):
+        """
+        Args:
+            estimator: MemoryEstimator
+            memory_budget_mb: 单个批次前向传播的内存预算（MB）
+            max_batch_size: 批次大小上限
+            mc_samples: Monte-Carlo dropout采样次数（参与内存估计）
+            pad_tolerance: 每个批次允许的最大填充比例（None表示不限制，长度差异大的序列也可以同批）
+        """
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size必须为正数: {max_batch_size}")
+        self.estimator = estimator
+        self.memory_budget_mb = memory_budget_mb
+        self.max_batch_size = max_batch_size
+        self.mc_samples = mc_samples
+        self.pad_tolerance = pad_tolerance
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """清零批次统计"""
+        with self._lock:
+            self._stats = {'batches': 0, 'items': 0, 'largest_batch': 0, 'splits': 0, 'fallbacks': 0, 'failed': 0}
+
+    def stats(self):
+        """
+        返回批次统计
+
+        Returns:
+            stats: 字典，包含batches、items、largest_batch、splits（内存不足拆分次数）、
+                   fallbacks（单条序列回退次数）、failed（最终失败的序列数）
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def _record_batch(self, size):
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['items'] += size
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], size)
+
+    def plan(self, lengths):
+        """
+        按长度从长到短贪心划分批次
+
+        Args:
+            lengths: 每条序列的token长度（含cls/eos）
+
+        Returns:
+            batches: 索引列表的列表；批次内索引按长度降序，每个批次的估计内存不超过预算、
+                     填充比例不超过pad_tolerance（单条序列已超出预算时单独成批）
+        """
+        order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+        batches = []
+        current = []
+        total = 0
+        for index in order:
+            if current:
+                # 降序排列，批次的最大长度就是第一条序列的长度
+                max_tokens = lengths[current[0]]
+                estimate = self.estimator.estimate(len(current) + 1, max_tokens, self.mc_samples)
+                padding = 1.0 - (total + lengths[index]) / ((len(current) + 1) * max_tokens)
+                if (len(current) < self.max_batch_size and estimate <= self.memory_budget_mb
+                        and (self.pad_tolerance is None or padding <= self.pad_tolerance)):
+                    current.append(index)
+                    total += lengths[index]
+                    continue
+                batches.append(current)
+            current = [index]
+            total = lengths[index]
+            estimate = self.estimator.estimate(1, lengths[index], self.mc_samples)
+            if estimate > self.memory_budget_mb:
+                logger.warning(f"长度为 {lengths[index]} 的序列估计需要 {estimate:.0f}MB，"
+                               f"超出内存预算 {self.memory_budget_mb:.0f}MB，单独成批")
+        if current:
+            batches.append(current)
+        return batches
+
+    def run(self, lengths, fn, fallback=None, skip_failed=False):
+        """
+        按plan()划分的批次调用fn，内存不足时对半拆分重试
+
+        Args:
+            lengths: 每条序列的token长度
+            fn: fn(indices)返回与indices一一对应的结果列表
+            fallback: 单条序列内存不足时的回退函数（调用约定同fn），例如临时切换为chunked注意力
+            skip_failed: 回退后仍然内存不足时，该序列的结果为None并记录错误（否则抛出异常）
+
+        Returns:
+            results: 与lengths一一对应的结果列表
+        """
+        results = [None] * len(lengths)
+        for batch in self.plan(lengths):
+            max_tokens = lengths[batch[0]]
+            logger.debug(f"批次: {len(batch)} 条序列，最大长度 {max_tokens}，"
+                         f"估计内存 {self.estimator.estimate(len(batch), max_tokens, self.mc_samples):.0f}MB")
+            self._run_batch(batch, lengths, fn, fallback, skip_failed, results)
+        return results
+
+    def _run_batch(self, batch, lengths, fn, fallback, skip_failed, results):
+        try:
+            outputs = fn(batch)
+        except Exception as error:
+            if not is_oom_error(error):
+                raise
+        else:
+            for index, output in zip(batch, outputs):
+                results[index] = output
+            self._record_batch(len(batch))
+            return
+        # 离开except块后异常（及其持有的中间张量）才会释放
+        release_memory()
+
+        if len(batch) > 1:
+            half = len(batch) // 2
+            logger.warning(f"{len(batch)} 条序列（最大长度 {lengths[batch[0]]}）的批次内存不足，"
+                           f"拆分为 {half} + {len(batch) - half} 条重试")
+            self._count(splits=1)
+            self._run_batch(batch[:half], lengths, fn, fallback, skip_failed, results)
+            self._run_batch(batch[half:], lengths, fn, fallback, skip_failed, results)
+            return
+
+        if fallback is not None:
+            logger.warning(f"长度为 {lengths[batch[0]]} 的序列内存不足，使用回退实现重试")
+            self._count(fallbacks=1)
+            try:
+                results[batch[0]] = fallback(batch)[0]
+                self._record_batch(1)
+                return
+            except Exception as error:
+                if not is_oom_error(error):
+                    raise
+            release_memory()
+
+        if not skip_failed:
+            raise MemoryError(f"长度为 {lengths[batch[0]]} 的序列单独预测仍然内存不足")
+        logger.error(f"长度为 {lengths[batch[0]]} 的序列单独预测仍然内存不足，跳过")
+        self._count(failed=1)
+
+    def log_stats(self):
+        """把批次统计写入日志"""
+        stats = self.stats()
+        logger.info(f"自适应批次: {stats['items']} 条序列分为 {stats['batches']} 个批次"
+                    f"（最大 {stats['largest_batch']} 条），内存不足拆分 {stats['splits']} 次，"
+                    f"回退 {stats['fallbacks']} 次，失败 {stats['failed']} 条")
@@ -40,6 +40,34 @@ def angle_difference_degrees(angle1, angle2):
     # 如果diff > 180.0，则diff -= 360.0
     return np.where(diff > 180.0, diff - 360.0, diff)
 
+def circular_statistics(angles, weights=None, axis=-1):
+    """
+    计算角度的加权圆形均值和平均合成向量长度
+    
+    Args:
+        angles: 角度（度），NumPy数组
+        weights: 可选的权重（如掩码或相似度），形状与angles相同
+        axis: 求均值的维度
+    
+    Returns:
+        mean: 圆形均值（度），范围[-180, 180]
+        resultant_length: 平均合成向量长度R，范围[0, 1]；圆形方差为1 - R
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    rad = np.radians(angles)
+    if weights is None:
+        weights = np.ones_like(rad)
+    weights = np.asarray(weights, dtype=np.float64)
+    
+    total = np.sum(weights, axis=axis)
+    safe_total = np.where(total > 0, total, 1.0)
+    sin_mean = np.sum(weights * np.sin(rad), axis=axis) / safe_total
+    cos_mean = np.sum(weights * np.cos(rad), axis=axis) / safe_total
+    
+    mean = np.degrees(np.arctan2(sin_mean, cos_mean))
+    resultant_length = np.where(total > 0, np.sqrt(sin_mean ** 2 + cos_mean ** 2), 0.0)
+    return mean, resultant_length
+
 def compute_circular_correlation(pred_angles, true_angles, mask=None):
     """
     计算预测角度和真实角度之间的圆形相关系数
@@ -148,4 +176,39 @@ def compute_mae_degrees(pred_angles, true_angles, mask=None):
         # 无掩码时的平均误差
         mae = np.mean(diff)
     
-    return mae
\ No newline at end of file
+    return mae
+
+def circular_mean_resultant(angles, dim=0):
+    """
+    沿指定维度计算角度张量的圆形均值和平均合成向量长度（torch版本，可在GPU上计算）
+    
+    Args:
+        angles: 角度（度），torch张量
+        dim: 求均值的维度
+    
+    Returns:
+        mean: 圆形均值（度），范围[-180, 180]
+        resultant_length: 平均合成向量长度R，范围[0, 1]；圆形方差为1 - R
+    """
+    rad = torch.deg2rad(angles)
+    sin_mean = torch.sin(rad).mean(dim=dim)
+    cos_mean = torch.cos(rad).mean(dim=dim)
+    mean = torch.rad2deg(torch.atan2(sin_mean, cos_mean))
+    resultant_length = torch.sqrt(sin_mean ** 2 + cos_mean ** 2).clamp(max=1.0)
+    return mean, resultant_length
+
+def von_mises_concentration(resultant_length):
+    """
+    由平均合成向量长度R估计von Mises分布的集中度kappa（Best & Fisher的分段近似）
+    
+    Args:
+        resultant_length: R，torch张量，范围[0, 1]
+    
+    Returns:
+        kappa: 集中度，越大表示越确定；R接近1时截断为有限值
+    """
+    r = resultant_length.clamp(0.0, 1.0 - 1e-6)
+    low = 2 * r + r ** 3 + 5 * r ** 5 / 6
+    mid = -0.4 + 1.39 * r + 0.43 / (1 - r)
+    high = 1 / (r ** 3 - 4 * r ** 2 + 3 * r)
+    return torch.where(r < 0.53, low, torch.where(r < 0.85, mid, high))
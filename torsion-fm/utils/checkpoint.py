@@ -0,0 +1,164 @@
+"""
+训练状态检查点工具：原子写入、定期保存、保留最近K个以及断点续训
+"""
+
+import os
+import re
+import glob
+import time
+import random
+import logging
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+STATE_PATTERN = re.compile(r"step_(\d+)\.pt$")
+
+
+def atomic_torch_save(obj, path):
+    """
+    原子地保存对象：先写入同目录下的临时文件，刷盘后再重命名覆盖目标文件
+
+    Args:
+        obj: 需要保存的对象
+        path: 目标路径
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            torch.save(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def capture_rng_state():
+    """收集Python、NumPy和PyTorch（含CUDA）的随机数状态"""
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state):
+    """恢复capture_rng_state保存的随机数状态"""
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def find_latest_checkpoint(path):
+    """
+    查找最新的训练状态检查点
+
+    Args:
+        path: 检查点文件、训练状态目录或实验目录
+
+    Returns:
+        checkpoint_path: 最新检查点路径，找不到时返回None
+    """
+    if os.path.isfile(path):
+        return path
+
+    candidates = []
+    for directory in (path, os.path.join(path, "training_state"),
+                      os.path.join(path, "checkpoints", "training_state")):
+        candidates.extend(glob.glob(os.path.join(directory, "step_*.pt")))
+
+    steps = [(int(STATE_PATTERN.search(c).group(1)), c) for c in candidates if STATE_PATTERN.search(c)]
+    if not steps:
+        return None
+    return max(steps)[1]
+
+
+def load_training_state(path):
+    """
+    加载训练状态检查点
+
+    Args:
+        path: 检查点文件、训练状态目录或实验目录
+
+    Returns:
+        state: 训练状态字典
+        checkpoint_path: 实际加载的文件路径
+    """
+    checkpoint_path = find_latest_checkpoint(path)
+    if checkpoint_path is None:
+        raise FileNotFoundError(f"未找到可恢复的训练状态: {path}")
+    state = torch.load(checkpoint_path, map_location="cpu", weights_only=False)
+    logger.info(f"从 {checkpoint_path} 恢复训练状态: epoch {state['epoch']}, "
+                f"epoch内批次 {state['batch_in_epoch']}, 全局步数 {state['global_step']}")
+    return state, checkpoint_path
+
+
+class CheckpointManager:
+    """
+    训练状态检查点管理器
+
+    按步数或时间间隔触发保存，文件命名为step_XXXXXXXX.pt，只保留最近keep_last个。
+    """
+
+    def __init__(self, checkpoint_dir, keep_last=3, every_steps=0, every_minutes=0):
+        """
+        Args:
+            checkpoint_dir: 训练状态保存目录
+            keep_last: 保留的检查点数量
+            every_steps: 每隔多少个优化步保存一次（0表示不按步数保存）
+            every_minutes: 每隔多少分钟保存一次（0表示不按时间保存）
+        """
+        self.checkpoint_dir = checkpoint_dir
+        self.keep_last = max(1, keep_last)
+        self.every_steps = every_steps
+        self.every_minutes = every_minutes
+        self.last_save_time = time.monotonic()
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def should_save(self, global_step):
+        """判断当前步是否需要保存"""
+        if self.every_steps and global_step % self.every_steps == 0:
+            return True
+        if self.every_minutes and time.monotonic() - self.last_save_time >= self.every_minutes * 60:
+            return True
+        return False
+
+    def save(self, state, global_step):
+        """
+        保存训练状态并清理旧检查点
+
+        Args:
+            state: 训练状态字典
+            global_step: 全局步数
+
+        Returns:
+            path: 保存的文件路径
+        """
+        path = os.path.join(self.checkpoint_dir, f"step_{global_step:08d}.pt")
+        atomic_torch_save(state, path)
+        self.last_save_time = time.monotonic()
+        logger.info(f"训练状态已保存: {path}")
+        self._prune()
+        return path
+
+    def _prune(self):
+        checkpoints = sorted(
+            (int(STATE_PATTERN.search(p).group(1)), p)
+            for p in glob.glob(os.path.join(self.checkpoint_dir, "step_*.pt"))
+            if STATE_PATTERN.search(p)
+        )
+        for _, path in checkpoints[:-self.keep_last]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"删除旧检查点失败 {path}: {str(e)}")
@@ -0,0 +1,192 @@
+"""
+CPU多进程数据并行训练工具（torch.distributed，gloo后端）
+
+单机时由launch()按核心组启动多个进程；多机时每台机器各运行一次launch()
+（指定nnodes/node_rank/master_addr），也可以直接使用torchrun启动。
+"""
+
+import os
+import logging
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
+
+logger = logging.getLogger(__name__)
+
+
+def is_distributed():
+    """当前是否处于已初始化的多进程环境"""
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    """只有rank 0负责写检查点、TensorBoard和测试评估"""
+    return get_rank() == 0
+
+
+def init_distributed(backend="gloo"):
+    """
+    根据环境变量（RANK、WORLD_SIZE、MASTER_ADDR、MASTER_PORT）初始化进程组
+
+    WORLD_SIZE未设置或为1时不做任何事，退化为单进程训练。
+
+    Args:
+        backend: 通信后端，CPU训练使用gloo
+
+    Returns:
+        rank: 当前进程的全局rank
+        world_size: 进程总数
+    """
+    world_size = int(os.environ.get("WORLD_SIZE", "1"))
+    if world_size <= 1 or is_distributed():
+        return get_rank(), get_world_size()
+
+    dist.init_process_group(backend=backend, init_method="env://")
+    rank = dist.get_rank()
+    logger.info(f"进程组初始化完成: rank {rank}/{world_size}, 后端 {backend}")
+    return rank, world_size
+
+
+def cleanup_distributed():
+    """销毁进程组"""
+    if is_distributed():
+        dist.destroy_process_group()
+
+
+def barrier():
+    if is_distributed():
+        dist.barrier()
+
+
+def bind_core_group(local_rank, nproc_per_node):
+    """
+    将当前进程绑定到一组连续的CPU核心，并据此设置intra-op线程数
+
+    可用核心按编号平均分成nproc_per_node组（通常一组对应一个socket或一个核心组），
+    避免多个rank的线程池互相争抢同一批核心。
+
+    Args:
+        local_rank: 本机内的rank
+        nproc_per_node: 本机进程数
+
+    Returns:
+        cores: 绑定的核心列表
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return []
+    cores = sorted(os.sched_getaffinity(0))
+    group_size = max(1, len(cores) // nproc_per_node)
+    group = cores[local_rank * group_size:(local_rank + 1) * group_size] or cores
+    os.sched_setaffinity(0, group)
+    torch.set_num_threads(len(group))
+    return group
+
+
+def broadcast_parameters(modules, src=0):
+    """将src上的参数广播到所有rank，保证各副本从相同的权重开始"""
+    if not is_distributed():
+        return
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            dist.broadcast(tensor.data, src=src)
+
+
+def all_reduce_gradients(parameters):
+    """
+    对梯度求所有rank的平均（把所有梯度拼成一个缓冲区，只做一次all-reduce）
+
+    Args:
+        parameters: 需要同步的参数（特征提取器和回归头）
+    """
+    world_size = get_world_size()
+    if world_size == 1:
+        return
+    params = [p for p in parameters if p.requires_grad]
+    for p in params:
+        if p.grad is None:
+            p.grad = torch.zeros_like(p)
+    grads = [p.grad.data for p in params]
+    flat = _flatten_dense_tensors(grads)
+    dist.all_reduce(flat, op=dist.ReduceOp.SUM)
+    flat /= world_size
+    for grad, synced in zip(grads, _unflatten_dense_tensors(flat, grads)):
+        grad.copy_(synced)
+
+
+def all_reduce_sums(values):
+    """
+    对一组标量求所有rank的和（用于聚合验证损失和批次数）
+
+    Args:
+        values: 浮点数列表
+
+    Returns:
+        sums: 求和后的浮点数列表
+    """
+    if not is_distributed():
+        return list(values)
+    tensor = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor.tolist()
+
+
+def broadcast_object(obj, src=0):
+    """从src广播任意可pickle的对象"""
+    if not is_distributed():
+        return obj
+    container = [obj]
+    dist.broadcast_object_list(container, src=src)
+    return container[0]
+
+
+def all_gather_object(obj):
+    """收集所有rank上的对象，返回按rank排列的列表"""
+    if not is_distributed():
+        return [obj]
+    gathered = [None] * get_world_size()
+    dist.all_gather_object(gathered, obj)
+    return gathered
+
+
+def _worker_entry(local_rank, worker, worker_args, nproc_per_node, nnodes, node_rank, master_addr, master_port):
+    """spawn出的子进程入口：设置torch.distributed需要的环境变量后调用worker"""
+    os.environ["MASTER_ADDR"] = master_addr
+    os.environ["MASTER_PORT"] = str(master_port)
+    os.environ["WORLD_SIZE"] = str(nproc_per_node * nnodes)
+    os.environ["RANK"] = str(node_rank * nproc_per_node + local_rank)
+    os.environ["LOCAL_RANK"] = str(local_rank)
+    os.environ["LOCAL_WORLD_SIZE"] = str(nproc_per_node)
+    worker(*worker_args)
+
+
+def launch(worker, worker_args=(), nproc_per_node=1, nnodes=1, node_rank=0,
+           master_addr="127.0.0.1", master_port=29500):
+    """
+    在本机启动nproc_per_node个rank运行worker
+
+    Args:
+        worker: 每个rank执行的函数（必须可pickle，即模块级函数）
+        worker_args: 传给worker的参数
+        nproc_per_node: 本机进程数（通常等于socket数或核心组数）
+        nnodes: 机器总数
+        node_rank: 本机编号
+        master_addr: rank 0所在机器的地址
+        master_port: rank 0监听的端口
+    """
+    logger.info(f"启动分布式训练: {nnodes}台机器 x {nproc_per_node}个进程, 本机编号 {node_rank}, "
+                f"主节点 {master_addr}:{master_port}")
+    mp.spawn(
+        _worker_entry,
+        args=(worker, worker_args, nproc_per_node, nnodes, node_rank, master_addr, master_port),
+        nprocs=nproc_per_node,
+        join=True
+    )
@@ -5,15 +5,57 @@
 
 import torch
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 import os
 import logging
 from .angle_utils import compute_circular_correlation, compute_mae_degrees
+from data.prefetch import PrefetchLoader
 
 logger = logging.getLogger(__name__)
 
-def evaluate_model(model, data_loader, device, torsion_types, output_dir=None):
+def _batched_predictions(model, tokens, padding_idx, batcher):
+    """
+    把一个数据批次按batcher重新划分为子批次运行前向传播，再拼回原批次的形状
+
+    Returns:
+        predictions: 字典，键为扭转角类型，值为[batch_size, seq_len-2]（失败行为0）
+        failed: 内存不足被跳过的行号集合
+    """
+    lengths = tokens.ne(padding_idx).sum(1).tolist()
+
+    def run(indices):
+        # 子批次按自身的最大长度截断，减少填充位置的计算
+        sub_tokens = tokens[indices, :max(lengths[i] for i in indices)]
+        sub_predictions, _ = model(sub_tokens)
+        return [{angle: values[row] for angle, values in sub_predictions.items()} for row in range(len(indices))]
+
+    rows = batcher.run(lengths, run, skip_failed=True)
+    failed = {i for i, row in enumerate(rows) if row is None}
+    template = next(row for row in rows if row is not None) if len(failed) < len(rows) else {}
+    predictions = {}
+    for angle, values in template.items():
+        merged = values.new_zeros((tokens.shape[0], tokens.shape[1] - 2))
+        for i, row in enumerate(rows):
+            if row is not None:
+                merged[i, :row[angle].shape[0]] = row[angle]
+        predictions[angle] = merged
+    return predictions, failed
+
+def evaluate_model(model, data_loader, device, torsion_types, output_dir=None, batcher=None):
+    """
+    在数据集上评估模型
+    
+    Args:
+        model: 扭转角预测模型（或集成）
+        data_loader: 数据加载器
+        device: 设备
+        torsion_types: 扭转角类型列表
+        output_dir: 可选的结果输出目录
+        batcher: 可选的AdaptiveBatcher，把每个数据批次按内存预算重新划分，
+                 内存不足时拆分重试，单独仍然内存不足的序列不计入指标
+    
+    Returns:
+        metrics: 指标字典
+    """
     model.eval()
     
     # 初始化结果字典
@@ -24,26 +66,44 @@ def evaluate_model(model, data_loader, device, torsion_types, output_dir=None):
     pdb_ids = []
     chain_ids = []
     
+    # 预取包装：批次在后台线程中准备并提前送到设备上
+    batches = data_loader if isinstance(data_loader, PrefetchLoader) else PrefetchLoader(data_loader, device)
+    batches.reset_stats()
+    # 集成模型的所有成员共享第一个成员的骨干网络
+    backbone_model = model.members[0] if hasattr(model, 'members') else model
+    if hasattr(backbone_model, 'dedup_stats'):
+        backbone_model.dedup_stats(reset=True)
+    if batcher is not None:
+        batcher.reset_stats()
+    skipped = 0
+    
     with torch.no_grad():
-        for batch in data_loader:
-            tokens = batch['tokens'].to(device)
+        for batch in batches:
+            tokens = batch['tokens']
             pdb_ids.extend(batch['pdb_ids'])
             chain_ids.extend(batch['chain_ids'])
             
             # 获取预测
-            predictions, _ = model(tokens)
+            failed = set()
+            if batcher is None:
+                predictions, _ = model(tokens)
+            else:
+                predictions, failed = _batched_predictions(model, tokens, backbone_model.alphabet.padding_idx, batcher)
+                skipped += len(failed)
 
 
             # 处理每种角度类型
             for angle_name in torsion_types:
                 if angle_name in batch['angles']:
-                    angle_target = batch['angles'][angle_name].to(device)
-                    angle_mask = batch['masks'][angle_name].to(device)
+                    angle_target = batch['angles'][angle_name]
+                    angle_mask = batch['masks'][angle_name]
                     pred = predictions[angle_name]
                     
                     # 分别处理批次中的每个序列
                     batch_size = angle_target.shape[0]
                     for i in range(batch_size):
+                        if i in failed:
+                            continue
                         target_len = angle_target[i].shape[0]
                         pred_len = pred[i].shape[0]
                         min_len = min(target_len, pred_len)
@@ -54,6 +114,15 @@ def evaluate_model(model, data_loader, device, torsion_types, output_dir=None):
                         all_masks[angle_name].append(angle_mask[i, :min_len].unsqueeze(0))
                         all_seq_lens[angle_name].append(min_len)
     
+    logger.info(f"评估数据等待: {batches.data_wait_time:.2f}秒，共 {batches.num_batches} 个批次")
+    if hasattr(backbone_model, 'dedup_stats'):
+        dedup = backbone_model.dedup_stats()
+        logger.info(f"骨干网络去重: {dedup['rows']} 条序列中 {dedup['unique_rows']} 条送入RNA-FM（省去 {dedup['dedup_ratio']:.1%}）")
+    if batcher is not None:
+        batcher.log_stats()
+        if skipped:
+            logger.error(f"{skipped} 条序列单独预测仍然内存不足，未计入评估指标")
+    
     # 计算指标
     metrics = {}
 
@@ -126,6 +195,7 @@ def evaluate_model(model, data_loader, device, torsion_types, output_dir=None):
         os.makedirs(output_dir, exist_ok=True)
         
         # 保存指标
+        import pandas as pd
         metrics_df = pd.DataFrame([metrics])
         metrics_df.to_csv(os.path.join(output_dir, "metrics.csv"), index=False)
         
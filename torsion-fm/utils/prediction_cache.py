@@ -0,0 +1,245 @@
+"""
+内容寻址的预测结果缓存
+
+键由规范化序列、检查点内容哈希和影响输出的选项（骨干网络、采样次数、精度等）共同决定，
+检查点文件内容不变时，同一条序列的预测只计算一次。
+两级存储：进程内的LRU字典，以及可选的按总大小淘汰的磁盘目录（每个键一个.npz文件）。
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_file_hashes = {}
+
+
+def normalize_sequence(sequence):
+    """规范化RNA序列：去除空白，转为大写，T视为U"""
+    return "".join(sequence.split()).upper().replace("T", "U")
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """
+    计算文件内容的SHA-256（按路径、大小和修改时间缓存，同一进程内不重复读取）
+
+    Args:
+        path: 文件路径
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        digest: 十六进制哈希字符串
+    """
+    stat = os.stat(path)
+    marker = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if marker not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        _file_hashes[marker] = digest.hexdigest()
+    return _file_hashes[marker]
+
+
+def file_fingerprint(path):
+    """
+    文件的廉价指纹（绝对路径、大小和修改时间），用于标识大文件（如骨干网络权重）而不读取内容
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        fingerprint: 十六进制哈希字符串
+    """
+    stat = os.stat(path)
+    marker = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(marker.encode('utf-8')).hexdigest()
+
+
+def make_cache_key(sequence, model_id, options=None):
+    """
+    生成缓存键
+
+    Args:
+        sequence: RNA序列（会先规范化）
+        model_id: 模型标识（检查点内容哈希；集成模式为各成员哈希的组合）
+        options: 影响输出的其他选项字典
+
+    Returns:
+        key: 十六进制哈希字符串
+    """
+    payload = json.dumps({
+        'sequence': normalize_sequence(sequence),
+        'model': model_id,
+        'options': options or {},
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def model_cache_key(model, sequence, head=None, mc_samples=0, **options):
+    """
+    为模型和序列生成缓存键
+
+    模型需要带有model_id属性（由scripts.predict.load_model()按检查点内容设置），
+    骨干网络名称、骨干网络权重的标识、参数精度和mc_samples总是加入选项，单条预测、批量预测和服务使用同一个键。
+
+    Args:
+        model: RNATorsionPredictor或TorsionEnsemble
+        sequence: RNA序列
+        head: 可选的预测头快照（RNATorsionPredictor.get_head()），使用其model_id代替模型的
+        mc_samples: Monte-Carlo dropout采样次数（0表示普通预测）
+        **options: 其他影响输出的选项
+
+    Returns:
+        key: 缓存键；模型（或预测头）没有model_id时为None（不使用缓存）
+    """
+    model_id = head.model_id if head is not None else getattr(model, 'model_id', None)
+    if model_id is None:
+        return None
+    options['mc_samples'] = mc_samples
+    options['backbone'] = getattr(model.rna_fm, 'backbone_name', "rna_fm_t12")
+    # 同名骨干网络可能从不同的权重文件加载（--backbone_path），权重标识见models.backbones.load_backbone
+    options['backbone_weights'] = getattr(model.rna_fm, 'backbone_weights', None)
+    options['dtype'] = str(next(model.parameters()).dtype)
+    return make_cache_key(sequence, model_id, options)
+
+
+class PredictionCache:
+    """
+    两级预测缓存
+
+    值为{名称: numpy数组}字典（例如每种扭转角的逐残基预测和不确定度）。
+    所有方法都是线程安全的，可以在服务端的多个请求之间共享。
+    """
+
+    def __init__(self, memory_items=1024, disk_dir=None, disk_max_bytes=1 << 30):
+        """
+        Args:
+            memory_items: 内存LRU中最多保留的条目数（0表示不使用内存层）
+            disk_dir: 磁盘缓存目录（None表示不使用磁盘层）
+            disk_max_bytes: 磁盘缓存的总大小上限，超出时按最近访问时间淘汰
+        """
+        self.memory_items = memory_items
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._disk_entries = OrderedDict()  # 键 -> 文件大小，按访问顺序排列
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def _scan_disk(self):
+        """启动时按修改时间恢复磁盘条目的访问顺序"""
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith('.npz'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+        if entries:
+            logger.info(f"预测缓存目录 {self.disk_dir} 中有 {len(entries)} 个条目（{self._disk_bytes / 1024 ** 2:.1f} MB）")
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.npz")
+
+    def _remember(self, key, value):
+        if self.memory_items <= 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        查询缓存
+
+        Returns:
+            value: 命中时为数组字典，否则为None
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+
+            if self.disk_dir and key in self._disk_entries:
+                path = self._disk_path(key)
+                try:
+                    with np.load(path, allow_pickle=False) as data:
+                        value = {name: data[name] for name in data.files}
+                    os.utime(path)
+                    self._disk_entries.move_to_end(key)
+                    self.disk_hits += 1
+                    self._remember(key, value)
+                    return value
+                except (OSError, ValueError) as e:
+                    logger.warning(f"读取预测缓存失败 {path}: {str(e)}")
+                    self._disk_bytes -= self._disk_entries.pop(key)
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """
+        写入缓存
+
+        Args:
+            key: make_cache_key()生成的键
+            value: {名称: numpy数组}字典
+        """
+        with self._lock:
+            self._remember(key, value)
+            if not self.disk_dir or key in self._disk_entries:
+                return
+
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **value)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk_entries) > 1:
+                old_key, old_size = self._disk_entries.popitem(last=False)
+                try:
+                    os.remove(self._disk_path(old_key))
+                except FileNotFoundError:
+                    pass
+                self._disk_bytes -= old_size
+                self.evictions += 1
+
+    def stats(self):
+        """返回命中/未命中计数和各层的占用情况"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_entries': len(self._disk_entries),
+                'disk_bytes': self._disk_bytes,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,240 @@
+"""
+逐残基预测结果的列式组装和流式写出
+
+每种扭转角的预测只从设备拷贝一次（整条序列一个数组），逐残基的列用数组运算拼出，
+再交给按格式实现的写出器。批量模式下所有结构追加写入同一个文件，不在内存中累积结果。
+"""
+
+import os
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ("csv", "json", "jsonl", "parquet")
+BULK_FORMATS = ("csv", "jsonl", "parquet")
+
+# 预测值来自float32，15位精度足以无损还原
+JSON_DOUBLE_PRECISION = 15
+
+
+def _fit(values, n):
+    """将数组截断或用NaN补齐到长度n（缺失值在CSV中为空，在JSON中为null）"""
+    out = np.full(n, np.nan)
+    if values is not None:
+        m = min(n, len(values))
+        out[:m] = values[:m]
+    return out
+
+
+def prediction_columns(result, arrays, torsion_types):
+    """
+    组装单个结构的逐残基结果列
+
+    Args:
+        result: process_pdb_file/process_structure_file返回的结构字典
+        arrays: scripts.predict.predict_sequence()返回的数组字典
+        torsion_types: 扭转角类型列表
+
+    Returns:
+        columns: 字典，键为列名（residue_id, residue, <扭转角>_pred, <扭转角>_<不确定度>, <扭转角>_true），
+                 值为长度等于序列长度的NumPy数组
+    """
+    sequence = result['sequence']
+    n = len(sequence)
+
+    residue_ids = list(result['sorted_residue_ids'][:n])
+    residue_ids.extend(range(len(residue_ids) + 1, n + 1))
+    columns = {
+        'residue_id': np.array(residue_ids, dtype=object),
+        'residue': np.array(list(sequence), dtype=object),
+    }
+
+    extra_names = [name for name in arrays if name not in torsion_types]
+    for angle_name in torsion_types:
+        columns[f"{angle_name}_pred"] = _fit(arrays.get(angle_name), n)
+        for name in extra_names:
+            if name.startswith(f"{angle_name}_"):
+                columns[name] = _fit(arrays[name], n)
+
+    # 如果有真实值，也添加（掩码为0的位置记为缺失）
+    if 'torsion_angles' in result:
+        for angle_name in torsion_types:
+            values = np.full(n, np.nan)
+            if angle_name in result['torsion_angles']:
+                angles = np.asarray(result['torsion_angles'][angle_name], dtype=np.float64)
+                masks = np.asarray(result['torsion_masks'][angle_name])
+                m = min(n, len(angles))
+                values[:m] = np.where(masks[:m] > 0, angles[:m], np.nan)
+            columns[f"{angle_name}_true"] = values
+
+    return columns
+
+
+class PredictionWriter:
+    """
+    写出器基类
+
+    第一次写入时确定列顺序，之后的结构按相同的列对齐（缺少的列记为缺失），
+    保证追加写入的文件结构一致。
+    """
+
+    extension = None
+
+    def __init__(self, path, bulk=False):
+        """
+        Args:
+            path: 输出文件路径
+            bulk: 批量模式（所有结构写入同一文件，增加pdb_id列）
+        """
+        self.path = path
+        self.bulk = bulk
+        self.columns = None
+        self.rows = 0
+
+    def _frame(self, pdb_id, columns):
+        import pandas as pd
+        df = pd.DataFrame(columns)
+        if self.bulk:
+            df.insert(0, 'pdb_id', pdb_id)
+        if self.columns is None:
+            self.columns = list(df.columns)
+        elif list(df.columns) != self.columns:
+            df = df.reindex(columns=self.columns)
+        return df
+
+    def write(self, pdb_id, sequence, columns):
+        """
+        写入一个结构的结果
+
+        Args:
+            pdb_id: 结构标识
+            sequence: RNA序列
+            columns: prediction_columns()返回的列字典
+        """
+        df = self._frame(pdb_id, columns)
+        self._write_frame(pdb_id, sequence, df)
+        self.rows += len(df)
+
+    def _write_frame(self, pdb_id, sequence, df):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CSVPredictionWriter(PredictionWriter):
+    """CSV写出器（每次追加一个结构的所有行）"""
+
+    extension = "csv"
+
+    def __init__(self, path, bulk=False):
+        super(CSVPredictionWriter, self).__init__(path, bulk)
+        self._file = open(path, 'w', newline='')
+
+    def _write_frame(self, pdb_id, sequence, df):
+        df.to_csv(self._file, index=False, header=self.rows == 0)
+
+    def close(self):
+        self._file.close()
+
+
+class JSONLPredictionWriter(PredictionWriter):
+    """JSON Lines写出器（每个残基一行）"""
+
+    extension = "jsonl"
+
+    def __init__(self, path, bulk=False):
+        super(JSONLPredictionWriter, self).__init__(path, bulk)
+        self._file = open(path, 'w')
+
+    def _write_frame(self, pdb_id, sequence, df):
+        if len(df):
+            self._file.write(df.to_json(orient='records', lines=True, double_precision=JSON_DOUBLE_PRECISION))
+            self._file.write("\n")
+
+    def close(self):
+        self._file.close()
+
+
+class JSONPredictionWriter(PredictionWriter):
+    """单结构JSON文档写出器（{'pdb_id', 'sequence', 'predictions': [逐残基记录]}）"""
+
+    extension = "json"
+
+    def __init__(self, path, bulk=False):
+        if bulk:
+            raise ValueError("JSON格式只能按结构分别输出，批量模式请使用jsonl")
+        super(JSONPredictionWriter, self).__init__(path, bulk)
+
+    def _write_frame(self, pdb_id, sequence, df):
+        if self.rows:
+            raise ValueError("JSON写出器只能写入一个结构")
+        records = df.to_json(orient='records', double_precision=JSON_DOUBLE_PRECISION)
+        with open(self.path, 'w') as f:
+            f.write(f'{{"pdb_id": {json.dumps(pdb_id)}, "sequence": {json.dumps(sequence)}, "predictions": ')
+            f.write(records)
+            f.write("}")
+
+
+class ParquetPredictionWriter(PredictionWriter):
+    """Parquet写出器（每个结构写一个行组，需要安装pyarrow）"""
+
+    extension = "parquet"
+
+    def __init__(self, path, bulk=False):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet输出需要安装pyarrow: pip install pyarrow")
+        super(ParquetPredictionWriter, self).__init__(path, bulk)
+        self._pa = pa
+        self._pq = pq
+        self._writer = None
+
+    def _write_frame(self, pdb_id, sequence, df):
+        # 残基编号可能是整数或带插入码的字符串，统一为字符串保证各行组的类型一致
+        df = df.assign(residue_id=df['residue_id'].astype(str))
+        if self._writer is None:
+            table = self._pa.Table.from_pandas(df, preserve_index=False)
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = self._pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+WRITERS = {
+    writer.extension: writer
+    for writer in (CSVPredictionWriter, JSONPredictionWriter, JSONLPredictionWriter, ParquetPredictionWriter)
+}
+
+
+def open_writer(output_format, path, bulk=False):
+    """
+    按格式创建写出器
+
+    Args:
+        output_format: OUTPUT_FORMATS之一
+        path: 输出文件路径
+        bulk: 批量模式
+
+    Returns:
+        writer: PredictionWriter
+    """
+    if output_format not in WRITERS:
+        raise ValueError(f"未知的输出格式: {output_format}，可选: {', '.join(OUTPUT_FORMATS)}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return WRITERS[output_format](path, bulk)
@@ -0,0 +1,124 @@
+"""
+按需torch.profiler采集
+
+在训练或预测中截取有限的若干步，输出Chrome trace、TensorBoard profiler数据、
+火焰图格式的调用栈以及按self time排序的算子汇总表。
+"""
+
+import os
+import time
+import socket
+import shutil
+import logging
+import torch
+from torch.profiler import profile, schedule, ProfilerActivity
+
+logger = logging.getLogger(__name__)
+
+
+def _verbose_experimental_config():
+    """
+    构造verbose模式的profiler实验配置（export_stacks需要verbose模式才会保留Python调用栈）
+
+    _ExperimentalConfig是torch的私有接口，当前版本没有或不支持verbose参数时退回None，
+    只依赖with_stack=True（此时stacks.txt可能为空）
+
+    Returns:
+        config: _ExperimentalConfig或None
+    """
+    config_cls = getattr(getattr(torch._C, '_profiler', None), '_ExperimentalConfig', None)
+    if config_cls is None:
+        return None
+    try:
+        return config_cls(verbose=True)
+    except TypeError:
+        return None
+
+
+class ProfilerSession:
+    """
+    有限窗口的profiler会话
+
+    按wait/warmup/active的调度只采集一次：跳过wait步，预热warmup步，记录active步。
+    enabled为False时所有方法都是空操作，调用方无需分支。
+    """
+
+    def __init__(self, output_dir, enabled=True, wait=1, warmup=1, active=3, row_limit=30):
+        """
+        Args:
+            output_dir: 输出目录
+            enabled: 是否启用
+            wait: 开始前跳过的步数
+            warmup: 预热步数（不计入结果）
+            active: 记录的步数
+            row_limit: 汇总表的行数
+        """
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.row_limit = row_limit
+        self.profiler = None
+        self.finished = False
+        if not enabled:
+            return
+
+        os.makedirs(output_dir, exist_ok=True)
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        self.profiler = profile(
+            activities=activities,
+            schedule=schedule(wait=wait, warmup=warmup, active=active, repeat=1),
+            on_trace_ready=self._on_trace_ready,
+            record_shapes=True,
+            profile_memory=True,
+            with_stack=True,
+            experimental_config=_verbose_experimental_config()
+        )
+
+    def _on_trace_ready(self, prof):
+        """导出各种格式的采集结果"""
+        # kineto的trace只能导出一次，TensorBoard插件读取的是同样的文件，按其命名规则复制一份
+        trace_path = os.path.join(self.output_dir, "trace.json")
+        prof.export_chrome_trace(trace_path)
+        tensorboard_dir = os.path.join(self.output_dir, "tensorboard")
+        os.makedirs(tensorboard_dir, exist_ok=True)
+        worker_name = f"{socket.gethostname()}_{os.getpid()}"
+        shutil.copyfile(trace_path, os.path.join(tensorboard_dir, f"{worker_name}.{int(time.time() * 1000)}.pt.trace.json"))
+
+        sort_key = "self_cuda_time_total" if torch.cuda.is_available() else "self_cpu_time_total"
+        prof.export_stacks(os.path.join(self.output_dir, "stacks.txt"), sort_key)
+
+        summary = prof.key_averages().table(sort_by=sort_key, row_limit=self.row_limit)
+        memory = prof.key_averages().table(sort_by="self_cpu_memory_usage", row_limit=self.row_limit)
+        summary_path = os.path.join(self.output_dir, "top_operators.txt")
+        with open(summary_path, 'w') as f:
+            f.write(f"按{sort_key}排序的前{self.row_limit}个算子\n")
+            f.write(summary)
+            f.write(f"\n\n按self_cpu_memory_usage排序的前{self.row_limit}个算子\n")
+            f.write(memory)
+
+        self.finished = True
+        logger.info(f"性能分析结果已保存到: {self.output_dir}（trace.json、tensorboard/、stacks.txt、top_operators.txt）")
+        logger.info(f"耗时最多的算子:\n{summary}")
+
+    def start(self):
+        if self.profiler is not None:
+            self.profiler.start()
+        return self
+
+    def step(self):
+        """每个训练步或预测批次结束时调用"""
+        if self.profiler is not None and not self.finished:
+            self.profiler.step()
+
+    def stop(self):
+        """结束采集（采集窗口未满时导出已记录的部分）"""
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
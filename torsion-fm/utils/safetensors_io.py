@@ -0,0 +1,144 @@
+"""
+safetensors格式读写
+
+文件布局（与safetensors库兼容）:
+    [头长度N(8字节小端)][JSON头(N字节)][张量数据]
+
+JSON头记录每个张量的dtype、shape和数据区内的[起始, 结束)偏移，
+以及"__metadata__"中的字符串键值对（扭转角类型、隐藏层维度、格式版本等）。
+读取时以私有映射（写时复制）mmap整个文件，张量直接指向映射的页面而不拷贝：
+同一主机上的多个进程加载同一文件时共享页缓存，只读的骨干网络参数不会占用各进程的私有内存。
+"""
+
+import os
+import mmap
+import json
+import struct
+import logging
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+SAFETENSORS_EXTENSION = ".safetensors"
+
+_HEADER_SIZE = struct.Struct("<Q")
+
+_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+_DTYPE_NAMES = {dtype: name for name, dtype in _DTYPES.items()}
+
+
+def is_safetensors(path):
+    """按扩展名判断是否为safetensors文件"""
+    return str(path).endswith(SAFETENSORS_EXTENSION)
+
+
+def save_safetensors(tensors, path, metadata=None):
+    """
+    保存张量字典（先写临时文件再重命名）
+
+    Args:
+        tensors: {名称: 张量}字典，张量会被移到CPU并转为连续布局
+        path: 输出文件路径
+        metadata: 可选的{字符串: 字符串}元数据，写入头部的"__metadata__"
+    """
+    tensors = {name: tensor.detach().cpu().contiguous() for name, tensor in tensors.items()}
+    # 按元素大小从大到小排列，各张量的起始偏移自然满足对齐要求，读取时可以直接建立视图
+    names = sorted(tensors, key=lambda name: (-tensors[name].element_size(), name))
+
+    header = {}
+    if metadata:
+        header["__metadata__"] = {str(k): str(v) for k, v in metadata.items()}
+    offset = 0
+    for name in names:
+        tensor = tensors[name]
+        if tensor.dtype not in _DTYPE_NAMES:
+            raise ValueError(f"safetensors不支持的数据类型: {name} {tensor.dtype}")
+        nbytes = tensor.numel() * tensor.element_size()
+        header[name] = {
+            'dtype': _DTYPE_NAMES[tensor.dtype],
+            'shape': list(tensor.shape),
+            'data_offsets': [offset, offset + nbytes],
+        }
+        offset += nbytes
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode('utf-8')
+    # 头部补空格到8字节对齐
+    header_bytes += b" " * (-len(header_bytes) % 8)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER_SIZE.pack(len(header_bytes)))
+        f.write(header_bytes)
+        for name in names:
+            tensor = tensors[name]
+            if tensor.numel():
+                f.write(tensor.view(-1).view(torch.uint8).numpy().tobytes())
+    os.replace(tmp_path, path)
+
+
+def _read_header(f):
+    size_bytes = f.read(_HEADER_SIZE.size)
+    if len(size_bytes) != _HEADER_SIZE.size:
+        raise ValueError("不是有效的safetensors文件：文件过短")
+    (header_size,) = _HEADER_SIZE.unpack(size_bytes)
+    header = json.loads(f.read(header_size))
+    metadata = header.pop("__metadata__", {}) or {}
+    return header, metadata, _HEADER_SIZE.size + header_size
+
+
+def read_safetensors_metadata(path):
+    """
+    只读取头部的元数据（不映射张量数据）
+
+    Returns:
+        metadata: {字符串: 字符串}字典
+    """
+    with open(path, 'rb') as f:
+        _, metadata, _ = _read_header(f)
+    return metadata
+
+
+def load_safetensors(path, use_mmap=True):
+    """
+    加载safetensors文件
+
+    Args:
+        path: 文件路径
+        use_mmap: 是否以mmap方式零拷贝加载（否则一次性读入内存）
+
+    Returns:
+        tensors: {名称: CPU张量}字典
+        metadata: {字符串: 字符串}字典
+    """
+    with open(path, 'rb') as f:
+        header, metadata, data_start = _read_header(f)
+        if use_mmap and os.fstat(f.fileno()).st_size > data_start:
+            # ACCESS_COPY：页面与页缓存共享，只有被写入的页面才会复制到进程私有内存
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        else:
+            f.seek(0)
+            buffer = bytearray(f.read())
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = _DTYPES[info['dtype']]
+        begin, end = info['data_offsets']
+        shape = info['shape']
+        if end == begin:
+            tensors[name] = torch.empty(shape, dtype=dtype)
+            continue
+        count = (end - begin) // torch.empty((), dtype=dtype).element_size()
+        tensors[name] = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + begin).view(shape)
+    return tensors, metadata
@@ -0,0 +1,161 @@
+"""
+训练吞吐量与分阶段耗时遥测
+
+每个优化步记录数据等待、H2D拷贝、骨干网络、回归头、损失、反向传播、优化器各阶段的耗时，
+以及samples/s、residues/s、填充比例、骨干网络去重比例和峰值常驻内存，写入TensorBoard和JSONL文件。
+"""
+
+import os
+import json
+import time
+import resource
+import logging
+from contextlib import contextmanager
+import torch
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("data_wait", "h2d", "backbone", "head", "loss", "backward", "optimizer")
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB），Linux上ru_maxrss的单位是KB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def batch_shape_stats(batch):
+    """
+    根据批次中的原始序列统计样本数、残基数和填充位置数（不访问设备上的张量）
+
+    Returns:
+        num_samples: 序列数
+        num_residues: 真实残基数
+        num_positions: 填充后的残基位置数
+    """
+    lengths = [len(seq) for seq in batch['sequences']]
+    if not lengths:
+        return 0, 0, 0
+    return len(lengths), sum(lengths), len(lengths) * max(lengths)
+
+
+class StepTelemetry:
+    """
+    逐步遥测记录器
+
+    enabled为False时所有方法都是空操作；every_steps大于1时只对部分步计时，
+    未采样的步不做CUDA同步，开销可以忽略。
+    """
+
+    def __init__(self, output_path, writer=None, enabled=True, every_steps=1, device=None):
+        """
+        Args:
+            output_path: JSONL输出文件路径
+            writer: 可选的SummaryWriter
+            enabled: 是否启用
+            every_steps: 每隔多少步采样一次
+            device: 训练设备，GPU上计时前需要同步
+        """
+        self.enabled = enabled
+        self.writer = writer
+        self.every_steps = max(1, every_steps)
+        self.sync = device is not None and torch.device(device).type == 'cuda'
+        self.file = None
+        if enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            self.file = open(output_path, 'a')
+        self.sampling = False
+        self._reset_step()
+
+    def _reset_step(self):
+        self.timings = {stage: 0.0 for stage in STAGES}
+        self.samples = 0
+        self.residues = 0
+        self.positions = 0
+        self.backbone_rows = 0
+        self.backbone_unique_rows = 0
+        self.step_start = time.perf_counter()
+
+    def _synchronize(self):
+        if self.sync:
+            torch.cuda.synchronize()
+
+    def begin_step(self, global_step):
+        """开始一个优化步（global_step为本步完成后的步数）"""
+        self.sampling = self.enabled and global_step % self.every_steps == 0
+        if self.sampling:
+            self._synchronize()
+            self._reset_step()
+
+    @contextmanager
+    def stage(self, name):
+        """记录一个阶段的耗时（同一步内多次进入时累加，例如梯度累积的多个微批次）"""
+        if not self.sampling:
+            yield
+            return
+        self._synchronize()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._synchronize()
+            self.timings[name] += time.perf_counter() - start
+
+    def add_time(self, name, seconds):
+        """累加在别处测得的耗时（数据等待、H2D拷贝由PrefetchLoader统计）"""
+        if self.sampling:
+            self.timings[name] += seconds
+
+    def add_batch(self, batch):
+        """累加本步处理的批次规模"""
+        if self.sampling:
+            samples, residues, positions = batch_shape_stats(batch)
+            self.samples += samples
+            self.residues += residues
+            self.positions += positions
+
+    def add_backbone_rows(self, rows, unique_rows):
+        """累加送入骨干网络前后的行数（批次内重复序列去重）"""
+        if self.sampling:
+            self.backbone_rows += rows
+            self.backbone_unique_rows += unique_rows
+
+    def end_step(self, global_step, epoch, loss=None):
+        """结束一个优化步，写出记录"""
+        if not self.sampling:
+            return None
+        self._synchronize()
+        # 数据等待发生在计时起点之前（窗口组装阶段），计入步时长
+        step_time = time.perf_counter() - self.step_start + self.timings['data_wait']
+        record = {
+            'step': global_step,
+            'epoch': epoch,
+            'time': time.time(),
+            'step_time': step_time,
+            **{f"{stage}_time": value for stage, value in self.timings.items()},
+            'samples': self.samples,
+            'residues': self.residues,
+            'samples_per_sec': self.samples / step_time if step_time > 0 else 0.0,
+            'residues_per_sec': self.residues / step_time if step_time > 0 else 0.0,
+            'padding_ratio': 1.0 - self.residues / self.positions if self.positions else 0.0,
+            'dedup_ratio': 1.0 - self.backbone_unique_rows / self.backbone_rows if self.backbone_rows else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        if self.sync:
+            record['peak_device_memory_mb'] = torch.cuda.max_memory_allocated() / (1024 ** 2)
+        if loss is not None:
+            record['loss'] = loss
+
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        if self.writer is not None:
+            for stage in STAGES:
+                self.writer.add_scalar(f"Telemetry/{stage}_time", record[f"{stage}_time"], global_step)
+            for key in ('step_time', 'samples_per_sec', 'residues_per_sec', 'padding_ratio', 'dedup_ratio', 'peak_rss_mb'):
+                self.writer.add_scalar(f"Telemetry/{key}", record[key], global_step)
+        self.sampling = False
+        return record
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None